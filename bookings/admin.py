@@ -1,7 +1,109 @@
 from django.contrib import admin
-from .models import Booking, Payment, TransactionLog
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
 
-# Register your models here.
-admin.site.register(Booking)
-admin.site.register(Payment)
-admin.site.register(TransactionLog)
\ No newline at end of file
+from kuriftu_backend.changelists import LargeTableAdmin, prefix_search
+from .models import Booking, Payment, PricingRule, TransactionLog
+from .sharding import db_for_location, db_for_pk
+
+
+class ResortFilter(admin.SimpleListFilter):
+    title = "resort"
+    parameter_name = "resort"
+    location_path = "location"
+
+    def lookups(self, request, model_admin):
+        return Booking.LOCATION_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.location_path: self.value()})
+        return queryset
+
+
+class BookingResortFilter(ResortFilter):
+    location_path = "booking__location"
+
+
+class ResortAdmin(LargeTableAdmin):
+    """
+    Admin for tables split into per-resort databases. Changelists read one
+    resort's database at a time (the default resort unless one is picked
+    in the filter); change pages go to the database owning the object id.
+    Guests stay in the default database, so from a resort database they
+    are prefetched rather than joined, and searched by email separately.
+    """
+    user_path = "user"
+
+    def _db(self, request):
+        object_id = request.resolver_match.kwargs.get("object_id") if request.resolver_match else None
+        if object_id and object_id.isdigit():
+            return db_for_pk(object_id)
+        return db_for_location(request.GET.get(ResortFilter.parameter_name, Booking.DEFAULT_LOCATION))
+
+    def get_queryset(self, request):
+        db = self._db(request)
+        queryset = super().get_queryset(request).using(db)
+        return queryset if db == DEFAULT_DB_ALIAS else queryset.prefetch_related(self.user_path)
+
+    def get_list_select_related(self, request):
+        if self._db(request) == DEFAULT_DB_ALIAS:
+            return super().get_list_select_related(request)
+        return ()
+
+    def get_search_fields(self, request):
+        fields = super().get_search_fields(request)
+        if self._db(request) == DEFAULT_DB_ALIAS:
+            return fields
+        return [path for path in fields if not path.startswith(f"{self.user_path}__")]
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        term = search_term.strip()
+        if self._db(request) == DEFAULT_DB_ALIAS or not term:
+            return results, may_have_duplicates
+        user_ids = get_user_model().objects.filter(
+            Q(email=term) | prefix_search("email", term)
+        ).values_list("id", flat=True)[:1000]
+        return results | queryset.filter(**{f"{self.user_path}_id__in": list(user_ids)}), may_have_duplicates
+
+
+@admin.register(Booking)
+class BookingAdmin(ResortAdmin):
+    list_display = ("id", "user", "location", "service_type", "date", "time", "guests", "status", "created_at")
+    list_filter = (ResortFilter, "status", "service_type")
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+    date_hierarchy = "date"
+    search_fields = ("id", "user__email")
+
+
+@admin.register(Payment)
+class PaymentAdmin(ResortAdmin):
+    list_display = ("id", "booking", "amount", "payment_method", "status", "paid_at", "tx_ref")
+    list_filter = (BookingResortFilter, "status", "payment_method")
+    user_path = "booking__user"
+    list_select_related = ("booking__user",)
+    raw_id_fields = ("booking",)
+    date_hierarchy = "paid_at"
+    search_fields = ("tx_ref", "booking__id", "booking__user__email")
+
+
+@admin.register(TransactionLog)
+class TransactionLogAdmin(ResortAdmin):
+    list_display = ("id", "user", "location", "event", "amount", "timestamp")
+    list_filter = (ResortFilter,)
+    list_select_related = ("user",)
+    autocomplete_fields = ("user",)
+    date_hierarchy = "timestamp"
+    search_fields = ("id", "user__email")
+
+
+@admin.register(PricingRule)
+class PricingRuleAdmin(admin.ModelAdmin):
+    list_display = ("name", "kind", "service_type", "tier", "priority", "is_active", "updated_at")
+    list_filter = ("kind", "service_type", "is_active")
+    list_select_related = ("tier",)
+    search_fields = ("name",)
+    readonly_fields = ("updated_at",)
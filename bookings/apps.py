@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class BookingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookings'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_migrate, pre_delete
+
+        from . import availability, sharding
+        from .models import Booking
+
+        post_migrate.connect(sharding.reserve_id_blocks, sender=self, dispatch_uid="reserve_id_blocks")
+        pre_delete.connect(sharding.delete_user_shards, sender=get_user_model(), dispatch_uid="delete_user_shards")
+        pre_delete.connect(availability.booking_deleting, sender=Booking, dispatch_uid="availability_booking_deleting")
+        post_delete.connect(availability.booking_deleted, sender=Booking, dispatch_uid="availability_booking_deleted")
@@ -0,0 +1,170 @@
+from collections import Counter, namedtuple
+from datetime import date
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Booking, SlotAvailability
+from .sharding import derived_write, fan_out
+
+# Guests each service can take per time slot; override with BOOKING_SLOT_CAPACITY
+DEFAULT_SLOT_CAPACITY = {"ROOM": 40, "SPA": 8, "RESTAURANT": 60, "EVENT": 200}
+
+MonthCalendar = namedtuple("MonthCalendar", ["service_type", "month", "capacity", "days"])
+
+
+def slot_capacity(service_type):
+    capacity = {**DEFAULT_SLOT_CAPACITY, **getattr(settings, "BOOKING_SLOT_CAPACITY", {})}
+    return capacity[service_type]
+
+
+def _bump(service_type, day, slot_time, bookings, guests):
+    counts = SlotAvailability.objects.filter(service_type=service_type, date=day, time=slot_time)
+    if counts.update(bookings=F("bookings") + bookings, guests=F("guests") + guests):
+        return
+    try:
+        with transaction.atomic():
+            SlotAvailability.objects.create(
+                service_type=service_type, date=day, time=slot_time, bookings=bookings, guests=guests,
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        counts.update(bookings=F("bookings") + bookings, guests=F("guests") + guests)
+
+
+def move_slot(old, new):
+    """
+    Shift one booking between calendar slots. `old` and `new` are
+    Booking.slot_key() values; None means the booking holds no slot.
+    Each side is a single UPDATE on the slot row, so the cost does not
+    depend on how many bookings the slot already has.
+    """
+    if old == new:
+        return
+    if old is not None:
+        service_type, day, slot_time, guests = old
+        _bump(service_type, day, slot_time, -1, -guests)
+    if new is not None:
+        service_type, day, slot_time, guests = new
+        _bump(service_type, day, slot_time, 1, guests)
+
+
+def release_user_slots(user_id):
+    """
+    Give back every slot held by a user's bookings and mark them cancelled,
+    for deletions that bypass Booking.delete(). Safe to run more than once.
+    """
+    for held in fan_out(Booking.objects.filter(user_id=user_id).exclude(status="CANCELLED")):
+        with transaction.atomic(using=held.db):
+            groups = list(
+                held.values("service_type", "date", "time").annotate(bookings=Count("id"), guests=Sum("guests"))
+            )
+            held.update(status="CANCELLED")
+            derived_write(held.db, _release, groups)
+
+
+def _release(groups):
+    for group in groups:
+        _bump(group["service_type"], group["date"], group["time"], -group["bookings"], -group["guests"])
+
+
+def booking_deleting(sender, instance, **kwargs):
+    """pre_delete on Booking: note the slot the stored row holds before it is gone."""
+    instance._load_stored_slot()
+
+
+def booking_deleted(sender, instance, using, **kwargs):
+    """
+    post_delete on Booking: give back its slot. Covers Booking.delete(),
+    queryset deletes and cascades alike, since the deletion collector
+    sends the signal for every row it removes.
+    """
+    derived_write(using, move_slot, instance.__dict__.pop("_stored_slot", None), None)
+
+
+def _counted_slots():
+    """(bookings, guests) Counters per (service_type, date, time), straight from Booking."""
+    bookings, guests = Counter(), Counter()
+    for groups in fan_out(
+        Booking.objects.exclude(status="CANCELLED")
+        .values("service_type", "date", "time")
+        .annotate(bookings=Count("id"), guests=Sum("guests"))
+        .order_by()
+    ):
+        for group in groups.iterator(chunk_size=2000):
+            slot = (group["service_type"], group["date"], group["time"])
+            bookings[slot] += group["bookings"]
+            guests[slot] += group["guests"]
+    return bookings, guests
+
+
+def calendar_drift():
+    """Slots whose stored counts differ from the bookings, as {slot: ((bookings, guests) stored, counted)}."""
+    bookings, guests = _counted_slots()
+    stored = {
+        (row.service_type, row.date, row.time): (row.bookings, row.guests)
+        for row in SlotAvailability.objects.exclude(bookings=0, guests=0).iterator(chunk_size=2000)
+    }
+    return {
+        slot: (stored.get(slot, (0, 0)), (bookings[slot], guests[slot]))
+        for slot in stored.keys() | bookings.keys()
+        if stored.get(slot, (0, 0)) != (bookings[slot], guests[slot])
+    }
+
+
+def rebuild_availability():
+    """
+    Recompute the whole calendar from Booking with one GROUP BY per resort
+    database. Bookings written while it runs can be missed, so schedule it
+    for a quiet hour (see the rebuild_availability command).
+    """
+    bookings, guests = _counted_slots()
+    with transaction.atomic():
+        SlotAvailability.objects.all().delete()
+        rows = SlotAvailability.objects.bulk_create(
+            (
+                SlotAvailability(service_type=service_type, date=day, time=slot_time,
+                                 bookings=count, guests=guests[service_type, day, slot_time])
+                for (service_type, day, slot_time), count in bookings.items()
+            ),
+            batch_size=500,
+        )
+    return len(rows)
+
+
+def month_bounds(year, month):
+    first = date(year, month, 1)
+    after = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first, after
+
+
+def _group_days(service_type, rows):
+    capacity = slot_capacity(service_type)
+    days = []
+    for row in rows:
+        if not days or days[-1]["date"] != row["date"]:
+            days.append({"date": row["date"], "slots": []})
+        days[-1]["slots"].append({
+            "time": row["time"],
+            "bookings": row["bookings"],
+            "guests": row["guests"],
+            "open": max(0, capacity - row["guests"]),
+        })
+    return days
+
+
+async def amonth_calendar(service_type, year, month):
+    """
+    Occupied slots of one month in a single indexed range query. Slots
+    missing from the result have no bookings and are fully open.
+    """
+    first, after = month_bounds(year, month)
+    rows = (
+        SlotAvailability.objects
+        .filter(service_type=service_type, date__gte=first, date__lt=after, bookings__gt=0)
+        .order_by("date", "time")
+        .values("date", "time", "bookings", "guests")
+    )
+    days = _group_days(service_type, [row async for row in rows])
+    return MonthCalendar(service_type, f"{year:04d}-{month:02d}", slot_capacity(service_type), days)
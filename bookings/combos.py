@@ -0,0 +1,139 @@
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user.models import EngagementLog, User
+from .models import Booking, ComboWindow
+from .sharding import fan_out, merge
+
+STAY_DAYS = 3  # bookings this close together count as one stay
+COMBO_MIN_SERVICES = 3
+
+
+def observe(window, service_type, day):
+    """
+    Fold one booking into a window and report whether it completes a new combo.
+    The window keeps the booked dates of each service type that a new booking
+    could still share a stay with (see trim), so the cost does not grow with
+    the user's history, and bookings made out of date order are still seen.
+    """
+    dates = window.recent_services.setdefault(service_type, [])
+    if day.isoformat() not in dates:
+        dates.append(day.isoformat())
+        dates.sort()
+
+    in_stay = sum(
+        1 for booked in window.recent_services.values()
+        if near_stay(day, [date.fromisoformat(other) for other in booked])
+    )
+    if in_stay < COMBO_MIN_SERVICES:
+        return False
+    if window.last_combo_date and abs((day - window.last_combo_date).days) < STAY_DAYS:
+        return False  # this stay was already rewarded
+
+    window.last_combo_date = day
+    return True
+
+
+def trim(window, today=None):
+    """Drop dates no booking made from `today` on can share a stay with."""
+    horizon = ((today or timezone.localdate()) - timedelta(days=STAY_DAYS - 1)).isoformat()
+    window.recent_services = {
+        service_type: kept
+        for service_type, dates in window.recent_services.items()
+        if (kept := [booked for booked in dates if booked >= horizon])
+    }
+
+
+def near_stay(day, days):
+    """Whether `day` falls in the same stay as any of `days`."""
+    return any(abs((day - other).days) < STAY_DAYS for other in days)
+
+
+def awarded_stays(user_id):
+    """Combo awards of a user, as {log id: stay date}."""
+    logs = EngagementLog.objects.filter(user_id=user_id, action=EngagementLog.ACTION_COMBO)
+    return {
+        log_id: date.fromisoformat(metadata["stay_date"])
+        for log_id, metadata in logs.values_list("id", "metadata")
+        if (metadata or {}).get("stay_date")
+    }
+
+
+def award_combo(user_id, day, booking_id=None):
+    points = EngagementLog.get_points_for_action(EngagementLog.ACTION_COMBO)
+    EngagementLog.objects.create(
+        user_id=user_id,
+        action=EngagementLog.ACTION_COMBO,
+        metadata={"stay_date": day.isoformat(), "booking_id": booking_id},
+    )
+    User.objects.filter(pk=user_id).update(points=F("points") + points, updated_at=timezone.now())
+
+
+def revoke_combos(user_id, log_ids):
+    points = EngagementLog.get_points_for_action(EngagementLog.ACTION_COMBO)
+    deleted, _ = EngagementLog.objects.filter(pk__in=log_ids, action=EngagementLog.ACTION_COMBO).delete()
+    if deleted:
+        User.objects.filter(pk=user_id).update(points=F("points") - deleted * points, updated_at=timezone.now())
+    return deleted
+
+
+def record_booking(booking):
+    """Update the user's combo window for a new booking, awarding a combo if one is completed."""
+    with transaction.atomic():
+        window, _ = ComboWindow.objects.select_for_update().get_or_create(user_id=booking.user_id)
+        awarded = observe(window, booking.service_type, booking.date)
+        # last_combo_date only remembers one stay; out of date order another may have been rewarded
+        awarded = awarded and not near_stay(booking.date, awarded_stays(booking.user_id).values())
+        trim(window)
+        window.save(update_fields=["recent_services", "last_combo_date", "updated_at"])
+        if awarded:
+            award_combo(booking.user_id, booking.date, booking.id)
+    return awarded
+
+
+def replay(user_id, bookings):
+    """
+    Fold (booking id, service type, date) rows, in date order, into a fresh
+    window. Returns the window and the (date, booking id) of each combo.
+    """
+    window = ComboWindow(user_id=user_id, recent_services={})
+    combos = [(day, booking_id) for booking_id, service_type, day in bookings if observe(window, service_type, day)]
+    return window, combos
+
+
+def reconcile(user_id):
+    """
+    Rebuild a user's window from their live bookings after one was
+    cancelled, moved or deleted: stays that now make a combo are awarded,
+    and awards no stay supports any more are taken back. Reads the user's
+    whole booking history, so it only runs on those rarer changes.
+    """
+    bookings = Booking.objects.filter(user_id=user_id).exclude(status="CANCELLED").order_by("date", "id")
+    rows = merge(fan_out(bookings.values_list("id", "service_type", "date")), key=lambda row: (row[2], row[0]))
+    window, combos = replay(user_id, rows)
+    trim(window)
+    days = [day for day, _ in combos]
+    with transaction.atomic():
+        ComboWindow.objects.select_for_update().update_or_create(
+            user_id=user_id,
+            defaults={"recent_services": window.recent_services, "last_combo_date": window.last_combo_date},
+        )
+        awarded = awarded_stays(user_id)
+        stays = list(awarded.values())
+        for day, booking_id in combos:
+            if not near_stay(day, stays):
+                award_combo(user_id, day, booking_id)
+                stays.append(day)
+        revoke_combos(user_id, [log_id for log_id, day in awarded.items() if not near_stay(day, days)])
+
+
+def slot_changed(user_id, old, new):
+    """
+    Reconcile the user's combos when a booking stops counting or moves to
+    another service or day. `old` and `new` are Booking.slot_key() values.
+    """
+    if old is not None and (new is None or old[:2] != new[:2]):
+        reconcile(user_id)
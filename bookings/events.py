@@ -0,0 +1,154 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+# Booking and payment status changes, pushed to the event streams of the
+# booking's owner (GET /api/booking/events/) instead of clients polling
+# get_booking. Each open stream is one asyncio queue on the serving event
+# loop; publishers mostly run in sync_to_async worker threads, so delivery
+# hops onto that loop with call_soon_threadsafe. The broker lives in the
+# process: a change reaches the streams held by the process that made it,
+# and a reconnecting client catches up from the snapshot sent on connect.
+HEARTBEAT = object()
+
+Event = namedtuple("Event", ["name", "data"])
+
+
+def heartbeat_interval():
+    return getattr(settings, "EVENTS_HEARTBEAT_SECONDS", 15)
+
+
+def format_event(event):
+    """One server-sent event: the event name and a single JSON data line."""
+    return f"event: {event.name}\ndata: {json.dumps(event.data, cls=DjangoJSONEncoder)}\n\n"
+
+
+class Subscription:
+    __slots__ = ("user_id", "loop", "queue")
+
+    def __init__(self, user_id, loop, size):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+
+    def push(self, item):
+        if item is HEARTBEAT and not self.queue.empty():
+            # Anything already waiting to be written keeps the connection alive
+            return
+        if self.queue.full():
+            # A stalled client drops its oldest change; every event carries the whole status
+            self.queue.get_nowait()
+        self.queue.put_nowait(item)
+
+
+class Broker:
+    """
+    Per-user fan-out of events to open streams. Idle streams cost a queue
+    each and no timer: one heartbeat task per event loop wakes every
+    `heartbeat_interval()` seconds and nudges all of that loop's streams,
+    and it exits once the last of them closes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._heartbeats = {}
+
+    def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(user_id, loop, getattr(settings, "EVENTS_QUEUE_SIZE", 100))
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        if loop not in self._heartbeats:
+            self._heartbeats[loop] = loop.create_task(self._heartbeat(loop))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, user_id, name, data):
+        """Send an event to every open stream of `user_id`. Safe from any thread."""
+        event = Event(name, data)
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, event)
+            except RuntimeError:
+                # The loop serving this stream has shut down
+                self.unsubscribe(subscription)
+
+    async def _heartbeat(self, loop):
+        try:
+            while True:
+                await asyncio.sleep(heartbeat_interval())
+                with self._lock:
+                    subscriptions = [
+                        subscription
+                        for group in self._subscriptions.values()
+                        for subscription in group
+                        if subscription.loop is loop
+                    ]
+                if not subscriptions:
+                    return
+                for subscription in subscriptions:
+                    subscription.push(HEARTBEAT)
+        finally:
+            self._heartbeats.pop(loop, None)
+
+
+broker = Broker()
+
+
+def publish(user_id, name, data):
+    broker.publish(user_id, name, data)
+
+
+def publish_on_commit(user_id, name, data, using=DEFAULT_DB_ALIAS):
+    """Publish once the surrounding transaction on `using` commits, so streams never see a rolled back change."""
+    transaction.on_commit(lambda: broker.publish(user_id, name, data), using=using)
+
+
+def booking_event(booking_id, status, version):
+    return {"booking_id": booking_id, "status": status, "version": version}
+
+
+def payment_event(booking_id, tx_ref, status):
+    return {"booking_id": booking_id, "tx_ref": tx_ref, "status": status}
+
+
+async def astream(user_id, snapshot, booking_id=None):
+    """
+    Server-sent events for one client: a `retry` hint, the current state
+    from the `snapshot` coroutine function, then changes as they happen
+    and a comment line on every heartbeat. Subscribing comes first, so a
+    change made while the snapshot is read is not lost. With `booking_id`
+    only that booking's events are sent.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f"retry: {getattr(settings, 'EVENTS_RETRY_MS', 3000)}\n\n"
+        for event in await snapshot():
+            yield format_event(event)
+        while True:
+            item = await subscription.queue.get()
+            if item is HEARTBEAT:
+                yield ": heartbeat\n\n"
+            elif booking_id is None or item.data["booking_id"] == booking_id:
+                yield format_event(item)
+    finally:
+        broker.unsubscribe(subscription)
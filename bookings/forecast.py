@@ -0,0 +1,153 @@
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Booking, DemandForecast, SlotAvailability
+
+# Daily demand per service type, read from the availability calendar,
+# which already holds live booking and guest counts per slot, so history
+# is one GROUP BY on the default database instead of a pass over every
+# resort's bookings. Each series follows a multiplicative seasonal model,
+#
+#     demand(day) = trend(day) x weekday factor x month-of-year factor,
+#
+# fitted for every service and both measures at once on dense
+# (series, day) arrays. The trend is a weighted least-squares line over
+# recent deseasonalized history, damped as it is projected forward.
+# forecast_demand stores the next HORIZON_DAYS every night, after
+# rebuild_availability has squared the calendar with the bookings; the API
+# only reads the stored rows.
+SERVICES = [code for code, _ in Booking.SERVICE_CHOICES]
+HISTORY_DAYS = 730
+HORIZON_DAYS = 90
+WEEKDAY_DAYS = 26 * 7  # weekday factors follow the last half year
+TREND_DAYS = 182
+TREND_HALFLIFE = 60
+DAMPING = 0.98
+
+Forecast = namedtuple("Forecast", ["start", "bookings", "guests", "booked", "booked_guests"])
+
+
+def load_daily(start, days):
+    """Bookings and guests per service type and day from `start`, as a (2, services, days) array."""
+    counts = np.zeros((2, len(SERVICES), days), np.int64)
+    index = {service: position for position, service in enumerate(SERVICES)}
+    rows = (
+        SlotAvailability.objects.filter(date__gte=start, date__lt=start + timedelta(days=days))
+        .values_list("service_type", "date")
+        .annotate(Sum("bookings"), Sum("guests"))
+        .order_by()
+    )
+    for service, day, bookings, guests in rows.iterator(chunk_size=2000):
+        counts[:, index[service], (day - start).days] = bookings, guests
+    return counts
+
+
+def _calendar(start, days):
+    """Weekday (Monday is 0) and month of year (January is 0) of each day from `start`."""
+    ordinals = np.arange(days) + start.toordinal()
+    months = (np.datetime64(start) + np.arange(days)).astype("datetime64[M]").astype(np.int64) % 12
+    return (ordinals - 1) % 7, months
+
+
+def _factors(values, groups, size):
+    """
+    Per series, the mean of each group of days over the overall mean;
+    1 where a group has no days or a series has no demand.
+    """
+    members = groups[:, None] == np.arange(size)
+    days = members.sum(0)
+    overall = values.mean(1, keepdims=True)
+    means = (values @ members) / np.maximum(days, 1)
+    factors = np.divide(means, overall, out=np.ones_like(means), where=overall > 0)
+    factors[:, days == 0] = 1.0
+    return factors
+
+
+def fit_forecast(history, start, horizon):
+    """
+    Forecast each row of `history`, daily values (series x days) from
+    `start`, for the `horizon` days that follow.
+    """
+    series, days = history.shape
+    if not days:
+        return np.zeros((series, horizon))
+    weekdays, months = _calendar(start, days + horizon)
+
+    recent = slice(max(0, days - WEEKDAY_DAYS), days)
+    weekday = _factors(history[:, recent], weekdays[recent], 7)
+    season = weekday[:, weekdays[:days]]
+    if days >= 365:
+        # A full year is needed before months can be told apart from trend
+        adjusted = np.divide(history, season, out=np.zeros_like(history), where=season > 0)
+        monthly = _factors(adjusted, months[:days], 12)
+        season = season * monthly[:, months[:days]]
+        month = monthly[:, months[days:]]
+    else:
+        month = np.ones((series, horizon))
+
+    # Damped trend from a weighted line through the deseasonalized recent past
+    fit = slice(max(0, days - TREND_DAYS), days)
+    t = np.arange(days, dtype=float)[fit]
+    z = np.divide(history[:, fit], season[:, fit], out=np.zeros_like(history[:, fit]), where=season[:, fit] > 0)
+    w = 0.5 ** ((t[-1] - t) / TREND_HALFLIFE) * (season[:, fit] > 0)
+    total = w.sum(1)
+    safe_total = np.maximum(total, 1e-12)
+    t_mean = (w * t).sum(1) / safe_total
+    z_mean = (w * z).sum(1) / safe_total
+    spread = (w * (t - t_mean[:, None]) ** 2).sum(1)
+    slope = np.divide(
+        (w * (t - t_mean[:, None]) * (z - z_mean[:, None])).sum(1), spread,
+        out=np.zeros(series), where=spread > 0,
+    )
+    level = np.where(total > 0, z_mean + slope * (t[-1] - t_mean), 0.0)
+    steps = DAMPING * (1 - DAMPING ** np.arange(1, horizon + 1)) / (1 - DAMPING)
+    trend = np.maximum(level[:, None] + slope[:, None] * steps, 0.0)
+
+    return trend * weekday[:, weekdays[days:]] * month
+
+
+def compute_forecast(today, horizon=HORIZON_DAYS):
+    """
+    Expected bookings and guests per service type for `horizon` days from
+    `today`, never below what is already booked for each day.
+    """
+    first = today - timedelta(days=HISTORY_DAYS)
+    counts = load_daily(first, HISTORY_DAYS + horizon)
+    history, booked = counts[..., :HISTORY_DAYS], counts[..., HISTORY_DAYS:]
+
+    # Skip the days before the first booking, so they do not read as no demand
+    seen = np.flatnonzero(history.any(axis=(0, 1)))
+    begin = int(seen[0]) if len(seen) else HISTORY_DAYS
+    flat = history[..., begin:].reshape(2 * len(SERVICES), -1).astype(float)
+    predicted = fit_forecast(flat, first + timedelta(days=begin), horizon).reshape(booked.shape)
+    expected = np.maximum(predicted, booked)
+    return Forecast(today, expected[0], expected[1], booked[0], booked[1])
+
+
+def store_forecast(today=None):
+    """Replace the stored forecast with one computed from today's data. Returns the rows written."""
+    today = today or timezone.localdate()
+    forecast = compute_forecast(today)
+    generated_at = timezone.now()
+    rows = [
+        DemandForecast(
+            service_type=service,
+            date=today + timedelta(days=offset),
+            bookings=round(float(forecast.bookings[position, offset]), 2),
+            guests=round(float(forecast.guests[position, offset]), 2),
+            booked=int(forecast.booked[position, offset]),
+            booked_guests=int(forecast.booked_guests[position, offset]),
+            generated_at=generated_at,
+        )
+        for position, service in enumerate(SERVICES)
+        for offset in range(forecast.bookings.shape[1])
+    ]
+    with transaction.atomic():
+        DemandForecast.objects.all().delete()
+        DemandForecast.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+RECORD_TTL = 24 * 3600  # how long a key replays its first response
+LOCK_TIMEOUT = 60  # an in-flight claim older than this is assumed dead
+WAIT_TIMEOUT = 30  # how long a duplicate waits for the in-flight request
+POLL_INTERVAL = 0.05
+
+# Status codes worth replaying: not server errors, not "try again later" answers
+NOT_STORED = {409, 429}
+
+_inflight = {}  # key -> asyncio.Event for requests running in this process
+
+
+def _response(record):
+    response = HttpResponse(record["body"], status=record["status"], content_type=record["content_type"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _key_mismatch():
+    return JsonResponse({"detail": "Idempotency-Key was already used for a different request"}, status=422)
+
+
+def _in_progress():
+    response = JsonResponse({"detail": "A request with this Idempotency-Key is still in progress"}, status=409)
+    response["Retry-After"] = "1"
+    return response
+
+
+class IdempotencyStore:
+    """
+    Completed responses live in the cache for fast replays and in
+    IdempotencyRecord so they survive cache evictions and are shared
+    between worker processes. The unique key column doubles as a
+    cross-process lock for the in-flight request.
+    """
+
+    def __init__(self, cache_alias="default"):
+        self.cache = caches[cache_alias]
+
+    def _cache_key(self, key):
+        return f"idempotency:{key}"
+
+    def claim(self, key, fingerprint):
+        """
+        Returns (claimed, record). claimed=True means the caller owns the key
+        and must complete() or release() it. A record means the response is
+        already stored. (False, None) means another request is running.
+        """
+        record = self.cache.get(self._cache_key(key))
+        if record is not None:
+            return False, record
+
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(key=key, fingerprint=fingerprint)
+            return True, None
+        except IntegrityError:
+            pass
+
+        row = IdempotencyRecord.objects.filter(key=key).first()
+        if row is None:
+            # Released between our insert and read: try again on the next poll
+            return False, None
+        if row.status_code is not None:
+            record = row.as_record()
+            self.cache.set(self._cache_key(key), record, RECORD_TTL)
+            return False, record
+        if row.fingerprint != fingerprint:
+            return False, {"fingerprint": row.fingerprint}
+
+        stale = timezone.now() - timedelta(seconds=LOCK_TIMEOUT)
+        took_over = IdempotencyRecord.objects.filter(
+            pk=row.pk, status_code__isnull=True, created_at__lt=stale,
+        ).update(created_at=timezone.now())
+        return bool(took_over), None
+
+    def complete(self, key, fingerprint, response):
+        record = {
+            "fingerprint": fingerprint,
+            "status": response.status_code,
+            "content_type": response.get("Content-Type", "application/json"),
+            "body": bytes(response.content),
+        }
+        IdempotencyRecord.objects.filter(key=key).update(
+            status_code=record["status"], content_type=record["content_type"], body=record["body"],
+        )
+        self.cache.set(self._cache_key(key), record, RECORD_TTL)
+
+    def release(self, key):
+        IdempotencyRecord.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+def purge_expired_records():
+    cutoff = timezone.now() - timedelta(seconds=RECORD_TTL)
+    deleted, _ = IdempotencyRecord.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+class IdempotencyMiddleware:
+    """
+    Honour an Idempotency-Key header on the POST endpoints listed in
+    settings.IDEMPOTENT_PATHS. The first request for a key runs the view and
+    its response is stored; retries get that response back with an
+    Idempotent-Replayed header. A duplicate that arrives while the first is
+    still running waits for it instead of repeating the work. Keys are
+    scoped per user (or per client IP for anonymous calls).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths = frozenset(getattr(settings, "IDEMPOTENT_PATHS", ()))
+        self.store = IdempotencyStore()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _applies(self, request):
+        return request.method == "POST" and request.path in self.paths and request.META.get(IDEMPOTENCY_HEADER)
+
+    def _identify(self, request, user):
+        scope = f"user:{user.pk}" if user.is_authenticated else f"ip:{request.META.get('REMOTE_ADDR')}"
+        raw_key = request.META[IDEMPOTENCY_HEADER][:255]
+        key = hashlib.sha256(f"{scope}|{request.path}|{raw_key}".encode()).hexdigest()
+        fingerprint = hashlib.sha256(request.META.get("QUERY_STRING", "").encode() + b"?" + request.body).hexdigest()
+        return key, fingerprint
+
+    def _store_or_release(self, key, fingerprint, response):
+        if response.status_code < 500 and response.status_code not in NOT_STORED and not response.streaming:
+            self.store.complete(key, fingerprint, response)
+        else:
+            self.store.release(key)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._applies(request):
+            return self.get_response(request)
+
+        key, fingerprint = self._identify(request, request.user)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while True:
+            claimed, record = self.store.claim(key, fingerprint)
+            if claimed:
+                break
+            if record is not None:
+                return _response(record) if record["fingerprint"] == fingerprint else _key_mismatch()
+            if time.monotonic() >= deadline:
+                return _in_progress()
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self.store.release(key)
+            raise
+        self._store_or_release(key, fingerprint, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self._applies(request):
+            return await self.get_response(request)
+
+        key, fingerprint = self._identify(request, await request.auser())
+        claim = sync_to_async(self.store.claim)
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while True:
+            claimed, record = await claim(key, fingerprint)
+            if claimed:
+                break
+            if record is not None:
+                return _response(record) if record["fingerprint"] == fingerprint else _key_mismatch()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return _in_progress()
+            running = _inflight.get(key)
+            if running is not None:
+                # Same process: wake up as soon as the first request finishes
+                try:
+                    await asyncio.wait_for(running.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+
+        done = _inflight[key] = asyncio.Event()
+        try:
+            response = await self.get_response(request)
+            await sync_to_async(self._store_or_release)(key, fingerprint, response)
+            return response
+        except BaseException:
+            await sync_to_async(self.store.release)(key)
+            raise
+        finally:
+            _inflight.pop(key, None)
+            done.set()
@@ -0,0 +1,66 @@
+from collections import defaultdict
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bookings.combos import award_combo, near_stay, replay, trim
+from bookings.models import Booking, ComboWindow
+from bookings.sharding import fan_out, merge
+from user.models import EngagementLog
+
+
+class Command(BaseCommand):
+    help = "Rebuild combo windows from booking history and award missed combo experiences."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report combos without writing anything.")
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        already_awarded = defaultdict(list)
+        for user_id, metadata in EngagementLog.objects.filter(
+            action=EngagementLog.ACTION_COMBO
+        ).values_list("user_id", "metadata").iterator():
+            if (metadata or {}).get("stay_date"):
+                already_awarded[user_id].append(date.fromisoformat(metadata["stay_date"]))
+
+        bookings = (
+            Booking.objects.exclude(status="CANCELLED")
+            .order_by("user_id", "date", "id")
+            .values_list("user_id", "id", "service_type", "date")
+        )
+
+        users = awarded = 0
+        # A guest's bookings may span resort databases: merge them back into user order
+        rows = merge(fan_out(bookings), key=lambda row: (row[0], row[3], row[1]))
+        for user_id, user_rows in groupby(rows, key=itemgetter(0)):
+            window, combos = replay(user_id, (row[1:] for row in user_rows))
+            users += 1
+            # The live path stamps a combo with the booking that completed it
+            # in creation order, so any award within the same stay counts
+            stays = already_awarded[user_id]
+            for day, booking_id in combos:
+                if near_stay(day, stays):
+                    continue
+                stays.append(day)
+                awarded += 1
+                if not dry_run:
+                    award_combo(user_id, day, booking_id)
+            if not dry_run:
+                trim(window)
+                self._store(window)
+
+        self.stdout.write(f"Processed {users} users, awarded {awarded} combos.")
+
+    def _store(self, window):
+        with transaction.atomic():
+            ComboWindow.objects.update_or_create(
+                user_id=window.user_id,
+                defaults={
+                    "recent_services": window.recent_services,
+                    "last_combo_date": window.last_combo_date,
+                },
+            )
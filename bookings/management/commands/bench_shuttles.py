@@ -0,0 +1,69 @@
+import random
+import time
+from datetime import date, time as time_
+
+from django.core.management.base import BaseCommand
+
+from bookings.models import Booking
+from bookings.shuttles import Pickup, load_pickups, plan_pickups
+from user.models import User
+
+LOCATIONS = [f"Hotel {i}" for i in range(40)] + ["Bole Airport", "Piassa", "CMC", "Megenagna"]
+
+
+class Command(BaseCommand):
+    help = "Time the shuttle planner on thousands of pickups, in memory and loaded from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pickups", type=int, default=5000)
+        parser.add_argument("--window", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        day = date(2030, 1, 15)
+        rows = sorted(
+            (
+                time_(rng.randint(5, 22), rng.choice((0, 10, 15, 20, 30, 40, 45, 50))),
+                rng.choice((1, 1, 2, 2, 2, 3, 4, 6, 12, 40)),
+                rng.choice(LOCATIONS),
+            )
+            for _ in range(options["pickups"])
+        )
+
+        pickups = [Pickup(i, *row) for i, row in enumerate(rows)]
+        timings = []
+        for _ in range(options["repeat"]):
+            start = time.perf_counter()
+            plan = plan_pickups(day, pickups, options["window"])
+            timings.append(time.perf_counter() - start)
+        self._report("in memory", plan, min(timings))
+
+        email = "shuttle-bench@example.com"
+        User.objects.filter(email=email).delete()
+        user = User.objects.create_user(email=email, password=None)
+        try:
+            # bulk_create skips Booking.save(), so the availability calendar is untouched
+            Booking.objects.bulk_create(
+                [
+                    Booking(user=user, service_type="ROOM", date=day, time=t, guests=guests,
+                            pickup_required=True, pickup_location=location)
+                    for t, guests, location in rows
+                ],
+                batch_size=500,
+            )
+            start = time.perf_counter()
+            plan = plan_pickups(day, load_pickups(day), options["window"])
+            self._report("query + plan", plan, time.perf_counter() - start)
+        finally:
+            Booking.objects.filter(user=user).delete()
+            user.delete()
+
+    def _report(self, label, plan, elapsed):
+        trips = [trip for window in plan.windows for trip in window.trips]
+        seats = sum(trip.capacity for trip in trips)
+        self.stdout.write(
+            f"{label}: {plan.pickups:,} pickups, {plan.guests:,} guests -> {len(plan.windows)} windows, "
+            f"{len(trips)} trips, {plan.guests / seats:.0%} seats filled, {elapsed * 1000:.1f} ms"
+        )
@@ -0,0 +1,16 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from bookings.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Apply migrations to every per-resort booking database (settings.RESORT_DATABASES)."
+
+    def handle(self, *args, **options):
+        aliases = [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            self.stdout.write(f"Migrating {alias}...")
+            call_command("migrate", database=alias, verbosity=options["verbosity"], interactive=False)
+        self.stdout.write(f"Migrated {len(aliases)} resort databases.")
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.reminders import LOG_RETENTION, purge_reminder_logs
+
+
+class Command(BaseCommand):
+    help = "Delete the logs of reminders that were due longer ago than --days, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--days", type=int, default=LOG_RETENTION.days, help="Days of sent reminders to keep")
+
+    def handle(self, *args, **options):
+        try:
+            deleted = purge_reminder_logs(options["batch_size"], timedelta(days=options["days"]))
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(f"Deleted {deleted} reminder logs.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from bookings.availability import calendar_drift, rebuild_availability
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the availability calendar from bookings, e.g. after bulk imports or raw updates. "
+        "Run nightly at a quiet hour, before forecast_demand, which reads the calendar as history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report slots that drifted; write nothing.")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = calendar_drift()
+            for (service_type, day, slot_time), (stored, counted) in sorted(drift.items()):
+                self.stdout.write(
+                    f"{service_type} {day} {slot_time}: stored {stored[0]} bookings / {stored[1]} guests, "
+                    f"counted {counted[0]} / {counted[1]}"
+                )
+            self.stdout.write(f"{len(drift)} slots drifted.")
+            return
+        slots = rebuild_availability()
+        self.stdout.write(f"Rebuilt availability for {slots} slots.")
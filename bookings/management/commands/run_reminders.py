@@ -0,0 +1,47 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from bookings.reminders import TICK, WINDOW, ReminderScheduler
+
+logger = logging.getLogger("bookings.reminders")
+
+
+class Command(BaseCommand):
+    help = "Send booking and pickup reminders as they come due. Runs until stopped; run one per deployment."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tick", type=int, default=int(TICK.total_seconds()), help="Seconds per wheel tick")
+        parser.add_argument("--window", type=float, default=WINDOW.total_seconds() / 3600, help="Hours held in memory")
+        parser.add_argument("--once", action="store_true", help="Run a single tick and exit")
+
+    def handle(self, *args, **options):
+        tick = timedelta(seconds=options["tick"])
+        scheduler = ReminderScheduler(tick=tick, window=timedelta(hours=options["window"]))
+        try:
+            while True:
+                started = time.monotonic()
+                # A long-lived process has to drop connections the database has since closed
+                close_old_connections()
+                try:
+                    sent = scheduler.run()
+                except Exception:
+                    if options["once"]:
+                        raise
+                    logger.exception("Reminder tick failed; retrying next tick")
+                    sent = 0
+                if sent or options["once"]:
+                    self.stdout.write(
+                        f"{timezone.now():%Y-%m-%d %H:%M} sent {sent} reminders, {len(scheduler.wheel)} scheduled"
+                    )
+                if options["once"]:
+                    return
+                time.sleep(max(0.0, tick.total_seconds() - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.pool.close()
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_combowindow'),
+        ('user', '0004_lottery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('BASE', 'Base price per guest'), ('TIER', 'Tier perk'), ('BIRTHDAY', 'Birthday'), ('GROUP', 'Group size'), ('SEASON', 'Season')], max_length=20)),
+                ('service_type', models.CharField(blank=True, choices=[('ROOM', 'Room'), ('SPA', 'Spa'), ('RESTAURANT', 'Restaurant'), ('EVENT', 'Event')], max_length=20)),
+                ('min_guests', models.PositiveIntegerField(blank=True, null=True)),
+                ('season_start', models.DateField(blank=True, null=True)),
+                ('season_end', models.DateField(blank=True, null=True)),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('percent_off', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('amount_off', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('tier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='user.tier')),
+            ],
+            options={
+                'ordering': ['priority', 'id'],
+            },
+        ),
+    ]
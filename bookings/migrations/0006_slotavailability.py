@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:01
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_availability(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    SlotAvailability = apps.get_model('bookings', 'SlotAvailability')
+    groups = (
+        Booking.objects.exclude(status='CANCELLED')
+        .values('service_type', 'date', 'time')
+        .annotate(bookings=Count('id'), guests=Sum('guests'))
+        .order_by()
+    )
+    SlotAvailability.objects.bulk_create((SlotAvailability(**group) for group in groups), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(choices=[('ROOM', 'Room'), ('SPA', 'Spa'), ('RESTAURANT', 'Restaurant'), ('EVENT', 'Event')], max_length=20)),
+                ('date', models.DateField()),
+                ('time', models.TimeField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('guests', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('service_type', 'date', 'time')},
+            },
+        ),
+        migrations.RunPython(fill_availability, migrations.RunPython.noop),
+    ]
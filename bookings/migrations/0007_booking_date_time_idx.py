@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_slotavailability'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date', 'time'], name='booking_date_time_idx'),
+        ),
+    ]
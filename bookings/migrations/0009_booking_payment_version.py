@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_idempotencyrecord'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='location',
+            field=models.CharField(choices=[('bishoftu', 'Kuriftu Bishoftu'), ('entoto', 'Kuriftu Entoto'), ('lake_tana', 'Kuriftu Lake Tana'), ('awash', 'Kuriftu Awash Falls')], default='bishoftu', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='transactionlog',
+            name='location',
+            field=models.CharField(choices=[('bishoftu', 'Kuriftu Bishoftu'), ('entoto', 'Kuriftu Entoto'), ('lake_tana', 'Kuriftu Lake Tana'), ('awash', 'Kuriftu Awash Falls')], default='bishoftu', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='transactionlog',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
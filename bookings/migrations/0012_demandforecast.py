@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_booking_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_type', models.CharField(choices=[('ROOM', 'Room'), ('SPA', 'Spa'), ('RESTAURANT', 'Restaurant'), ('EVENT', 'Event')], max_length=20)),
+                ('date', models.DateField()),
+                ('bookings', models.FloatField()),
+                ('guests', models.FloatField()),
+                ('booked', models.IntegerField(default=0)),
+                ('booked_guests', models.IntegerField(default=0)),
+                ('generated_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('service_type', 'date')},
+            },
+        ),
+    ]
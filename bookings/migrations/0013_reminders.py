@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:45
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0012_demandforecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('booking_id', models.BigIntegerField()),
+                ('kind', models.CharField(max_length=20)),
+                ('remind_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['updated_at'], name='booking_updated_at_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='reminderlog',
+            unique_together={('booking_id', 'kind', 'remind_at')},
+        ),
+    ]
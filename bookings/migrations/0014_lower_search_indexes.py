@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:01
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_reminders'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(django.db.models.functions.text.Lower('tx_ref'), name='payment_tx_ref_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:05
+
+from django.db import migrations
+
+
+def dates_per_service(apps, schema_editor):
+    # Windows kept only the latest date of each service; keep it as a one-date list
+    ComboWindow = apps.get_model('bookings', 'ComboWindow')
+    for window in ComboWindow.objects.iterator(chunk_size=2000):
+        if any(isinstance(booked, str) for booked in window.recent_services.values()):
+            window.recent_services = {
+                service_type: [booked] if isinstance(booked, str) else booked
+                for service_type, booked in window.recent_services.items()
+            }
+            window.save(update_fields=['recent_services'])
+
+
+def latest_date_per_service(apps, schema_editor):
+    ComboWindow = apps.get_model('bookings', 'ComboWindow')
+    for window in ComboWindow.objects.iterator(chunk_size=2000):
+        window.recent_services = {
+            service_type: max(booked) if isinstance(booked, list) else booked
+            for service_type, booked in window.recent_services.items()
+        }
+        window.save(update_fields=['recent_services'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_lower_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dates_per_service, latest_date_per_service),
+    ]
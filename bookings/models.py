@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.functions import Lower
 from django.conf import settings
 from django.utils import timezone
-from user.models import EngagementLog 
+from user.models import EngagementLog, Tier
+from .sharding import ResortQuerySet
 
 class Booking(models.Model):
     SERVICE_CHOICES = [
@@ -17,7 +19,20 @@ class Booking(models.Model):
         ('CANCELLED', 'Cancelled'),
     ]
 
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
+    # Append only: a resort's position picks its id block, see bookings.sharding
+    LOCATION_CHOICES = [
+        ('bishoftu', 'Kuriftu Bishoftu'),
+        ('entoto', 'Kuriftu Entoto'),
+        ('lake_tana', 'Kuriftu Lake Tana'),
+        ('awash', 'Kuriftu Awash Falls'),
+    ]
+    DEFAULT_LOCATION = 'bishoftu'
+
+    # No database constraint: with per-resort databases the user row lives elsewhere
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings', db_constraint=False
+    )
+    location = models.CharField(max_length=20, choices=LOCATION_CHOICES, default=DEFAULT_LOCATION)
     service_type = models.CharField(max_length=20, choices=SERVICE_CHOICES)
     service_id = models.CharField(max_length=100, blank=True, null=True)  # Optional for linking services
     date = models.DateField()
@@ -29,10 +44,88 @@ class Booking(models.Model):
     discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0)  # bumped on every write, see bookings.state
+
+    objects = ResortQuerySet.as_manager()
+
+    SLOT_FIELDS = ('service_type', 'date', 'time', 'guests', 'status')
+
+    class Meta:
+        indexes = [
+            # Day-sheet reads: shuttle plans, reminders
+            models.Index(fields=['date', 'time'], name='booking_date_time_idx'),
+            # Changes since a point in time, see bookings.reminders
+            models.Index(fields=['updated_at'], name='booking_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.service_type} booking by {self.user.email} on {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which calendar slot the stored row holds, so save() and
+        # delete() can adjust the availability counts without re-reading it
+        if all(name in instance.__dict__ for name in cls.SLOT_FIELDS):
+            instance._stored_slot = instance.slot_key()
+        return instance
+
+    def slot_key(self):
+        """(service_type, date, time, guests) this booking holds, or None if it holds nothing."""
+        if self.status == 'CANCELLED':
+            return None
+        return (self.service_type, self.date, self.time, self.guests)
+
+    def _load_stored_slot(self):
+        if self._state.adding:
+            return None
+        if '_stored_slot' not in self.__dict__:
+            bookings = Booking.objects.db_manager(router.db_for_read(Booking, instance=self))
+            stored = bookings.filter(pk=self.pk).values(*self.SLOT_FIELDS).first()
+            self._stored_slot = Booking(**stored).slot_key() if stored else None
+        return self._stored_slot
+
+    @classmethod
+    def location_for(cls, preferred_location):
+        """Resort code matching a user's free-text preferred location, or the default resort."""
+        text = (preferred_location or '').lower()
+        for code, label in cls.LOCATION_CHOICES:
+            if code.replace('_', ' ') in text or label.lower() in text:
+                return code
+        return cls.DEFAULT_LOCATION
+
+    def save(self, *args, **kwargs):
+        from .availability import move_slot
+        from .combos import slot_changed
+        from .sharding import derived_write
+
+        using = kwargs.get('using') or router.db_for_write(Booking, instance=self)
+        with transaction.atomic(using=using):
+            stored = self._load_stored_slot()
+            if not self._state.adding:
+                # Plain saves (admin, scripts) still invalidate versions handed out to API clients
+                self.version += 1
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+            super().save(*args, **kwargs)
+            derived_write(using, move_slot, stored, self.slot_key())
+            derived_write(using, slot_changed, self.user_id, stored, self.slot_key())
+            self._stored_slot = self.slot_key()
+
+    def delete(self, *args, **kwargs):
+        from .combos import slot_changed
+        from .sharding import derived_write
+
+        # The calendar slot is given back by the post_delete receiver in
+        # bookings.availability, which also covers queryset deletes and cascades
+        using = kwargs.get('using') or router.db_for_write(Booking, instance=self)
+        with transaction.atomic(using=using):
+            stored = self._load_stored_slot()
+            result = super().delete(*args, **kwargs)
+            derived_write(using, slot_changed, self.user_id, stored, None)
+        return result
+
 
 
 class Payment(models.Model):
@@ -52,37 +145,193 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
-    paid_at = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True, db_index=True)
     tx_ref = models.CharField(max_length=100, unique=True, null=False)  # Unique tx_ref per user
+    version = models.PositiveIntegerField(default=0)
+
+    objects = ResortQuerySet.as_manager()
 
     class Meta:
         unique_together = ('tx_ref', 'booking')  
+        indexes = [models.Index(Lower('tx_ref'), name='payment_tx_ref_lower_idx')]
 
     def __str__(self):
-        return f"Payment for Booking {self.booking.id} - {self.status}"
+        return f"Payment for Booking {self.booking_id} - {self.status}"
 
     def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
         super().save(*args, **kwargs)
+        self.log_completion()
 
-        # Auto-log engagement if payment is successful
+    def log_completion(self):
+        """Auto-log engagement if payment is successful"""
         if self.status == 'SUCCESS' and self.paid_at and not EngagementLog.objects.filter(
-            user=self.booking.user,
-            action='BOOKING_COMPLETED',
-            metadata__contains={'booking_id': self.booking.id}
+            user_id=self.booking.user_id,
+            action=EngagementLog.ACTION_BOOKING,
+            metadata__booking_id=self.booking_id,
         ).exists():
             EngagementLog.objects.create(
-                user=self.booking.user,
-                action='BOOKING_COMPLETED',
-                metadata={'booking_id': self.booking.id, 'service_type': self.booking.service_type}
+                user_id=self.booking.user_id,
+                action=EngagementLog.ACTION_BOOKING,
+                metadata={'booking_id': self.booking_id, 'service_type': self.booking.service_type}
             )
 
 
 class TransactionLog(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transactions', db_constraint=False
+    )
+    location = models.CharField(max_length=20, choices=Booking.LOCATION_CHOICES, default=Booking.DEFAULT_LOCATION)
     event = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
     metadata = models.JSONField(blank=True, null=True)
 
+    objects = ResortQuerySet.as_manager()
+
     def __str__(self):
         return f"Transaction by {self.user.email} - {self.event} - {self.amount}"
+
+
+class ComboWindow(models.Model):
+    """Compact per-user sliding window of recently booked service types."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='combo_window')
+    recent_services = models.JSONField(default=dict)  # service_type -> booked dates still in reach (ISO, sorted)
+    last_combo_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Combo window for {self.user_id}"
+
+
+class PricingRuleQuerySet(models.QuerySet):
+    # The pricing plan cache keys on Max(updated_at), which auto_now only
+    # stamps in save(); stamp it for bulk writes too
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        return super().bulk_update(objs, {*fields, 'updated_at'}, *args, **kwargs)
+
+
+class PricingRule(models.Model):
+    KIND_BASE = 'BASE'
+    KIND_TIER = 'TIER'
+    KIND_BIRTHDAY = 'BIRTHDAY'
+    KIND_GROUP = 'GROUP'
+    KIND_SEASON = 'SEASON'
+
+    KIND_CHOICES = [
+        (KIND_BASE, 'Base price per guest'),
+        (KIND_TIER, 'Tier perk'),
+        (KIND_BIRTHDAY, 'Birthday'),
+        (KIND_GROUP, 'Group size'),
+        (KIND_SEASON, 'Season'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    service_type = models.CharField(max_length=20, choices=Booking.SERVICE_CHOICES, blank=True)  # blank = every service
+    tier = models.ForeignKey(Tier, on_delete=models.CASCADE, null=True, blank=True)
+    min_guests = models.PositiveIntegerField(null=True, blank=True)
+    season_start = models.DateField(null=True, blank=True)  # only month and day are used
+    season_end = models.DateField(null=True, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # BASE rules only
+    percent_off = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    amount_off = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    priority = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PricingRuleQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+
+
+class IdempotencyRecord(models.Model):
+    """First response stored for an Idempotency-Key, see bookings.idempotency."""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of caller, path and header value
+    fingerprint = models.CharField(max_length=64)  # sha256 of query string and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null while the request is in flight
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key[:12]} - {self.status_code or 'in flight'}"
+
+    def as_record(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "status": self.status_code,
+            "content_type": self.content_type,
+            "body": bytes(self.body),
+        }
+
+
+class SlotAvailability(models.Model):
+    """
+    Materialized booking counts per service type, day and time slot.
+    Kept current incrementally by Booking.save() and the Booking delete
+    signals; writes that skip both (QuerySet.update(), raw SQL, imports)
+    must call release_user_slots() or be followed by rebuild_availability,
+    which recomputes it from scratch and is meant to run nightly.
+    """
+    service_type = models.CharField(max_length=20, choices=Booking.SERVICE_CHOICES)
+    date = models.DateField()
+    time = models.TimeField()
+    bookings = models.IntegerField(default=0)
+    guests = models.IntegerField(default=0)
+
+    class Meta:
+        # Also the index behind the month lookup (service_type, date range)
+        unique_together = ('service_type', 'date', 'time')
+
+    def __str__(self):
+        return f"{self.service_type} {self.date} {self.time}: {self.guests} guests"
+
+
+class DemandForecast(models.Model):
+    """
+    Expected bookings and guests per service type and day, written nightly
+    by the forecast_demand command (see bookings.forecast) and read as-is
+    by the forecast endpoint.
+    """
+    service_type = models.CharField(max_length=20, choices=Booking.SERVICE_CHOICES)
+    date = models.DateField()
+    bookings = models.FloatField()
+    guests = models.FloatField()
+    booked = models.IntegerField(default=0)  # bookings already on the books when generated
+    booked_guests = models.IntegerField(default=0)
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('service_type', 'date')
+
+    def __str__(self):
+        return f"{self.service_type} {self.date}: {self.bookings:.1f} bookings expected"
+
+
+class ReminderLog(models.Model):
+    """A booking or pickup reminder that was sent, so restarts never send it twice."""
+    booking_id = models.BigIntegerField()  # no foreign key: the booking may live in a resort database
+    kind = models.CharField(max_length=20)
+    remind_at = models.DateTimeField()
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('booking_id', 'kind', 'remind_at')
+
+    def __str__(self):
+        return f"{self.kind} reminder for booking {self.booking_id} at {self.remind_at}"
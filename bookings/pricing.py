@@ -0,0 +1,134 @@
+import threading
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Count, Max
+
+from .models import Booking, PricingRule
+
+CENT = Decimal("0.01")
+
+Quote = namedtuple("Quote", ["subtotal", "discount", "total", "applied"])
+QuoteContext = namedtuple("QuoteContext", ["tier_id", "birth_md", "day", "guests"])
+CompiledRule = namedtuple("CompiledRule", ["name", "checks", "percent", "amount"])
+
+_plan = None
+_plan_signature = None
+_plan_lock = threading.Lock()
+
+
+def _month_day(day):
+    return (day.month, day.day)
+
+
+def _season_check(start, end):
+    start, end = _month_day(start), _month_day(end)
+    if start <= end:
+        return lambda ctx: start <= _month_day(ctx.day) <= end
+    # Season wraps around the new year, e.g. Dec 15 - Jan 10
+    return lambda ctx: _month_day(ctx.day) >= start or _month_day(ctx.day) <= end
+
+
+def compile_rule(rule):
+    """Turn a PricingRule row into a tuple of plain predicates over a QuoteContext."""
+    checks = []
+    if rule.kind == PricingRule.KIND_TIER:
+        tier_id = rule.tier_id
+        checks.append(lambda ctx: ctx.tier_id == tier_id)
+    elif rule.kind == PricingRule.KIND_BIRTHDAY:
+        checks.append(lambda ctx: ctx.birth_md == _month_day(ctx.day))
+    elif rule.kind == PricingRule.KIND_GROUP:
+        min_guests = rule.min_guests or 0
+        checks.append(lambda ctx: ctx.guests >= min_guests)
+    elif rule.kind == PricingRule.KIND_SEASON:
+        if not (rule.season_start and rule.season_end):
+            return None
+        checks.append(_season_check(rule.season_start, rule.season_end))
+    return CompiledRule(rule.name, tuple(checks), rule.percent_off / 100, rule.amount_off)
+
+
+class PricingPlan:
+    """Active pricing rules, pre-sorted and pre-compiled per service type."""
+
+    def __init__(self, rules):
+        self.base_prices = {}
+        self.discounts = {}
+        shared_base = Decimal(0)
+        per_service = {service: [] for service, _ in Booking.SERVICE_CHOICES}
+
+        for rule in rules:
+            if rule.kind == PricingRule.KIND_BASE:
+                if rule.service_type:
+                    self.base_prices[rule.service_type] = rule.price
+                else:
+                    shared_base = rule.price
+                continue
+            compiled = compile_rule(rule)
+            if compiled is None:
+                continue
+            targets = [per_service[rule.service_type]] if rule.service_type else per_service.values()
+            for target in targets:
+                target.append((rule.priority, rule.id, compiled))
+
+        for service, compiled_rules in per_service.items():
+            self.base_prices.setdefault(service, shared_base)
+            self.discounts[service] = tuple(c for _, _, c in sorted(compiled_rules, key=lambda r: r[:2]))
+
+    def quote(self, user, service_type, day, guests):
+        birthdate = getattr(user, "birthdate", None)
+        ctx = QuoteContext(
+            tier_id=getattr(user, "tier_id", None),
+            birth_md=_month_day(birthdate) if birthdate else None,
+            day=day,
+            guests=guests,
+        )
+        subtotal = self.base_prices.get(service_type, Decimal(0)) * guests
+        discount = Decimal(0)
+        applied = []
+        for rule in self.discounts.get(service_type, ()):
+            if all(check(ctx) for check in rule.checks):
+                discount += subtotal * rule.percent + rule.amount
+                applied.append(rule.name)
+
+        discount = min(discount, subtotal).quantize(CENT)
+        subtotal = subtotal.quantize(CENT)
+        return Quote(subtotal, discount, subtotal - discount, applied)
+
+
+def _cached_plan(signature):
+    return _plan if _plan is not None and signature == _plan_signature else None
+
+
+def _install_plan(signature, rules):
+    global _plan, _plan_signature
+    with _plan_lock:
+        if _cached_plan(signature) is None:
+            _plan = PricingPlan(rules)
+            _plan_signature = signature
+        return _plan
+
+
+def get_plan():
+    """
+    Return the compiled plan, recompiling only when the rule table changed.
+    The change check is a single aggregate query on PricingRule.
+    """
+    signature = tuple(PricingRule.objects.aggregate(Max("updated_at"), Count("id")).values())
+    plan = _cached_plan(signature)
+    if plan is None:
+        plan = _install_plan(signature, list(PricingRule.objects.filter(is_active=True)))
+    return plan
+
+
+async def aget_plan():
+    signature = tuple((await PricingRule.objects.aaggregate(Max("updated_at"), Count("id"))).values())
+    plan = _cached_plan(signature)
+    if plan is None:
+        rules = [rule async for rule in PricingRule.objects.filter(is_active=True)]
+        plan = _install_plan(signature, rules)
+    return plan
+
+
+def quote_many(plan, user, items):
+    """Price (service_type, date, guests) items against an already fetched plan."""
+    return [plan.quote(user, service_type, day, guests) for service_type, day, guests in items]
@@ -0,0 +1,344 @@
+import logging
+import math
+import queue
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from kuriftu_backend.purge import delete_in_batches
+from user.models import User
+from .models import Booking, ReminderLog
+from .sharding import db_for_pk, fan_out
+
+logger = logging.getLogger(__name__)
+
+# Guests are reminded ahead of each confirmed booking and, when they asked
+# for one, of the shuttle pickup. Nothing scans the bookings table: the
+# scheduler holds only the reminders due within the next WINDOW in a timer
+# wheel and, once per tick,
+#
+#   * loads the slice of time the window has just moved over, through a
+#     range on booking_date_time_idx,
+#   * re-reads the bookings changed since the last tick, through
+#     booking_updated_at_idx, and moves or drops their reminders,
+#   * sends what came due, in batches over a small pool of open mail
+#     connections.
+#
+# Due reminders are checked against the database once more before sending,
+# which also covers changes that skip updated_at (bulk cancellations), and
+# ReminderLog keeps a restart from sending any of them twice. A tick that
+# fails puts back what it had collected and is retried on the next one.
+DEFAULT_LEADS = {"booking": timedelta(hours=24), "pickup": timedelta(hours=2)}
+TICK = timedelta(minutes=1)
+WINDOW = timedelta(hours=6)
+CATCH_UP = timedelta(minutes=15)  # reminders this overdue still go out, e.g. after a restart
+CHANGE_OVERLAP = timedelta(seconds=30)  # re-read recent changes in case a slow transaction committed late
+BATCH_SIZE = 100
+LOG_RETENTION = timedelta(days=30)
+FROM_EMAIL = "no-reply@kuriftu.com"
+COLUMNS = ("id", "user_id", "location", "service_type", "date", "time", "guests", "pickup_required", "pickup_location")
+
+Reminder = namedtuple("Reminder", ["booking_id", "kind", "remind_at", "starts_at"])
+
+
+def reminder_leads():
+    """How long before the booking each kind of reminder goes out."""
+    return {**DEFAULT_LEADS, **getattr(settings, "BOOKING_REMINDER_LEADS", {})}
+
+
+def starts_at(booking):
+    return timezone.make_aware(datetime.combine(booking["date"], booking["time"]))
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: one bucket per `tick` seconds for `size` ticks
+    ahead. Scheduling, cancelling and collecting one bucket cost O(1) per
+    timer however many are held. Timers fire on their tick, so up to one
+    tick early. A timer further out than the wheel reaches is refused,
+    and a timer already due lands in the current bucket.
+    """
+
+    def __init__(self, tick, size, now):
+        self.tick = tick
+        self.buckets = [{} for _ in range(size)]
+        self.current = int(now // tick)
+        self._slots = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def reach(self):
+        """Timestamp the wheel can hold timers up to (exclusive)."""
+        return (self.current + len(self.buckets)) * self.tick
+
+    def schedule(self, key, when, value):
+        slot = max(int(when // self.tick), self.current)
+        if slot >= self.current + len(self.buckets):
+            return False
+        self.cancel(key)
+        self.buckets[slot % len(self.buckets)][key] = value
+        self._slots[key] = slot
+        return True
+
+    def cancel(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            del self.buckets[slot % len(self.buckets)][key]
+
+    def advance(self, now):
+        """Values of every timer due by `now`, turning the wheel up to it."""
+        target = int(now // self.tick)
+        due = []
+        # After a long pause every bucket is due; visit each one once
+        for slot in range(self.current, min(target + 1, self.current + len(self.buckets))):
+            bucket = self.buckets[slot % len(self.buckets)]
+            due.extend(bucket.values())
+            for key in bucket:
+                del self._slots[key]
+            bucket.clear()
+        self.current = max(self.current, target + 1)
+        return due
+
+
+class MailPool:
+    """
+    Up to `size` mail connections shared by the dispatch threads. A
+    connection stays open from batch to batch instead of one handshake per
+    message, and is closed after an error or `max_idle` seconds unused.
+    """
+
+    def __init__(self, size=2, max_idle=60):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def send(self, messages):
+        with self._slots:
+            connection = self._acquire()
+            try:
+                sent = connection.send_messages(messages)
+            except Exception:
+                connection.close()
+                raise
+            self._idle.put((connection, time.monotonic()))
+            return sent
+
+    def _acquire(self):
+        while True:
+            try:
+                connection, used = self._idle.get_nowait()
+            except queue.Empty:
+                connection = get_connection(fail_silently=False)
+                connection.open()
+                return connection
+            if time.monotonic() - used <= self.max_idle:
+                return connection
+            connection.close()
+
+    def close_idle(self):
+        kept = []
+        while True:
+            try:
+                connection, used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - used > self.max_idle:
+                connection.close()
+            else:
+                kept.append((connection, used))
+        for item in reversed(kept):
+            self._idle.put(item)
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+
+def _starting(lo, hi):
+    """Bookings starting in [lo, hi), as a range on (date, time) the index can serve."""
+    lo, hi = timezone.localtime(lo), timezone.localtime(hi)
+    return (
+        Q(date__gte=lo.date(), date__lte=hi.date())
+        & (Q(date__gt=lo.date()) | Q(time__gte=lo.time()))
+        & (Q(date__lt=hi.date()) | Q(time__lt=hi.time()))
+    )
+
+
+def _applies(kind, booking):
+    return booking["status"] == "CONFIRMED" and (kind != "pickup" or booking["pickup_required"])
+
+
+def _message(kind, booking, user):
+    start = starts_at(booking)
+    when = f"{start:%A %d %B} at {start:%H:%M}"
+    resort = dict(Booking.LOCATION_CHOICES).get(booking["location"], "Kuriftu")
+    if kind == "pickup":
+        subject = f"Kuriftu - Shuttle pickup at {start:%H:%M}"
+        body = f"Your shuttle to {resort} picks you up at {booking['pickup_location'] or 'the agreed place'} on {when}."
+    else:
+        service = dict(Booking.SERVICE_CHOICES).get(booking["service_type"], booking["service_type"]).lower()
+        subject = f"Kuriftu - Your {service} booking on {start:%d %B}"
+        body = (
+            f"This is a reminder of your {service} booking at {resort} on {when} "
+            f"for {booking['guests']} guest{'s' if booking['guests'] != 1 else ''}."
+        )
+    return EmailMessage(
+        subject,
+        f"Hello {user['first_name']},\n\n{body}\n\nRegards,\nKuriftu Support Team",
+        FROM_EMAIL,
+        [user["email"]],
+    )
+
+
+class ReminderScheduler:
+    """The reminder loop of one process; run it from the run_reminders command."""
+
+    def __init__(self, now=None, tick=TICK, window=WINDOW, batch_size=BATCH_SIZE, pool=None):
+        now = now or timezone.now()
+        self.leads = reminder_leads()
+        self.window = window
+        self.batch_size = batch_size
+        self.pool = pool or MailPool(getattr(settings, "REMINDER_MAIL_CONNECTIONS", 2))
+        self.wheel = TimerWheel(tick.total_seconds(), math.ceil(window / tick) + 1, now.timestamp())
+        self.loaded_until = now - CATCH_UP
+        self.watermark = now
+
+    def run(self, now=None):
+        """
+        One tick: refresh the wheel, then send what is due. Returns the
+        number of reminders sent. If the tick raises, the next one reloads
+        the same slice of time and retries the reminders it had collected.
+        """
+        now = now or timezone.now()
+        self.refresh(now)
+        due = self.wheel.advance(now.timestamp())
+        try:
+            sent = self.dispatch(due, now)
+        except Exception:
+            # Already sent ones are skipped on the retry through ReminderLog
+            self._retry(due, now)
+            raise
+        self.pool.close_idle()
+        return sent
+
+    def refresh(self, now):
+        loaded_until, watermark = self.loaded_until, self.watermark
+        try:
+            self._load_window(now)
+            self._apply_changes(now)
+        except Exception:
+            # Rescheduling is idempotent, so the whole slice is simply read again
+            self.loaded_until, self.watermark = loaded_until, watermark
+            raise
+
+    def _retry(self, reminders, now):
+        for reminder in reminders:
+            self.wheel.schedule((reminder.booking_id, reminder.kind), now.timestamp(), reminder)
+
+    def _schedule(self, booking, kind, now):
+        key = (booking["id"], kind)
+        self.wheel.cancel(key)
+        start = starts_at(booking)
+        remind_at = start - self.leads[kind]
+        # Reminders long overdue, e.g. for a booking confirmed hours before it starts, are skipped
+        if _applies(kind, booking) and start > now and now - CATCH_UP <= remind_at < self.loaded_until:
+            self.wheel.schedule(key, remind_at.timestamp(), Reminder(booking["id"], kind, remind_at, start))
+
+    def _load_window(self, now):
+        until = min(now + self.window, datetime.fromtimestamp(self.wheel.reach(), tz=now.tzinfo))
+        if until <= self.loaded_until:
+            return
+        since, self.loaded_until = self.loaded_until, until
+        for kind, lead in self.leads.items():
+            bookings = Booking.objects.filter(_starting(since + lead, until + lead), status="CONFIRMED")
+            if kind == "pickup":
+                bookings = bookings.filter(pickup_required=True)
+            for shard in fan_out(bookings.values("status", *COLUMNS)):
+                for booking in shard.iterator(chunk_size=2000):
+                    self._schedule(booking, kind, now)
+
+    def _apply_changes(self, now):
+        changed = Booking.objects.filter(updated_at__gte=self.watermark - CHANGE_OVERLAP)
+        for shard in fan_out(changed.values("status", "updated_at", *COLUMNS)):
+            for booking in shard.iterator(chunk_size=2000):
+                for kind in self.leads:
+                    self._schedule(booking, kind, now)
+                self.watermark = max(self.watermark, booking["updated_at"])
+
+    def _verify(self, reminders, now):
+        """The due reminders whose booking still matches and that were not sent yet, with the rows to send from."""
+        by_db = defaultdict(list)
+        for reminder in reminders:
+            by_db[db_for_pk(reminder.booking_id)].append(reminder.booking_id)
+        bookings = {}
+        for alias, ids in by_db.items():
+            rows = Booking.objects.using(alias).filter(pk__in=ids).values("status", *COLUMNS)
+            bookings.update((row["id"], row) for row in rows)
+        sent = set(
+            ReminderLog.objects.filter(booking_id__in=list(bookings))
+            .values_list("booking_id", "kind", "remind_at")
+        )
+        return [
+            (reminder, bookings[reminder.booking_id])
+            for reminder in reminders
+            if reminder.booking_id in bookings
+            and _applies(reminder.kind, bookings[reminder.booking_id])
+            and starts_at(bookings[reminder.booking_id]) == reminder.starts_at > now
+            and (reminder.booking_id, reminder.kind, reminder.remind_at) not in sent
+        ]
+
+    def dispatch(self, reminders, now):
+        if not reminders:
+            return 0
+        due = self._verify(reminders, now)
+        users = {
+            user["id"]: user
+            for user in User.objects.filter(pk__in={booking["user_id"] for _, booking in due}, is_active=True)
+            .values("id", "email", "first_name")
+        }
+        due = [(reminder, booking) for reminder, booking in due if booking["user_id"] in users]
+        batches = [due[start:start + self.batch_size] for start in range(0, len(due), self.batch_size)]
+
+        sent = 0
+        with ThreadPoolExecutor(self.pool.size, thread_name_prefix="reminders") as executor:
+            futures = [
+                executor.submit(self.pool.send, [_message(r.kind, b, users[b["user_id"]]) for r, b in batch])
+                for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception("Sending %d reminders failed; retrying next tick", len(batch))
+                    self._retry([reminder for reminder, _ in batch], now)
+                    continue
+                ReminderLog.objects.bulk_create(
+                    [ReminderLog(booking_id=r.booking_id, kind=r.kind, remind_at=r.remind_at) for r, _ in batch],
+                    ignore_conflicts=True,
+                )
+                sent += len(batch)
+        return sent
+
+
+def purge_reminder_logs(batch_size=1000, older_than=LOG_RETENTION):
+    """
+    Delete, in batches, the ReminderLog rows of reminders due more than
+    `older_than` ago. The scheduler never looks further back than
+    CATCH_UP, so older rows are only a record of what was sent.
+    """
+    if older_than < CATCH_UP:
+        raise ValueError(f"Reminder logs are needed for at least {CATCH_UP} to stop repeats")
+    return delete_in_batches(ReminderLog.objects.filter(remind_at__lt=timezone.now() - older_than), batch_size)
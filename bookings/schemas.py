@@ -1,6 +1,8 @@
 from datetime import date as date_, time as time_, datetime as datetime_
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Literal, Optional
+from typing import List, Literal, Optional
+
+Location = Literal['bishoftu', 'entoto', 'lake_tana', 'awash']
 
 
 class BookingBase(BaseModel):
@@ -20,10 +22,28 @@ class BookingCreate(BookingBase):
         default=None,
         description="ID of the specific service being booked"
     )
+    location: Optional[Location] = Field(
+        default=None,
+        description="Resort; defaults to the one matching the guest's preferred location"
+    )
+
+
+class BookingLookup(BaseModel):
+    booking_id: int = Field(..., description="Booking ID")
+
+
+class BookingUpdate(BookingCreate):
+    booking_id: int = Field(..., description="Booking ID")
+    version: int = Field(..., description="Version from the last read; 409 if the booking changed since")
+
+
+class BookingCancel(BookingLookup):
+    version: int = Field(..., description="Version from the last read; 409 if the booking changed since")
 
 
 class BookingOut(BaseModel):
     id: int = Field(..., description="Booking ID")
+    location: Location = Field(..., description="Resort")
     service_type: Literal['ROOM', 'SPA', 'RESTAURANT', 'EVENT']
     date: date_
     time: time_
@@ -34,10 +54,94 @@ class BookingOut(BaseModel):
     discount_amount: float = Field(..., description="Discount amount if applied")
     status: str = Field(..., description="Booking status")
     created_at: datetime_ = Field(..., description="Creation timestamp")
+    version: int = Field(..., description="Send back on update/cancel to detect concurrent changes")
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class BookingQuoteItem(BaseModel):
+    service_type: Literal['ROOM', 'SPA', 'RESTAURANT', 'EVENT'] = Field(..., description="Type of service being priced")
+    date: date_ = Field(..., description="Booking date")
+    guests: int = Field(default=1, ge=1, description="Number of guests (minimum 1)")
+
+
+class BookingQuoteRequest(BaseModel):
+    items: List[BookingQuoteItem] = Field(..., min_length=1, max_length=100, description="Candidate bookings to price")
+
+
+class BookingQuoteOut(BaseModel):
+    service_type: str
+    date: date_
+    guests: int
+    subtotal: float = Field(..., description="Price before discounts")
+    discount_amount: float = Field(..., description="Total discount")
+    total: float = Field(..., description="Price after discounts")
+    applied_rules: List[str] = Field(default_factory=list, description="Names of the discounts applied")
+
+
+class AvailabilitySlotOut(BaseModel):
+    time: time_
+    bookings: int = Field(..., description="Bookings holding this slot")
+    guests: int = Field(..., description="Guests booked into this slot")
+    open: int = Field(..., description="Guest places still free")
+
+
+class AvailabilityDayOut(BaseModel):
+    date: date_
+    slots: List[AvailabilitySlotOut] = Field(default_factory=list, description="Slots with at least one booking")
+
+
+class AvailabilityMonthOut(BaseModel):
+    service_type: str
+    month: str = Field(..., description="YYYY-MM")
+    capacity: int = Field(..., description="Guest places per slot; slots not listed are fully open")
+    days: List[AvailabilityDayOut] = Field(default_factory=list)
+
+
+class ShuttleStopOut(BaseModel):
+    booking_id: int
+    time: time_ = Field(..., description="Requested pickup time")
+    guests: int = Field(..., description="Seats taken on this trip")
+    location: str
+
+
+class ShuttleTripOut(BaseModel):
+    vehicle: str
+    run: int = Field(..., description="1 for the vehicle's first run in the window, 2 for its second, ...")
+    capacity: int
+    load: int = Field(..., description="Seats filled")
+    stops: List[ShuttleStopOut] = Field(default_factory=list)
+
+
+class ShuttleWindowOut(BaseModel):
+    start: time_
+    end: time_
+    guests: int
+    trips: List[ShuttleTripOut] = Field(default_factory=list)
+
+
+class ShuttlePlanOut(BaseModel):
+    date: date_
+    window_minutes: int
+    pickups: int = Field(..., description="Bookings needing a pickup")
+    guests: int
+    windows: List[ShuttleWindowOut] = Field(default_factory=list)
+
+
+class DemandForecastDayOut(BaseModel):
+    service_type: str
+    date: date_
+    bookings: float = Field(..., description="Expected bookings")
+    guests: float = Field(..., description="Expected guests")
+    booked: int = Field(..., description="Bookings already made for the day when the forecast was generated")
+    booked_guests: int
+
+
+class DemandForecastOut(BaseModel):
+    generated_at: Optional[datetime_] = Field(None, description="When the nightly job last ran; null before the first run")
+    days: List[DemandForecastDayOut] = Field(default_factory=list)
+
+
 class PaymentCreate(BaseModel):
     booking_id: int = Field(..., description="Associated booking ID")
     amount: float = Field(..., gt=0, description="Payment amount (must be positive)")
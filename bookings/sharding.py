@@ -0,0 +1,193 @@
+import heapq
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+
+# Bookings, payments and transaction logs of each resort can live in their
+# own database (settings.RESORT_DATABASES: location -> alias), so one
+# resort's writes never wait on another's SQLite write lock. Everything
+# else, users included, stays in the default database.
+#
+# Ids stay unique across databases: each resort database hands out ids
+# from its own block of ID_BLOCK, picked by the resort's position in
+# Booking.LOCATION_CHOICES, so the database of any booking, payment or log
+# can be told from its id alone.
+SHARDED_MODELS = frozenset({"booking", "payment", "transactionlog"})
+ID_BLOCK = 10 ** 12
+
+
+def is_sharded(model):
+    return model._meta.app_label == "bookings" and model._meta.model_name in SHARDED_MODELS
+
+
+def db_for_location(location):
+    return getattr(settings, "RESORT_DATABASES", {}).get(location, DEFAULT_DB_ALIAS)
+
+
+def _locations():
+    from .models import Booking
+
+    return [code for code, _ in Booking.LOCATION_CHOICES]
+
+
+def shard_aliases():
+    """
+    Every database holding bookings, in id block order. The default database
+    is always one of them: rows written before a resort moved out keep their
+    ids below ID_BLOCK there, and db_for_pk still sends those ids to it.
+    """
+    aliases = {DEFAULT_DB_ALIAS, *(db_for_location(location) for location in _locations())}
+    return sorted(aliases, key=id_offset)
+
+
+def id_offset(alias):
+    if alias == DEFAULT_DB_ALIAS:
+        return 0
+    for block, location in enumerate(_locations(), 1):
+        if db_for_location(location) == alias:
+            return block * ID_BLOCK
+    return 0
+
+
+def db_for_pk(pk):
+    """Database holding the booking, payment or log with this id."""
+    block = int(pk) // ID_BLOCK
+    locations = _locations()
+    if 0 < block <= len(locations):
+        alias = db_for_location(locations[block - 1])
+        if id_offset(alias) == block * ID_BLOCK:
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+def fan_out(queryset):
+    """The same query against every resort database."""
+    return [queryset.using(alias) for alias in shard_aliases()]
+
+
+def merge(querysets, key):
+    """Rows of per-database querysets, each already ordered by `key`, in one ordered stream."""
+    return heapq.merge(*(queryset.iterator(chunk_size=2000) for queryset in querysets), key=key)
+
+
+async def afirst(queryset):
+    """First match from any resort database, for lookups by a unique column."""
+    for shard in fan_out(queryset):
+        found = await shard.afirst()
+        if found is not None:
+            return found
+    return None
+
+
+class ResortQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # QuerySet.create() saves to the queryset's database, which knows
+        # nothing about the new row; route by the row unless .using() was given
+        if self._db is None:
+            return self.using(router.db_for_write(self.model, instance=self.model(**kwargs))).create(**kwargs)
+        return super().create(**kwargs)
+
+
+def derived_write(using, func, *args):
+    """
+    Update the default database's tables derived from resort rows (the
+    availability calendar, combo windows, search index and engagement log)
+    with `func(*args)`, for a write in a transaction on `using`.
+
+    With the resort in the default database this simply joins the caller's
+    transaction. Otherwise the two databases cannot commit together: the
+    derived write waits for the resort transaction to commit and then runs
+    in a default transaction of its own, so a rolled-back booking never
+    reaches the derived tables. A failure or crash between the two commits
+    leaves them behind, and is only logged; rebuild_availability,
+    rebuild_search_index and backfill_combos repair that drift.
+    """
+    if using == DEFAULT_DB_ALIAS:
+        func(*args)
+    else:
+        transaction.on_commit(lambda: _in_default_transaction(func, args), using=using, robust=True)
+
+
+def _in_default_transaction(func, args):
+    with transaction.atomic():
+        func(*args)
+
+
+class ResortRouter:
+    """Route bookings, payments and transaction logs to their resort's database."""
+
+    def _db(self, model, hints):
+        if not is_sharded(model):
+            # Also stops reads like booking.user following the booking's database
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is None or not is_sharded(type(instance)):
+            return None
+        # Assigning booking.user already set _state.db to the user's
+        # database, so new rows are routed by what they hold instead
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        if instance.pk is not None:
+            return db_for_pk(instance.pk)
+        if getattr(instance, "booking_id", None) is not None:
+            return db_for_pk(instance.booking_id)
+        return db_for_location(getattr(instance, "location", None))
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Bookings and logs point at users in the default database by design
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            # The default database keeps (possibly empty) booking tables too,
+            # so the deletion collector and data migrations can query them
+            return True
+        return app_label == "bookings" and model_name in SHARDED_MODELS and db in shard_aliases()
+
+
+def reserve_id_blocks(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate: start a resort database's id sequences at its block."""
+    from .models import Booking, Payment, TransactionLog
+
+    offset = id_offset(using)
+    if not offset:
+        return
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        # Without its block the database would hand out ids that point db_for_pk elsewhere
+        raise ImproperlyConfigured(
+            f"Resort database {using!r} uses {connection.vendor}; id blocks are only reserved on SQLite. "
+            f"Start its booking, payment and transaction log id sequences at {offset} before using it."
+        )
+    with connection.cursor() as cursor:
+        for model in (Booking, Payment, TransactionLog):
+            table = model._meta.db_table
+            cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [offset, table, offset])
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                [table, offset, table],
+            )
+
+
+def delete_user_shards(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    """pre_delete on User: the deletion collector only sees the user's own database."""
+    from .availability import release_user_slots
+    from .models import Booking, TransactionLog
+
+    others = [alias for alias in shard_aliases() if alias != using]
+    if not others:
+        return
+    release_user_slots(instance.pk)
+    for alias in others:
+        Booking.objects.using(alias).filter(user_id=instance.pk).delete()
+        TransactionLog.objects.using(alias).filter(user_id=instance.pk).delete()
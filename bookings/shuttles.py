@@ -0,0 +1,149 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import time
+
+from django.conf import settings
+
+from .models import Booking
+from .sharding import db_for_location, fan_out, merge
+
+# (vehicle name, seats); override with SHUTTLE_FLEET
+DEFAULT_FLEET = (("Shuttle 1", 14), ("Shuttle 2", 14), ("Shuttle 3", 14), ("Minibus", 30))
+DEFAULT_WINDOW_MINUTES = 30
+
+Pickup = namedtuple("Pickup", ["booking_id", "time", "guests", "location"])
+Trip = namedtuple("Trip", ["vehicle", "run", "capacity", "load", "stops"])
+PickupWindow = namedtuple("PickupWindow", ["start", "end", "guests", "trips"])
+ShuttlePlan = namedtuple("ShuttlePlan", ["date", "window_minutes", "pickups", "guests", "windows"])
+
+
+def get_fleet():
+    return tuple(getattr(settings, "SHUTTLE_FLEET", DEFAULT_FLEET))
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _clock(minutes):
+    minutes = min(minutes, 24 * 60 - 1)
+    return time(minutes // 60, minutes % 60)
+
+
+def group_windows(pickups, window_minutes):
+    """
+    Split time-sorted pickups into windows. A window opens at its first
+    pickup and takes everything due within `window_minutes` of it.
+    """
+    windows = []
+    for pickup in pickups:
+        minute = _minutes(pickup.time)
+        if not windows or minute >= windows[-1][0] + window_minutes:
+            windows.append((minute, []))
+        windows[-1][1].append(pickup)
+    return windows
+
+
+def _loads(pickups, largest):
+    """
+    Items to pack: one per pickup location so a stop is served by one
+    vehicle, falling back to single parties (and then seat-sized pieces of
+    a party) when a location needs more seats than the largest vehicle.
+    """
+    by_location = {}
+    for pickup in pickups:
+        by_location.setdefault(pickup.location, []).append(pickup)
+
+    for parties in by_location.values():
+        if sum(p.guests for p in parties) <= largest:
+            yield parties
+            continue
+        for party in parties:
+            guests = party.guests
+            while guests > largest:
+                yield [party._replace(guests=largest)]
+                guests -= largest
+            yield [party._replace(guests=guests)]
+
+
+def pack_window(pickups, fleet):
+    """
+    Best-fit decreasing: the biggest load goes first, into the vehicle whose
+    free seats fit it most tightly. When no vehicle has room, the fleet
+    starts another run. Free seats are kept sorted, so each placement is a
+    binary search rather than a scan over open vehicles.
+    """
+    largest = max(capacity for _, capacity in fleet)
+    loads = sorted(_loads(pickups, largest), key=lambda parties: sum(p.guests for p in parties), reverse=True)
+
+    trips = []
+    free = []  # sorted (free seats, trip index)
+    for parties in loads:
+        size = sum(p.guests for p in parties)
+        slot = bisect_left(free, (size, -1))
+        if slot == len(free):
+            run = trips[-1][1] + 1 if trips else 1
+            for vehicle, capacity in fleet:
+                trips.append([vehicle, run, capacity, 0, []])
+                insort(free, (capacity, len(trips) - 1))
+            slot = bisect_left(free, (size, -1))
+        seats, index = free.pop(slot)
+        trip = trips[index]
+        trip[3] += size
+        trip[4].extend(parties)
+        if seats > size:
+            insort(free, (seats - size, index))
+
+    return [
+        Trip(vehicle, run, capacity, load, sorted(stops, key=lambda p: (p.time, p.location)))
+        for vehicle, run, capacity, load, stops in trips
+        if stops
+    ]
+
+
+def plan_pickups(day, pickups, window_minutes=DEFAULT_WINDOW_MINUTES, fleet=None):
+    """Turn one day's pickups (sorted by time) into windows of vehicle trips."""
+    fleet = fleet or get_fleet()
+    windows = []
+    for start, members in group_windows(pickups, window_minutes):
+        trips = pack_window(members, fleet)
+        windows.append(PickupWindow(
+            _clock(start),
+            _clock(start + window_minutes),
+            sum(trip.load for trip in trips),
+            trips,
+        ))
+    return ShuttlePlan(
+        day,
+        window_minutes,
+        len(pickups),
+        sum(window.guests for window in windows),
+        windows,
+    )
+
+
+def pickups_query(day, location=None):
+    """One day's pickups per resort database, each ordered by time."""
+    bookings = Booking.objects.filter(date=day, pickup_required=True, guests__gt=0).exclude(status="CANCELLED")
+    if location is not None:
+        bookings = bookings.filter(location=location)
+    bookings = bookings.order_by("time", "id").values_list("id", "time", "guests", "pickup_location")
+    return [bookings.using(db_for_location(location))] if location is not None else fan_out(bookings)
+
+
+def _pickup(row):
+    booking_id, time_, guests, location = row
+    return Pickup(booking_id, time_, guests, (location or "").strip() or "Unspecified")
+
+
+def _order(row):
+    return row[1], row[0]
+
+
+def load_pickups(day, location=None):
+    return [_pickup(row) for row in merge(pickups_query(day, location), key=_order)]
+
+
+async def aload_pickups(day, location=None):
+    rows = [row for bookings in pickups_query(day, location) async for row in bookings]
+    return [_pickup(row) for row in sorted(rows, key=_order)]
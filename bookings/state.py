@@ -0,0 +1,157 @@
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user import search
+from . import combos, events
+from .availability import move_slot
+from .models import Booking, TransactionLog
+from .sharding import derived_write
+
+BOOKING_TRANSITIONS = {
+    "PENDING": ("CONFIRMED", "CANCELLED"),
+}
+
+PAYMENT_TRANSITIONS = {
+    "PENDING": ("SUCCESS", "FAILED"),
+}
+
+
+class VersionConflict(Exception):
+    """The row was written by someone else since it was read."""
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def check_transition(transitions, current, new):
+    if new != current and new not in transitions.get(current, ()):
+        raise InvalidTransition(f"Cannot change status from {current} to {new}")
+
+
+def compare_and_swap(instance, **changes):
+    """
+    Write `changes` only if the row still has the version `instance` was
+    read at, as one UPDATE ... WHERE id = %s AND version = %s. No row lock
+    is taken, so readers and unrelated writers never queue behind it. On
+    success the instance is updated in place.
+    """
+    model = type(instance)
+    if any(field.name == "updated_at" for field in model._meta.concrete_fields):
+        changes.setdefault("updated_at", timezone.now())
+    updated = model.objects.using(instance._state.db).filter(pk=instance.pk, version=instance.version).update(
+        version=F("version") + 1, **changes
+    )
+    if not updated:
+        raise VersionConflict(f"{model._meta.verbose_name} {instance.pk} was changed by another request")
+    for name, value in changes.items():
+        setattr(instance, name, value)
+    instance.version += 1
+
+
+def create_booking(**fields):
+    """
+    Save a new booking and fold it into the guest's combo window: in the
+    same transaction when the booking lives in the default database, once
+    it commits otherwise (see sharding.derived_write).
+    """
+    booking = Booking(**fields)
+    using = router.db_for_write(Booking, instance=booking)
+    with transaction.atomic(using=using):
+        booking.save()
+        derived_write(using, combos.record_booking, booking)
+    return booking
+
+
+def update_booking(booking, **changes):
+    """
+    Compare-and-swap a booking as it was read. The version check proves the
+    row still holds the slot it was read with, so the availability calendar
+    is moved by exactly that difference.
+    """
+    if "status" in changes:
+        check_transition(BOOKING_TRANSITIONS, booking.status, changes["status"])
+    stored = booking.slot_key()
+    using = booking._state.db
+    with transaction.atomic(using=using):
+        compare_and_swap(booking, **changes)
+        derived_write(using, move_slot, stored, booking.slot_key())
+        derived_write(using, combos.slot_changed, booking.user_id, stored, booking.slot_key())
+        if not search.BOOKING_FIELDS.isdisjoint(changes):
+            derived_write(using, search.index_booking, booking)
+        if "status" in changes:
+            events.publish_on_commit(
+                booking.user_id, "booking", events.booking_event(booking.pk, booking.status, booking.version),
+                using=booking._state.db,
+            )
+    booking._stored_slot = booking.slot_key()
+    return booking
+
+
+def settle_payment(payment, tx_status):
+    """
+    Mark a verified payment successful and confirm its booking in one
+    transaction. Returns False if the payment was already settled, so a
+    retried webhook is a no-op. A booking that left PENDING in the meantime
+    (e.g. cancelled) keeps its status; the payment is still recorded.
+    """
+    if payment.status == "SUCCESS":
+        return False
+    check_transition(PAYMENT_TRANSITIONS, payment.status, "SUCCESS")
+
+    now = timezone.now()
+    with transaction.atomic(using=payment._state.db):
+        compare_and_swap(payment, status="SUCCESS", paid_at=now)
+        # Confirming only changes status, so the status itself is the compare value
+        bookings = Booking.objects.using(payment._state.db).filter(pk=payment.booking_id)
+        confirmed = bookings.filter(status="PENDING").update(
+            status="CONFIRMED", version=F("version") + 1, updated_at=now
+        )
+        derived_write(payment._state.db, payment.log_completion)
+        TransactionLog.objects.create(
+            user_id=payment.booking.user_id,
+            location=payment.booking.location,
+            event="Payment Successful",
+            amount=payment.amount,
+            metadata={"tx_ref": payment.tx_ref, "status": tx_status},
+        )
+
+        user_id = payment.booking.user_id
+        events.publish_on_commit(
+            user_id, "payment", events.payment_event(payment.booking_id, payment.tx_ref, payment.status),
+            using=payment._state.db,
+        )
+        if confirmed:
+            version = bookings.values_list("version", flat=True).get()
+            events.publish_on_commit(
+                user_id, "booking", events.booking_event(payment.booking_id, "CONFIRMED", version),
+                using=payment._state.db,
+            )
+    return True
+
+
+def fail_payment(payment, tx_status):
+    """
+    Mark a payment the provider reported as failed, leaving its booking
+    PENDING for another attempt. Returns False if it was already marked,
+    so a retried webhook is a no-op.
+    """
+    if payment.status == "FAILED":
+        return False
+    check_transition(PAYMENT_TRANSITIONS, payment.status, "FAILED")
+
+    with transaction.atomic(using=payment._state.db):
+        compare_and_swap(payment, status="FAILED")
+        TransactionLog.objects.create(
+            user_id=payment.booking.user_id,
+            location=payment.booking.location,
+            event="Payment Failed",
+            amount=payment.amount,
+            metadata={"tx_ref": payment.tx_ref, "status": tx_status},
+        )
+        events.publish_on_commit(
+            payment.booking.user_id, "payment", events.payment_event(payment.booking_id, payment.tx_ref, payment.status),
+            using=payment._state.db,
+        )
+    return True
@@ -1,3 +1,747 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from user.models import EngagementLog, User
+from . import combos, events, forecast, pricing, sharding, shuttles, state
+from .availability import calendar_drift
+from .reminders import MailPool, ReminderScheduler, TimerWheel
+from .models import (
+    Booking, ComboWindow, IdempotencyRecord, Payment, PricingRule, ReminderLog, SlotAvailability, TransactionLog,
+)
+
+
+@contextmanager
+def resort_commits():
+    """
+    Run what waits on a resort database's commit (sharding.derived_write)
+    when the block ends, as a real commit would; TestCase never commits.
+    """
+    with ExitStack() as stack:
+        for alias in sharding.shard_aliases():
+            if alias != DEFAULT_DB_ALIAS:
+                stack.enter_context(TestCase.captureOnCommitCallbacks(using=alias, execute=True))
+        yield
+
+
+def count(queryset):
+    """Rows matching `queryset` in every database holding bookings."""
+    return sum(shard.count() for shard in sharding.fan_out(queryset))
+
+
+def stored(model, pk):
+    """A booking, payment or log read back from the database its id points at."""
+    return model.objects.using(sharding.db_for_pk(pk)).get(pk=pk)
+
+
+def make_booking(user, service_type, day, **fields):
+    with resort_commits():
+        return state.create_booking(user=user, service_type=service_type, date=day, time=time(10), **fields)
+
+
+class ComboTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("combo@example.com", "password-123")
+
+    def combo_days(self):
+        logs = EngagementLog.objects.filter(user=self.user, action=EngagementLog.ACTION_COMBO)
+        return sorted(metadata["stay_date"] for metadata in logs.values_list("metadata", flat=True))
+
+    def test_three_services_in_one_stay_award_one_combo(self):
+        make_booking(self.user, "ROOM", date(2030, 5, 1))
+        make_booking(self.user, "SPA", date(2030, 5, 2))
+        make_booking(self.user, "RESTAURANT", date(2030, 5, 2))
+        make_booking(self.user, "EVENT", date(2030, 5, 3))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.combo_days(), ["2030-05-02"])
+        self.assertEqual(self.user.points, EngagementLog.get_points_for_action(EngagementLog.ACTION_COMBO))
+
+    def test_backfill_does_not_award_a_stay_twice(self):
+        # Created out of date order: the live path stamps the stay with the last one created
+        make_booking(self.user, "RESTAURANT", date(2030, 5, 3))
+        make_booking(self.user, "SPA", date(2030, 5, 4))
+        make_booking(self.user, "ROOM", date(2030, 5, 2))
+        self.assertEqual(self.combo_days(), ["2030-05-02"])
+
+        out = StringIO()
+        call_command("backfill_combos", stdout=out)
+        self.assertIn("awarded 0 combos", out.getvalue())
+        self.assertEqual(self.combo_days(), ["2030-05-02"])
+
+    def test_earlier_bookings_of_a_service_made_later_still_count(self):
+        make_booking(self.user, "ROOM", date(2030, 6, 1))
+        make_booking(self.user, "SPA", date(2030, 8, 1))
+        make_booking(self.user, "RESTAURANT", date(2030, 6, 2))
+        make_booking(self.user, "SPA", date(2030, 6, 1))
+        self.assertEqual(self.combo_days(), ["2030-06-01"])
+        self.assertEqual(ComboWindow.objects.get(user=self.user).recent_services["SPA"], ["2030-06-01", "2030-08-01"])
+
+        # A second combo in a stay already rewarded, after last_combo_date moved on
+        make_booking(self.user, "ROOM", date(2030, 8, 1))
+        make_booking(self.user, "EVENT", date(2030, 8, 2))
+        make_booking(self.user, "EVENT", date(2030, 6, 2))
+        self.assertEqual(self.combo_days(), ["2030-06-01", "2030-08-02"])
+
+        out = StringIO()
+        call_command("backfill_combos", stdout=out)
+        self.assertIn("awarded 0 combos", out.getvalue())
+        self.assertEqual(self.combo_days(), ["2030-06-01", "2030-08-02"])
+
+    def test_window_keeps_only_dates_still_in_reach(self):
+        window = ComboWindow(recent_services={"ROOM": ["2030-05-01", "2030-05-09"], "SPA": ["2030-05-02"]})
+        combos.trim(window, today=date(2030, 5, 5))
+        self.assertEqual(window.recent_services, {"ROOM": ["2030-05-09"]})
+
+    def test_backfill_awards_missed_combos(self):
+        for service_type, day in (("ROOM", 1), ("SPA", 2), ("EVENT", 3)):
+            Booking.objects.create(user=self.user, service_type=service_type, date=date(2030, 5, day), time=time(10))
+
+        call_command("backfill_combos", stdout=StringIO())
+        self.assertEqual(self.combo_days(), ["2030-05-03"])
+        self.assertEqual(ComboWindow.objects.get(user=self.user).last_combo_date, date(2030, 5, 3))
+
+    def test_cancelling_a_booking_takes_the_combo_back(self):
+        make_booking(self.user, "ROOM", date(2030, 5, 1))
+        spa = make_booking(self.user, "SPA", date(2030, 5, 2))
+        make_booking(self.user, "EVENT", date(2030, 5, 2))
+        self.assertEqual(len(self.combo_days()), 1)
+
+        with resort_commits():
+            state.update_booking(spa, status="CANCELLED")
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.combo_days(), [])
+        self.assertEqual(self.user.points, 0)
+        self.assertNotIn("SPA", ComboWindow.objects.get(user=self.user).recent_services)
+
+    def test_deleting_a_booking_takes_the_combo_back(self):
+        make_booking(self.user, "ROOM", date(2030, 5, 1))
+        make_booking(self.user, "SPA", date(2030, 5, 2))
+        event = make_booking(self.user, "EVENT", date(2030, 5, 2))
+
+        with resort_commits():
+            event.delete()
+
+        self.assertEqual(self.combo_days(), [])
+
+
+class PricingPlanTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        PricingRule.objects.create(name="Spa", kind=PricingRule.KIND_BASE, service_type="SPA", price=Decimal("100"))
+        PricingRule.objects.create(name="Groups", kind=PricingRule.KIND_GROUP, min_guests=2, percent_off=Decimal("10"))
+
+    def quote(self):
+        return pricing.get_plan().quote(None, "SPA", date(2030, 5, 1), 2)
+
+    def test_plan_is_cached_until_rules_change(self):
+        self.assertIs(pricing.get_plan(), pricing.get_plan())
+        self.assertEqual(self.quote().total, Decimal("180.00"))
+
+    def test_bulk_update_invalidates_the_plan(self):
+        self.assertEqual(self.quote().total, Decimal("180.00"))
+        PricingRule.objects.filter(kind=PricingRule.KIND_GROUP).update(percent_off=Decimal("50"))
+        self.assertEqual(self.quote().total, Decimal("100.00"))
+
+        rules = list(PricingRule.objects.filter(kind=PricingRule.KIND_GROUP))
+        rules[0].is_active = False
+        PricingRule.objects.bulk_update(rules, ["is_active"])
+        self.assertEqual(self.quote().total, Decimal("200.00"))
+
+
+class ConditionalResponseTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("etag@example.com", "password-123")
+        self.client.force_login(self.user)
+        make_booking(self.user, "SPA", date(2030, 5, 1))
+
+    def test_if_none_match_answers_304_until_the_list_changes(self):
+        first = self.client.get("/api/booking/bookings/")
+        etag = first["ETag"]
+        self.assertEqual(self.client.get("/api/booking/bookings/", headers={"if-none-match": etag}).status_code, 304)
+
+        make_booking(self.user, "ROOM", date(2030, 5, 1))
+        second = self.client.get("/api/booking/bookings/", headers={"if-none-match": etag})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.json()), 2)
+
+    def test_if_modified_since_alone_never_answers_304(self):
+        # A second booking within the same second leaves Last-Modified unchanged
+        last_modified = self.client.get("/api/booking/bookings/")["Last-Modified"]
+        make_booking(self.user, "ROOM", date(2030, 5, 1))
+        response = self.client.get("/api/booking/bookings/", headers={"if-modified-since": last_modified})
+        self.assertEqual(response.status_code, 200)
+
+
+class AvailabilityCalendarTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("calendar@example.com", "password-123")
+
+    def slot(self):
+        return SlotAvailability.objects.filter(service_type="SPA", date=date(2030, 5, 1)).values_list("bookings", "guests").first()
+
+    def test_every_kind_of_delete_gives_slots_back(self):
+        first = make_booking(self.user, "SPA", date(2030, 5, 1), guests=2)
+        make_booking(self.user, "SPA", date(2030, 5, 1), guests=3)
+        make_booking(self.user, "SPA", date(2030, 5, 1))
+        self.assertEqual(self.slot(), (3, 6))
+
+        with resort_commits():
+            first.delete()
+        self.assertEqual(self.slot(), (2, 4))
+        with resort_commits():
+            for shard in sharding.fan_out(Booking.objects.filter(user=self.user, guests=3)):
+                shard.delete()
+        self.assertEqual(self.slot(), (1, 1))
+        with resort_commits():
+            self.user.delete()
+        self.assertEqual(self.slot(), (0, 0))
+        self.assertEqual(calendar_drift(), {})
+
+    def test_drift_check_and_rebuild(self):
+        make_booking(self.user, "SPA", date(2030, 5, 1), guests=2)
+        for shard in sharding.fan_out(Booking.objects.all()):
+            shard.update(guests=5)  # skips the calendar
+        self.assertEqual(list(calendar_drift().values()), [((1, 2), (1, 5))])
+
+        out = StringIO()
+        call_command("rebuild_availability", "--check", stdout=out)
+        self.assertIn("1 slots drifted", out.getvalue())
+        call_command("rebuild_availability", stdout=StringIO())
+        self.assertEqual(self.slot(), (1, 5))
+        self.assertEqual(calendar_drift(), {})
+
+
+class BookingStateTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("state@example.com", "password-123")
+        self.client.force_login(self.user)
+        self.booking = make_booking(self.user, "SPA", date(2030, 5, 1))
+
+    def update(self, version, **changes):
+        data = {"booking_id": self.booking.pk, "service_type": "SPA", "date": "2030-05-02", "time": "11:00", **changes}
+        if version is not None:
+            data["version"] = version
+        return self.client.put("/api/booking/bookings/update/", data, content_type="application/json")
+
+    def cancel(self, version):
+        return self.client.post(
+            "/api/booking/bookings/cancel/", {"booking_id": self.booking.pk, "version": version},
+            content_type="application/json",
+        )
+
+    def pay(self):
+        return Payment.objects.create(booking=self.booking, amount=Decimal("100"), payment_method="CHAPA", tx_ref="tx-1")
+
+    def test_stale_version_gets_409(self):
+        response = self.update(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["version"], 1)
+
+        self.assertEqual(self.update(0, guests=4).status_code, 409)
+        self.assertEqual(self.cancel(0).status_code, 409)
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.guests, self.booking.status), (1, "PENDING"))
+
+    def test_version_is_required(self):
+        self.assertEqual(self.update(None).status_code, 422)
+
+    def test_concurrent_writes_conflict(self):
+        stale = stored(Booking, self.booking.pk)
+        state.update_booking(self.booking, guests=2)
+        with self.assertRaises(state.VersionConflict):
+            state.update_booking(stale, guests=3)
+
+    def test_settle_payment_is_idempotent(self):
+        payment = self.pay()
+        with resort_commits():
+            self.assertTrue(state.settle_payment(payment, "success"))
+        self.assertFalse(state.settle_payment(stored(Payment, payment.pk), "success"))
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "CONFIRMED")
+        self.assertEqual(count(TransactionLog.objects.filter(user=self.user)), 1)
+        self.assertEqual(
+            EngagementLog.objects.filter(user=self.user, action=EngagementLog.ACTION_BOOKING).count(), 1
+        )
+
+    def test_settling_keeps_a_cancelled_booking_cancelled(self):
+        payment = self.pay()
+        state.update_booking(self.booking, status="CANCELLED")
+        self.assertTrue(state.settle_payment(payment, "success"))
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "CANCELLED")
+
+    def callback(self, transaction_status):
+        body = json.dumps({"tx_ref": "tx-1"}).encode()
+        verified = mock.Mock(**{"json.return_value": {"status": "success", "data": {"status": transaction_status}}})
+        with mock.patch("bookings.views.CHAPA_WEBHOOK_SECRET", "secret"), \
+                mock.patch("bookings.views.CHAPA_VERIFY_URL", "https://chapa.test/verify"), \
+                mock.patch("requests.get", return_value=verified), resort_commits():
+            return self.client.post(
+                "/api/booking/callback/", body, content_type="application/json",
+                headers={"chapa-signature": hmac.new(b"secret", body, hashlib.sha256).hexdigest()},
+            )
+
+    def test_failed_transactions_fail_the_payment(self):
+        payment = self.pay()
+        self.assertEqual(self.callback("pending").status_code, 400)
+        self.assertEqual(stored(Payment, payment.pk).status, "PENDING")
+
+        self.assertEqual(self.callback("failed").status_code, 400)
+        self.assertEqual(stored(Payment, payment.pk).status, "FAILED")
+        self.assertEqual(self.callback("failed").status_code, 400)  # retried webhook
+        logs = sharding.fan_out(TransactionLog.objects.filter(user=self.user).values_list("event", flat=True))
+        self.assertEqual([event for shard in logs for event in shard], ["Payment Failed"])
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "PENDING")
+        self.assertEqual(self.callback("success").status_code, 409)
+
+    def test_illegal_transitions_are_rejected(self):
+        state.update_booking(self.booking, status="CONFIRMED")
+        for status in ("PENDING", "CANCELLED"):
+            with self.assertRaises(state.InvalidTransition):
+                state.update_booking(self.booking, status=status)
+        self.assertEqual(self.cancel(self.booking.version).status_code, 409)
+
+        payment = self.pay()
+        state.compare_and_swap(payment, status="FAILED")
+        with self.assertRaises(state.InvalidTransition):
+            state.settle_payment(payment, "success")
+
+
+class IdempotencyTests(TestCase):
+    databases = "__all__"
+
+    url = "/api/booking/bookings/"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("idempotent@example.com", "password-123")
+        self.client.force_login(self.user)
+
+    def book(self, key, day="2030-05-01"):
+        return self.client.post(
+            self.url, {"service_type": "SPA", "date": day, "time": "10:00"},
+            content_type="application/json", headers={"idempotency-key": key},
+        )
+
+    def test_replayed_key_returns_the_first_response(self):
+        first = self.book("key-1")
+        second = self.book("key-1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((second.status_code, second.content), (201, first.content))
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(count(Booking.objects.filter(user=self.user)), 1)
+
+    def test_replay_survives_cache_eviction(self):
+        first = self.book("key-1")
+        cache.clear()
+        second = self.book("key-1")
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(count(Booking.objects.filter(user=self.user)), 1)
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        self.book("key-1")
+        self.assertEqual(self.book("key-1", day="2030-05-02").status_code, 422)
+        self.assertEqual(count(Booking.objects.filter(user=self.user)), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self.book("key-1")
+        self.client.force_login(User.objects.create_user("other@example.com", "password-123"))
+        self.assertFalse(self.book("key-1").has_header("Idempotent-Replayed"))
+        self.assertEqual(count(Booking.objects.all()), 2)
+
+    def test_completed_requests_leave_no_claim_in_flight(self):
+        self.book("key-1")
+        self.assertEqual(list(IdempotencyRecord.objects.values_list("status_code", flat=True)), [201])
+
+    async def test_async_replay(self):
+        await self.async_client.aforce_login(self.user)
+        data = {"service_type": "SPA", "date": "2030-05-01", "time": "10:00"}
+        headers = {"idempotency-key": "key-async"}
+        first = await self.async_client.post(self.url, data, content_type="application/json", headers=headers)
+        second = await self.async_client.post(self.url, data, content_type="application/json", headers=headers)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(await sync_to_async(count)(Booking.objects.filter(user=self.user)), 1)
+
+
+@override_settings(RESORT_DATABASES={"entoto": "resort_entoto", "awash": "resort_awash"})
+class ShardRoutingTests(SimpleTestCase):
+    def test_ids_point_at_their_resort_database(self):
+        self.assertEqual(sharding.db_for_location("entoto"), "resort_entoto")
+        self.assertEqual(sharding.db_for_location("bishoftu"), DEFAULT_DB_ALIAS)
+        self.assertEqual(sharding.shard_aliases(), [DEFAULT_DB_ALIAS, "resort_entoto", "resort_awash"])
+        self.assertEqual(sharding.id_offset("resort_entoto"), 2 * sharding.ID_BLOCK)
+        self.assertEqual(sharding.db_for_pk(2 * sharding.ID_BLOCK + 7), "resort_entoto")
+        self.assertEqual(sharding.db_for_pk(4 * sharding.ID_BLOCK + 7), "resort_awash")
+        # Ids of resorts kept in the default database, or out of any block
+        self.assertEqual(sharding.db_for_pk(7), DEFAULT_DB_ALIAS)
+        self.assertEqual(sharding.db_for_pk(3 * sharding.ID_BLOCK + 7), DEFAULT_DB_ALIAS)
+        self.assertEqual(sharding.db_for_pk(9 * sharding.ID_BLOCK), DEFAULT_DB_ALIAS)
+
+    def test_id_blocks_need_sqlite(self):
+        connections = {"resort_entoto": SimpleNamespace(vendor="postgresql")}
+        with mock.patch.object(sharding, "connections", connections):
+            with self.assertRaisesMessage(ImproperlyConfigured, "'resort_entoto' uses postgresql"):
+                sharding.reserve_id_blocks(None, using="resort_entoto")
+            # Nothing to reserve for the default database
+            sharding.reserve_id_blocks(None, using=DEFAULT_DB_ALIAS)
+
+
+@skipUnless(settings.RESORT_DATABASES, "run with RESORT_SHARDS=1")
+class ShardedBookingTests(TestCase):
+    """RESORT_SHARDS=1 python manage.py test bookings.tests.ShardedBookingTests"""
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("shards@example.com", "password-123")
+        self.alias = sharding.db_for_location("entoto")
+
+    def slot(self):
+        return SlotAvailability.objects.filter(service_type="SPA", date=date(2030, 5, 1)).values_list("bookings", "guests").first()
+
+    def book(self, **fields):
+        return state.create_booking(user=self.user, service_type="SPA", date=date(2030, 5, 1), time=time(10), **fields)
+
+    def test_rows_land_in_their_resort_id_block(self):
+        booking = make_booking(self.user, "SPA", date(2030, 5, 1), location="entoto")
+        payment = Payment.objects.create(booking=booking, amount=Decimal("10"), tx_ref="tx-shard")
+        self.assertEqual(booking._state.db, self.alias)
+        self.assertGreaterEqual(booking.pk, sharding.id_offset(self.alias))
+        self.assertEqual(sharding.db_for_pk(booking.pk), self.alias)
+        self.assertEqual(sharding.db_for_pk(payment.pk), self.alias)
+        self.assertFalse(Booking.objects.using(DEFAULT_DB_ALIAS).exists())
+        self.assertEqual(stored(Booking, booking.pk).user, self.user)
+
+    def test_derived_tables_follow_the_resort_commit(self):
+        with self.captureOnCommitCallbacks(using=self.alias) as callbacks:
+            self.book(location="entoto", guests=2)
+        self.assertIsNone(self.slot())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.slot(), (1, 2))
+
+    def test_rolled_back_bookings_leave_derived_tables_alone(self):
+        with self.captureOnCommitCallbacks(using=self.alias) as callbacks:
+            with self.assertRaises(ValueError), transaction.atomic(using=self.alias):
+                self.book(location="entoto")
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertIsNone(self.slot())
+
+    def test_rows_from_before_sharding_stay_visible(self):
+        # Written while bishoftu still lived in the default database
+        legacy = Booking.objects.using(DEFAULT_DB_ALIAS).create(
+            user=self.user, service_type="SPA", date=date(2030, 5, 1), time=time(10), location="bishoftu",
+        )
+        sharded = make_booking(self.user, "SPA", date(2030, 5, 1), location="bishoftu")
+        self.assertNotEqual(sharded._state.db, DEFAULT_DB_ALIAS)
+        self.assertEqual(sharding.db_for_pk(legacy.pk), DEFAULT_DB_ALIAS)
+        self.assertEqual(stored(Booking, legacy.pk), legacy)
+
+        self.client.force_login(self.user)
+        listed = [booking["id"] for booking in self.client.get("/api/booking/bookings/").json()]
+        self.assertEqual(sorted(listed), sorted([legacy.pk, sharded.pk]))
+
+        call_command("rebuild_availability", stdout=StringIO())
+        self.assertEqual(self.slot(), (2, 2))
+
+
+class TimerWheelTests(SimpleTestCase):
+    def test_timers_fire_on_their_tick(self):
+        wheel = TimerWheel(60, 10, now=600)
+        self.assertTrue(wheel.schedule("a", 700, "a"))
+        self.assertTrue(wheel.schedule("b", 725, "b"))
+        self.assertTrue(wheel.schedule("late", 100, "late"))  # already due: current bucket
+        self.assertFalse(wheel.schedule("far", 600 + 60 * 10, "far"))
+        self.assertEqual(wheel.reach(), 1200)
+        self.assertEqual(len(wheel), 3)
+
+        self.assertEqual(wheel.advance(659), ["late"])
+        self.assertEqual(sorted(wheel.advance(720)), ["a", "b"])
+        self.assertEqual(len(wheel), 0)
+
+    def test_rescheduling_and_cancelling(self):
+        wheel = TimerWheel(60, 10, now=600)
+        wheel.schedule("a", 700, "first")
+        wheel.schedule("a", 900, "second")
+        wheel.schedule("b", 700, "b")
+        wheel.cancel("b")
+        wheel.cancel("missing")
+        self.assertEqual(wheel.advance(800), [])
+        self.assertEqual(wheel.advance(900), ["second"])
+
+    def test_a_long_pause_collects_every_bucket_once(self):
+        wheel = TimerWheel(60, 4, now=0)
+        for second in range(0, 240, 30):
+            wheel.schedule(second, second, second)
+        self.assertEqual(sorted(wheel.advance(10_000)), list(range(0, 240, 30)))
+        self.assertEqual(wheel.current, 10_000 // 60 + 1)
+        self.assertTrue(wheel.schedule("next", 10_000, "next"))
+
+
+class FlakyPool(MailPool):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def send(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mail server went away")
+        return super().send(messages)
+
+
+class ReminderTests(TestCase):
+    databases = "__all__"
+
+    # The booking reminder of a booking starting at 09:00 on 2 May is due at 09:00 on 1 May
+    start = timezone.make_aware(datetime(2030, 5, 1, 8, 0))
+    due = start + timedelta(hours=1)
+
+    def setUp(self):
+        self.user = User.objects.create_user("reminded@example.com", "password-123", first_name="Hana")
+        self.booking = state.create_booking(
+            user=self.user, service_type="SPA", date=date(2030, 5, 2), time=time(9), status="CONFIRMED",
+        )
+
+    def scheduler(self, pool=None, now=None):
+        scheduler = ReminderScheduler(now=now or self.start, pool=pool)
+        self.assertEqual(scheduler.run(now or self.start), 0)
+        return scheduler
+
+    def test_due_reminders_are_sent_once_across_restarts(self):
+        self.assertEqual(self.scheduler().run(self.due), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Hello Hana", mail.outbox[0].body)
+        self.assertEqual(ReminderLog.objects.get().kind, "booking")
+
+        restarted = self.scheduler(now=self.due)
+        self.assertEqual(restarted.run(self.due + timedelta(minutes=1)), 0)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_cancelled_bookings_are_not_reminded(self):
+        scheduler = self.scheduler()
+        Booking.objects.using(self.booking._state.db).filter(pk=self.booking.pk).update(status="CANCELLED")  # skips updated_at
+        self.assertEqual(scheduler.run(self.due), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_failed_sends_are_retried_next_tick(self):
+        scheduler = self.scheduler(pool=FlakyPool(failures=1))
+        with self.assertLogs("bookings.reminders", "ERROR"):
+            self.assertEqual(scheduler.run(self.due), 0)
+        self.assertEqual(scheduler.run(self.due + timedelta(minutes=1)), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_ticks_keep_what_they_collected(self):
+        scheduler = self.scheduler()
+        with mock.patch.object(scheduler, "_verify", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                scheduler.run(self.due)
+        self.assertEqual(len(scheduler.wheel), 1)
+        self.assertEqual(scheduler.run(self.due + timedelta(minutes=1)), 1)
+
+    def test_failed_refreshes_reload_their_slice(self):
+        scheduler = ReminderScheduler(now=self.start)
+        loaded_until = scheduler.loaded_until
+        with mock.patch.object(scheduler, "_apply_changes", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                scheduler.run(self.start)
+        self.assertEqual(scheduler.loaded_until, loaded_until)
+        scheduler.run(self.start)
+        self.assertEqual(scheduler.run(self.due), 1)
+
+    def test_purge_keeps_recent_logs(self):
+        now = timezone.now()
+        ReminderLog.objects.create(booking_id=1, kind="booking", remind_at=now - timedelta(days=40))
+        ReminderLog.objects.create(booking_id=2, kind="booking", remind_at=now - timedelta(days=2))
+        out = StringIO()
+        call_command("purge_reminder_logs", "--batch-size", "1", stdout=out)
+        self.assertIn("Deleted 1 reminder logs.", out.getvalue())
+        self.assertEqual(list(ReminderLog.objects.values_list("booking_id", flat=True)), [2])
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=0.01)
+class BrokerTests(SimpleTestCase):
+    async def test_events_reach_only_their_users_streams(self):
+        broker = events.Broker()
+        first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+        self.assertEqual(broker.subscriber_count(), 3)
+
+        broker.publish(1, "booking", {"booking_id": 7})
+        await asyncio.sleep(0)  # delivery hops onto the loop
+        self.assertEqual(first.queue.get_nowait(), events.Event("booking", {"booking_id": 7}))
+        self.assertEqual(second.queue.get_nowait().name, "booking")
+        self.assertTrue(other.queue.empty())
+
+        broker.unsubscribe(first)
+        broker.unsubscribe(first)  # twice is harmless
+        broker.publish(1, "booking", {"booking_id": 8})
+        await asyncio.sleep(0)
+        self.assertTrue(first.queue.empty())
+        self.assertEqual(broker.subscriber_count(), 2)
+        for subscription in (second, other):
+            broker.unsubscribe(subscription)
+
+    async def test_heartbeat_nudges_idle_streams_and_stops_with_the_last(self):
+        broker = events.Broker()
+        subscription = broker.subscribe(1)
+        await asyncio.sleep(0.05)
+        # Several intervals passed, but a waiting heartbeat is not queued again
+        self.assertIs(subscription.queue.get_nowait(), events.HEARTBEAT)
+        self.assertTrue(subscription.queue.empty())
+
+        broker.unsubscribe(subscription)
+        await asyncio.sleep(0.05)
+        self.assertEqual(broker._heartbeats, {})
+
+    async def test_stalled_streams_drop_their_oldest_event(self):
+        broker = events.Broker()
+        with override_settings(EVENTS_QUEUE_SIZE=2):
+            subscription = broker.subscribe(1)
+        for booking_id in range(3):
+            broker.publish(1, "booking", {"booking_id": booking_id})
+        await asyncio.sleep(0)
+        self.assertEqual([subscription.queue.get_nowait().data["booking_id"] for _ in range(2)], [1, 2])
+        broker.unsubscribe(subscription)
+
+    async def test_stream_filters_by_booking(self):
+        async def snapshot():
+            return [events.Event("booking", events.booking_event(5, "PENDING", 0))]
+
+        stream = events.astream(1, snapshot, booking_id=5)
+        self.assertTrue((await anext(stream)).startswith("retry: "))
+        self.assertIn('"booking_id": 5', await anext(stream))
+        events.publish(1, "booking", events.booking_event(4, "CONFIRMED", 1))
+        events.publish(1, "payment", events.payment_event(5, "tx-5", "SUCCESS"))
+        self.assertEqual(
+            await anext(stream), 'event: payment\ndata: {"booking_id": 5, "tx_ref": "tx-5", "status": "SUCCESS"}\n\n'
+        )
+        await stream.aclose()
+        self.assertEqual(events.broker.subscriber_count(), 0)
+
+
+class BookingEventsTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("events@example.com", "password-123")
+        self.booking = make_booking(self.user, "SPA", date(2030, 5, 1))
+
+    def test_publish_on_commit_waits_for_the_commit(self):
+        using = self.booking._state.db
+        with mock.patch.object(events.broker, "publish") as publish:
+            with self.captureOnCommitCallbacks(using=using) as callbacks:
+                with transaction.atomic(using=using):
+                    events.publish_on_commit(self.user.pk, "booking", {"booking_id": 1}, using=using)
+                publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+            publish.assert_called_once_with(self.user.pk, "booking", {"booking_id": 1})
+
+            with self.captureOnCommitCallbacks(using=using) as callbacks:
+                with self.assertRaises(ValueError), transaction.atomic(using=using):
+                    events.publish_on_commit(self.user.pk, "booking", {"booking_id": 2}, using=using)
+                    raise ValueError
+            self.assertEqual(callbacks, [])
+
+    def test_wsgi_requests_are_refused(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/api/booking/events/").status_code, 501)
+
+    async def test_asgi_stream_starts_with_the_pending_bookings(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/booking/events/")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await anext(chunks)).startswith(b"retry: "))
+        self.assertIn(f'"booking_id": {self.booking.pk}, "status": "PENDING"'.encode(), await anext(chunks))
+        await chunks.aclose()
+
+
+class ShuttlePlanTests(SimpleTestCase):
+    fleet = (("Van", 8), ("Bus", 12))
+
+    def pickups(self):
+        Pickup = shuttles.Pickup
+        return [
+            Pickup(1, time(9, 0), 6, "Airport"),
+            Pickup(4, time(9, 5), 3, "Station"),
+            Pickup(2, time(9, 10), 5, "Hotel"),
+            Pickup(3, time(9, 20), 4, "Airport"),
+            Pickup(5, time(11, 0), 30, "Port"),
+        ]
+
+    def summary(self, trips):
+        return [(trip.vehicle, trip.run, trip.load, [stop.booking_id for stop in trip.stops]) for trip in trips]
+
+    def test_windows_are_packed_best_fit(self):
+        plan = shuttles.plan_pickups(date(2030, 5, 1), self.pickups(), window_minutes=30, fleet=self.fleet)
+        self.assertEqual((plan.pickups, plan.guests), (5, 48))
+        first, second = plan.windows
+        self.assertEqual((first.start, first.end, first.guests), (time(9, 0), time(9, 30), 18))
+        # Both Airport parties ride together; the two smaller stops fill the van exactly
+        self.assertEqual(self.summary(first.trips), [("Van", 1, 8, [4, 2]), ("Bus", 1, 10, [1, 3])])
+        self.assertEqual(second.start, time(11, 0))
+
+    def test_parties_larger_than_any_vehicle_are_split_over_runs(self):
+        trips = shuttles.pack_window([self.pickups()[-1]], self.fleet)
+        self.assertEqual(self.summary(trips), [("Van", 1, 6, [5]), ("Bus", 1, 12, [5]), ("Bus", 2, 12, [5])])
+        self.assertTrue(all(trip.load <= trip.capacity for trip in trips))
+        self.assertEqual(sum(trip.load for trip in trips), 30)
+
+
+class ForecastTests(SimpleTestCase):
+    start = date(2030, 1, 7)  # a Monday
+    weeks = 28
+
+    def test_flat_and_weekly_series_are_reproduced(self):
+        week = np.array([10, 10, 10, 10, 10, 20, 20], float)
+        history = np.stack([np.full(7 * self.weeks, 10.0), np.tile(week, self.weeks), np.zeros(7 * self.weeks)])
+        predicted = forecast.fit_forecast(history, self.start, 14)
+        self.assertEqual(predicted.shape, (3, 14))
+        np.testing.assert_allclose(predicted[0], 10)
+        # The horizon starts on a Monday, so the weekend peak lands on days 5, 6, 12 and 13
+        np.testing.assert_allclose(predicted[1], np.tile(week, 2))
+        np.testing.assert_array_equal(predicted[2], 0)
+
+    def test_falling_trend_levels_off_at_zero(self):
+        history = np.arange(7 * self.weeks, 0, -1, dtype=float)[None, :]
+        predicted = forecast.fit_forecast(history, self.start, 90)
+        self.assertLess(predicted[0, 0], 5)
+        self.assertGreaterEqual(predicted.min(), 0)
+        self.assertEqual(predicted[0, -1], 0)
+
+    def test_no_history_forecasts_nothing(self):
+        np.testing.assert_array_equal(forecast.fit_forecast(np.zeros((2, 0)), self.start, 5), np.zeros((2, 5)))
@@ -1,15 +1,26 @@
 from ninja import Router
 from django.http import JsonResponse
 from .models import *
-from .schemas import BookingCreate, BookingOut
+from .schemas import (
+    BookingCreate, BookingUpdate, BookingLookup, BookingCancel, BookingOut,
+    BookingQuoteRequest, BookingQuoteOut, AvailabilityMonthOut, ShuttlePlanOut, Location,
+    DemandForecastOut,
+)
+from .pricing import aget_plan, quote_many
+from .availability import amonth_calendar
+from .shuttles import DEFAULT_WINDOW_MINUTES, aload_pickups, plan_pickups
+from . import events, sharding, state
+from user.auth import arequire_user, arequire_staff
+from kuriftu_backend.projection import schema_columns
+from kuriftu_backend.conditional import compute_etag, conditional
+from django.db.models import Count, Max
+from asgiref.sync import sync_to_async
 from django.db import IntegrityError
-from datetime import datetime
-from django.shortcuts import get_object_or_404
+from datetime import date, datetime, timedelta
+from django.shortcuts import aget_object_or_404
 from ninja.errors import HttpError
-from django.http import HttpRequest
-from dotenv import load_dotenv
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 import base64
 import os
 import uuid
@@ -17,10 +28,14 @@ import json
 import hmac
 import hashlib
 from django.utils import timezone
-from ninja import Header
+from ninja import Header, Query
+from typing import Literal, Optional
 
 router = Router(tags=["Bookings and Payment"])
 
+# Read endpoints fetch just these columns with .values() instead of full rows
+BOOKING_COLUMNS = schema_columns(BookingOut)
+
 
 # Environment Variables
 CHAPA_SECRET_KEY = os.getenv("CHAPA_SECRET_KEY")
@@ -30,16 +45,22 @@ BACKEND_URL = os.getenv("BACKEND_URL")
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 CHAPA_WEBHOOK_SECRET = os.getenv("CHAPA_WEBHOOK_SECRET")
 DECIPH_KEY = os.getenv("Deciphkey")
+# Chapa transaction statuses after which the payment can no longer succeed
+FAILED_TRANSACTION_STATUSES = ("failed", "cancelled")
 
 @router.post("/bookings/", response={201: BookingOut})
-def create_booking(request, booking: BookingCreate):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
+async def create_booking(request, booking: BookingCreate):
+    user = await arequire_user(request)
+
+    plan = await aget_plan()
+    quote = plan.quote(user, booking.service_type, booking.date, booking.guests)
 
     try:
-        # Create a new booking instance
-        new_booking = Booking.objects.create(
-            user=request.user,
+        # Create a new booking instance and track its service type for combo-experience rewards;
+        # the resort picks the database the booking, its payment and logs live in
+        new_booking = await sync_to_async(state.create_booking)(
+            user=user,
+            location=booking.location or Booking.location_for(user.preferred_location),
             service_type=booking.service_type,
             service_id=booking.service_id,
             date=booking.date,
@@ -47,76 +68,236 @@ def create_booking(request, booking: BookingCreate):
             guests=booking.guests,
             pickup_required=booking.pickup_required,
             pickup_location=booking.pickup_location,
-            notes=booking.notes or "",  # optional
+            discount_applied=quote.discount > 0,
+            discount_amount=quote.discount,
         )
-        
-        return JSONResponse(status_code=201, content=new_booking)
+
+        return 201, new_booking
 
     except IntegrityError as e:
         return JsonResponse({'error': f'Error creating booking: {e}'}, status=400)
 
 
-@router.get("/bookings/", response=BookingOut)
-def list_bookings(request):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
-
-    bookings = Booking.objects.filter(user=request.user) 
-    return JSONResponse(bookings)
+@router.post("/bookings/quote/", response=list[BookingQuoteOut])
+async def quote_bookings(request, data: BookingQuoteRequest):
+    # Anonymous guests get public prices; tier and birthday perks need a login
+    user = await request.auser()
+    items = [(item.service_type, item.date, item.guests) for item in data.items]
+    quotes = quote_many(await aget_plan(), user, items)
+    return [
+        {
+            "service_type": item.service_type,
+            "date": item.date,
+            "guests": item.guests,
+            "subtotal": quote.subtotal,
+            "discount_amount": quote.discount,
+            "total": quote.total,
+            "applied_rules": quote.applied,
+        }
+        for item, quote in zip(data.items, quotes)
+    ]
+
+
+@router.get("/bookings/", response=list[BookingOut])
+async def list_bookings(request, response: HttpResponse):
+    user = await arequire_user(request)
+    # One query per resort database; ids are blocked per resort, so the
+    # concatenation is still in id order
+    shards = sharding.fan_out(Booking.objects.filter(user=user))
+
+    # Answer re-polls from a single aggregate per resort before touching any rows
+    stamps = [await bookings.aaggregate(last=Max("updated_at"), count=Count("id")) for bookings in shards]
+    last = max((stamp["last"] for stamp in stamps if stamp["last"]), default=None)
+    etag = compute_etag("bookings", user.pk, last, sum(stamp["count"] for stamp in stamps))
+    not_modified = conditional(request, response, etag, last)
+    if not_modified:
+        return not_modified
+
+    return [row for bookings in shards async for row in bookings.order_by("id").values(*BOOKING_COLUMNS)]
+
+
+@router.get("/availability/", response=AvailabilityMonthOut)
+async def month_availability(
+    request,
+    service_type: Literal['ROOM', 'SPA', 'RESTAURANT', 'EVENT'],
+    month: str = Query(..., pattern=r"^\d{4}-\d{2}$", description="YYYY-MM"),
+):
+    year, month_number = (int(part) for part in month.split("-"))
+    if not 1 <= month_number <= 12:
+        raise HttpError(400, "Invalid month")
+    calendar = await amonth_calendar(service_type, year, month_number)
+    return calendar._asdict()
+
+
+@router.get("/shuttles/plan/", response=ShuttlePlanOut)
+async def shuttle_plan(
+    request,
+    day: date = Query(..., alias="date"),
+    window_minutes: int = Query(DEFAULT_WINDOW_MINUTES, ge=5, le=240),
+    location: Optional[Location] = Query(None, description="Resort; all resorts when omitted"),
+):
+    await arequire_staff(request)
+    plan = plan_pickups(day, await aload_pickups(day, location), window_minutes)
+    return {
+        **plan._asdict(),
+        "windows": [
+            {**window._asdict(), "trips": [
+                {**trip._asdict(), "stops": [stop._asdict() for stop in trip.stops]}
+                for trip in window.trips
+            ]}
+            for window in plan.windows
+        ],
+    }
+
+
+@router.get("/forecast/", response=DemandForecastOut)
+async def demand_forecast(
+    request,
+    response: HttpResponse,
+    service_type: Optional[Literal['ROOM', 'SPA', 'RESTAURANT', 'EVENT']] = Query(None, description="All services when omitted"),
+    start: Optional[date] = Query(None, description="First day (default: today)"),
+    days: int = Query(30, ge=1, le=90),
+):
+    """Expected demand per service and day, as stored by the nightly forecast_demand job."""
+    await arequire_staff(request)
+    forecasts = DemandForecast.objects.all()
+    if service_type is not None:
+        forecasts = forecasts.filter(service_type=service_type)
+    generated_at = (await forecasts.aaggregate(last=Max("generated_at")))["last"]
+
+    start = start or timezone.localdate()
+    etag = compute_etag("forecast", generated_at, service_type, start, days)
+    not_modified = conditional(request, response, etag, generated_at)
+    if not_modified:
+        return not_modified
+
+    rows = forecasts.filter(date__gte=start, date__lt=start + timedelta(days=days)).order_by("date", "service_type")
+    return {
+        "generated_at": generated_at,
+        "days": [row async for row in rows.values(
+            "service_type", "date", "bookings", "guests", "booked", "booked_guests",
+        )],
+    }
+
+
+def _bookings_for(booking_id):
+    """Bookings of the resort database that owns `booking_id`."""
+    return Booking.objects.using(sharding.db_for_pk(booking_id))
 
 
 @router.post("/bookings/get/", response={200: BookingOut})
-def get_booking(request, booking_data: BookingCreate):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
+async def get_booking(request, booking_data: BookingLookup):
+    user = await arequire_user(request)
+    bookings = _bookings_for(booking_data.booking_id).values(*BOOKING_COLUMNS)
+    return await aget_object_or_404(bookings, id=booking_data.booking_id, user=user)
 
-    booking_id = booking_data.booking_id
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
-    return JSONResponse(booking)
 
 
+async def _aread_booking(user, booking_id, version):
+    booking = await aget_object_or_404(_bookings_for(booking_id), id=booking_id, user=user)
+    if version != booking.version:
+        raise HttpError(409, "Booking was changed by another request; reload and retry")
+    return booking
 
-@router.put("/bookings/update/", response={200: BookingOut})
-def update_booking(request, booking_data: BookingCreate):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
 
-    # Extract booking_id from the request body
-    booking_id = booking_data.booking_id
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
-
-    # Update fields
-    booking.service_type = booking_data.service_type
-    booking.service_id = booking_data.service_id
-    booking.date = booking_data.date
-    booking.time = booking_data.time
-    booking.guests = booking_data.guests
-    booking.pickup_required = booking_data.pickup_required
-    booking.pickup_location = booking_data.pickup_location
-    booking.notes = booking_data.notes or ""
+async def _aupdate_booking(booking, **changes):
+    try:
+        return await sync_to_async(state.update_booking)(booking, **changes)
+    except state.VersionConflict:
+        raise HttpError(409, "Booking was changed by another request; reload and retry")
+    except state.InvalidTransition as e:
+        raise HttpError(409, str(e))
 
-    booking.save()
 
-    return JSONResponse(booking)
+@router.put("/bookings/update/", response={200: BookingOut})
+async def update_booking(request, booking_data: BookingUpdate):
+    user = await arequire_user(request)
+    booking = await _aread_booking(user, booking_data.booking_id, booking_data.version)
+    if booking.status == "CANCELLED":
+        raise HttpError(409, "Cancelled bookings cannot be changed")
+    if booking_data.location not in (None, booking.location):
+        raise HttpError(400, "A booking cannot move to another resort; cancel it and book again")
+
+    # One conditional UPDATE: applied only if nobody wrote the row since it was read
+    return await _aupdate_booking(
+        booking,
+        service_type=booking_data.service_type,
+        service_id=booking_data.service_id,
+        date=booking_data.date,
+        time=booking_data.time,
+        guests=booking_data.guests,
+        pickup_required=booking_data.pickup_required,
+        pickup_location=booking_data.pickup_location,
+    )
+
+
+@router.post("/bookings/cancel/", response={200: BookingOut})
+async def cancel_booking(request, booking_data: BookingCancel):
+    user = await arequire_user(request)
+    booking = await _aread_booking(user, booking_data.booking_id, booking_data.version)
+    return await _aupdate_booking(booking, status="CANCELLED")
 
 
 @router.delete("/bookings/delete/", response={204: None})
-def delete_booking(request, booking_data: BookingCreate):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
+async def delete_booking(request, booking_data: BookingLookup):
+    user = await arequire_user(request)
 
     # Extract booking_id from the request body
-    booking_id = booking_data.booking_id
-    booking = get_object_or_404(Booking, id=booking_id, user=request.user)
+    booking = await aget_object_or_404(_bookings_for(booking_data.booking_id), id=booking_data.booking_id, user=user)
 
     # Delete the booking
-    booking.delete()
-
-    return JSONResponse(status_code=204, content={"message": "Booking deleted successfully"})
+    await booking.adelete()
+    events.publish(user.pk, "booking", events.booking_event(booking_data.booking_id, "DELETED", booking.version))
+
+    return 204, None
+
+
+@router.get("/events/")
+async def booking_events(
+    request,
+    booking_id: Optional[int] = Query(None, description="Only this booking; all of the guest's bookings when omitted"),
+):
+    """
+    Server-sent events with status changes of the guest's bookings and
+    payments, replacing polling get_booking until a payment succeeds. On
+    connect the current status of the booking, or of every pending
+    booking, is sent first. Needs the ASGI application (asgi.py); WSGI
+    requests get a 501.
+    """
+    user = await arequire_user(request)
+    if not isinstance(request, ASGIRequest):
+        # WSGI drains an async iterator before sending a byte, and this one never ends
+        raise HttpError(501, "Event streams need the ASGI server; poll the booking instead.")
+    if booking_id is None:
+        shards = sharding.fan_out(Booking.objects.filter(user=user, status="PENDING"))
+    else:
+        shards = [_bookings_for(booking_id).filter(user=user, pk=booking_id)]
+        if not await shards[0].aexists():
+            raise HttpError(404, "Not Found")
+
+    async def snapshot():
+        found = []
+        for bookings in shards:
+            rows = bookings.order_by("id").values_list("id", "status", "version", "payment__tx_ref", "payment__status")
+            async for pk, status, version, tx_ref, payment_status in rows:
+                found.append(events.Event("booking", events.booking_event(pk, status, version)))
+                if tx_ref is not None:
+                    found.append(events.Event("payment", events.payment_event(pk, tx_ref, payment_status)))
+        return found
+
+    response = StreamingHttpResponse(events.astream(user.pk, snapshot, booking_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stops nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 # Function to decrypt the encrypted amount
 def decrypt_amount(encrypted_amount: str) -> float:
+    # Imported on first use so workers that never take a payment skip pycryptodome
+    from Crypto.Cipher import AES
+    from Crypto.Util.Padding import unpad
+
     try:
         # Convert hex key to bytes
         key = bytes.fromhex(DECIPH_KEY)
@@ -128,7 +309,7 @@ def decrypt_amount(encrypted_amount: str) -> float:
         cipher = AES.new(key, AES.MODE_ECB)
 
         # Decrypt and unpad the data
-        decrypted_bytes = unpad(cipher.decrypt(encrypted_bytes), BLOCK_SIZE)
+        decrypted_bytes = unpad(cipher.decrypt(encrypted_bytes), AES.block_size)
 
         # Convert the decrypted bytes back to a float
         return float(decrypted_bytes.decode('utf-8'))
@@ -138,14 +319,14 @@ def decrypt_amount(encrypted_amount: str) -> float:
 
 
 @router.post("/pay-initialize/")
-def initialize_payment(request, amount: str, currency: str = "ETB"):
+async def initialize_payment(request, amount: str, currency: str = "ETB"):
     """Initialize Chapa payment with vending machine format"""
     try:
         # Decrypt the amount (assuming you have a decrypt function)
         amount = decrypt_amount(amount)
 
         # Read the entire request body
-        body = request.data
+        body = json.loads(request.body or b"{}")
         meta = body.get("meta", {})  # Extract meta object from the body
 
         # Generate a tx_ref that is unique for each transaction
@@ -161,8 +342,10 @@ def initialize_payment(request, amount: str, currency: str = "ETB"):
             "meta": meta
         }
 
-        # Make request to Chapa API to initiate payment
-        response = requests.post(
+        import requests  # deferred: the HTTP client is only needed by the payment views
+
+        # Make request to Chapa API to initiate payment (off the event loop)
+        response = await sync_to_async(requests.post, thread_sensitive=False)(
             CHAPA_INIT_URL,
             json=payload,
             headers={
@@ -174,7 +357,7 @@ def initialize_payment(request, amount: str, currency: str = "ETB"):
         data = response.json()
         if data.get("status") == "success":
             # Save payment to the database (use tx_ref here)
-            payment = Payment.objects.create(
+            payment = await Payment.objects.acreate(
                 booking_id=meta.get("booking_id"),
                 amount=amount,
                 payment_method="CHAPA",
@@ -195,7 +378,7 @@ def initialize_payment(request, amount: str, currency: str = "ETB"):
 
 
 @router.post("/callback/")
-def payment_callback(request, chapa_signature: str = Header(None), x_chapa_signature: str = Header(None)):    
+async def payment_callback(request, chapa_signature: str = Header(None), x_chapa_signature: str = Header(None)):    
     try:
         # Get raw request body
         body_bytes = request.body
@@ -217,8 +400,10 @@ def payment_callback(request, chapa_signature: str = Header(None), x_chapa_signa
         data = json.loads(body_bytes.decode())
         tx_ref = data.get("tx_ref")
 
+        import requests
+
         # Verify transaction with Chapa
-        verify_response = requests.get(
+        verify_response = await sync_to_async(requests.get, thread_sensitive=False)(
             f"{CHAPA_VERIFY_URL}/{tx_ref}",
             headers={'Authorization': f'Bearer {CHAPA_SECRET_KEY}'}
         )
@@ -228,29 +413,33 @@ def payment_callback(request, chapa_signature: str = Header(None), x_chapa_signa
             return JsonResponse({"status": "error", "message": "Payment verification failed"}, status=400)
 
         transaction_status = verify_data.get("data", {}).get("status")
-        if transaction_status != "success":
-            return JsonResponse({"status": "error", "message": f"Transaction not successful: {transaction_status}"}, status=400)
 
         # Extract metadata (any additional data from Chapa)
         meta = verify_data.get("data", {}).get("meta", {})
         booking_id = meta.get("booking_id")
 
         # Find payment by tx_ref
-        payment = get_object_or_404(Payment, tx_ref=tx_ref)
-
-        # Update the payment status in the database after successful verification
-        payment.status = "SUCCESS"
-        payment.paid_at = timezone.now()
-        payment.save()
-
-        # Create a transaction log for the successful payment
-        TransactionLog.objects.create(
-            user=payment.booking.user,
-            event="Payment Successful",
-            amount=payment.amount,
-            metadata={"tx_ref": tx_ref, "status": transaction_status}
-        )
+        payment = await sharding.afirst(Payment.objects.select_related("booking").filter(tx_ref=tx_ref))
+        if payment is None:
+            return JsonResponse({"status": "error", "message": "Unknown transaction"}, status=404)
+
+        if transaction_status != "success":
+            # A pending transaction may still succeed; only a final answer fails the payment
+            if transaction_status in FAILED_TRANSACTION_STATUSES:
+                try:
+                    await sync_to_async(state.fail_payment)(payment, transaction_status)
+                except (state.VersionConflict, state.InvalidTransition) as e:
+                    return JsonResponse({"status": "error", "message": str(e)}, status=409)
+            return JsonResponse({"status": "error", "message": f"Transaction not successful: {transaction_status}"}, status=400)
+
+        # Mark the payment successful, confirm the booking and log the transaction
+        try:
+            settled = await sync_to_async(state.settle_payment)(payment, transaction_status)
+        except (state.VersionConflict, state.InvalidTransition) as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=409)
 
+        if not settled:
+            return JsonResponse({"status": "success", "message": "Payment already verified"})
         return JsonResponse({"status": "success", "message": "Payment verified successfully"})
 
     except Exception as e:
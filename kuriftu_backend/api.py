@@ -1,8 +1,36 @@
-from ninja import NinjaAPI
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from ninja import NinjaAPI, Query
+from ninja.errors import HttpError
+from user.auth import arequire_superuser
 from user.views import router as user_router
 from bookings.views import router as booking_router
+from .profiling import list_captures, read_capture
+from .renderers import ORJSONRenderer
 
-api = NinjaAPI(title="Kuriftu API")
+api = NinjaAPI(title="Kuriftu API", renderer=ORJSONRenderer())
 
 api.add_router("/user", user_router)
-api.add_router("/booking", booking_router)
\ No newline at end of file
+api.add_router("/booking", booking_router)
+
+
+@api.get("/health", tags=["Health"])
+async def health(request):
+    return {"status": "ok"}
+
+
+@api.get("/profiles/", tags=["Profiling"])
+async def profile_captures(request, limit: int = Query(50, ge=1, le=500)):
+    """Most recent request profiles, newest first."""
+    await arequire_superuser(request)
+    return await sync_to_async(list_captures)(limit)
+
+
+@api.get("/profiles/{name}", tags=["Profiling"])
+async def profile_capture(request, name: str):
+    """One capture as folded stacks, ready for flamegraph.pl or speedscope."""
+    await arequire_superuser(request)
+    folded = await sync_to_async(read_capture)(name)
+    if folded is None:
+        raise HttpError(404, "Capture not found")
+    return HttpResponse(folded, content_type="text/plain; charset=utf-8")
@@ -2,6 +2,10 @@
 ASGI config for kuriftu_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn kuriftu_backend.asgi:application``)
+for the booking event stream at /api/booking/events/: each open stream is
+a suspended coroutine on the event loop rather than a worker thread, which
+is what lets one process hold thousands of idle connections.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -0,0 +1,31 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def compute_etag(*parts):
+    """Strong ETag from the values that determine a response body."""
+    return quote_etag(hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest())
+
+
+def conditional(request, response, etag, last_modified=None):
+    """
+    Return a 304 when the client's If-None-Match validator still matches.
+    Otherwise stamp ETag and Last-Modified on the ninja temporal `response`
+    and return None, so the view renders as usual.
+
+    Only the ETag is checked: Last-Modified has one-second granularity, so
+    If-Modified-Since alone would answer 304 for a change made within the
+    same second as the client's copy.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    cached = get_conditional_response(request, etag=etag)
+    if cached is not None:
+        return cached
+
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    response["Cache-Control"] = "private, no-cache"
+    return None
@@ -0,0 +1,243 @@
+import asyncio
+import functools
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import AsyncToSync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+CAPTURE_HEADER = "X-Profile-Capture"
+CAPTURE_NAME = re.compile(
+    r"^(?P<taken_at>\d{8}T\d{12}Z)_(?P<method>[A-Z]+)_(?P<path>[\w.-]*)_(?P<status>\d{3})_(?P<duration_ms>\d+)ms\.folded$"
+)
+
+# Where async_to_sync waits for, and runs, the coroutine it was handed
+_ASYNC_TO_SYNC_CALL = AsyncToSync.__call__.__code__
+_ASYNC_TO_SYNC_MAIN = AsyncToSync.main_wrap.__code__
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+
+
+@functools.lru_cache(maxsize=4096)
+def _label(code):
+    # `;` separates frames in the folded format
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ",")
+
+
+def _await_chain(awaitable):
+    """Frames of a suspended coroutine chain, outermost first."""
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            return
+        yield frame
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+
+
+class StackSampler:
+    """
+    Wall-clock stack sampler for one request. A background thread reads
+    the serving thread's stack every `interval` seconds and keeps the part
+    below `anchor` (the profiling middleware's own frame), so concurrent
+    requests on the same event loop are not mixed in. While an async
+    request is suspended, its awaited coroutine chain is recorded with an
+    [await] leaf, which is where ORM calls and HTTP calls made through
+    sync_to_async show up.
+
+    Under WSGI an async view runs through async_to_sync on an event loop
+    thread of its own while the serving thread waits; whenever that loop
+    is running the view's code, the stack continues on the loop thread.
+    """
+
+    def __init__(self, anchor, thread_id, task=None, interval=0.002):
+        self.anchor = anchor
+        self.thread_id = thread_id
+        self.task = task
+        self.interval = interval
+        self.stacks = Counter()
+        self._loop = None  # (thread id, main_wrap frame) of the async_to_sync loop running the view
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stack = self._running_stack() or self._suspended_stack()
+            # A stack read while stop() runs is the middleware, not the request
+            if stack and not self._stop.is_set():
+                self.stacks[";".join(stack)] += 1
+
+    def _running_stack(self):
+        current = sys._current_frames()
+        frame = current.get(self.thread_id)
+        frames = []
+        while frame is not None:
+            if frame is self.anchor:
+                frames.reverse()
+                return [_label(f.f_code) for f in self._follow_async_to_sync(frames, current)]
+            frames.append(frame)
+            frame = frame.f_back
+        return None
+
+    def _follow_async_to_sync(self, frames, current):
+        """`frames` (outermost first), continued on the loop thread while it runs the request's coroutine."""
+        if self.task is not None:
+            return frames
+        for index, frame in enumerate(frames):
+            if frame.f_code is _ASYNC_TO_SYNC_CALL:
+                break
+        else:
+            return frames
+        if self._loop is None:
+            self._loop = self._find_loop(frame.f_locals.get("call_result"), current)
+            if self._loop is None:
+                return frames
+        thread_id, main_wrap = self._loop
+        loop_frames = []
+        frame = current.get(thread_id)
+        while frame is not None:
+            if frame is main_wrap:
+                return frames[:index + 1] + loop_frames[::-1]
+            loop_frames.append(frame)
+            frame = frame.f_back
+        # The coroutine is suspended: whatever runs is on the serving thread
+        return frames
+
+    def _find_loop(self, call_result, current):
+        """The thread whose async_to_sync coroutine reports to `call_result`, with its main_wrap frame."""
+        if call_result is None:
+            return None
+        for thread_id, frame in current.items():
+            while frame is not None and thread_id != self.thread_id:
+                if frame.f_code is _ASYNC_TO_SYNC_MAIN and frame.f_locals.get("call_result") is call_result:
+                    return thread_id, frame
+                frame = frame.f_back
+        return None
+
+    def _suspended_stack(self):
+        if self.task is None or self.task.done():
+            return None
+        frames = list(_await_chain(self.task.get_coro()))
+        for index, frame in enumerate(frames):
+            if frame is self.anchor:
+                return [_label(f.f_code) for f in frames[index + 1:]] + ["[await]"]
+        return None
+
+
+def write_capture(request, response, duration, stacks):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^\w.-]+", "-", request.path.strip("/"))[:80]
+    taken_at = timezone.now().strftime("%Y%m%dT%H%M%S%fZ")
+    name = f"{taken_at}_{request.method}_{slug}_{response.status_code}_{round(duration * 1000)}ms.folded"
+    (directory / name).write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+    keep = getattr(settings, "PROFILE_KEEP", 200)
+    for old in sorted(directory.glob("*.folded"), reverse=True)[keep:]:
+        old.unlink(missing_ok=True)
+    return name
+
+
+def list_captures(limit=50):
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    captures = []
+    for path in sorted(directory.glob("*.folded"), reverse=True)[:limit]:
+        match = CAPTURE_NAME.match(path.name)
+        if match:
+            captures.append({"name": path.name, "size": path.stat().st_size, **match.groupdict()})
+    return captures
+
+
+def read_capture(name):
+    """Folded stacks of one capture, or None. Only plain capture names are accepted."""
+    if not CAPTURE_NAME.match(name):
+        return None
+    path = profile_dir() / name
+    return path.read_text() if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """
+    Sample the call stacks of API requests and store them as folded stacks
+    (flamegraph.pl, speedscope and inferno read them as-is). A request is
+    profiled when a staff user sends `X-Profile: 1`, or at random with
+    probability settings.PROFILE_SAMPLE_RATE. Staff requests get the
+    capture name back in an X-Profile-Capture header.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = getattr(settings, "PROFILE_PATH_PREFIX", "/api/")
+        self.sample_rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0.0)
+        self.interval = getattr(settings, "PROFILE_INTERVAL", 0.002)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        requested = request.META.get(PROFILE_HEADER) == "1" and request.user.is_staff
+        if not (requested or self._sampled()):
+            return self.get_response(request)
+
+        sampler = StackSampler(sys._getframe(), threading.get_ident(), interval=self.interval).start()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            stacks = sampler.stop()
+        name = write_capture(request, response, duration, stacks)
+        if requested:
+            response[CAPTURE_HEADER] = name
+        return response
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.prefix):
+            return await self.get_response(request)
+        # Only resolve the user when asked to, so unprofiled requests pay nothing
+        requested = request.META.get(PROFILE_HEADER) == "1" and (await request.auser()).is_staff
+        if not (requested or self._sampled()):
+            return await self.get_response(request)
+
+        sampler = StackSampler(
+            sys._getframe(), threading.get_ident(), task=asyncio.current_task(), interval=self.interval,
+        ).start()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            stacks = sampler.stop()
+        name = await sync_to_async(write_capture, thread_sensitive=False)(request, response, duration, stacks)
+        if requested:
+            response[CAPTURE_HEADER] = name
+        return response
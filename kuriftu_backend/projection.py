@@ -0,0 +1,3 @@
+def schema_columns(schema, exclude=()):
+    """Column names a response schema reads, for .values()/.only() projections."""
+    return [name for name in schema.model_fields if name not in exclude]
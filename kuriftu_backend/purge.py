@@ -0,0 +1,13 @@
+def delete_in_batches(queryset, batch_size=1000):
+    """
+    Delete the rows of `queryset` `batch_size` at a time, so no single
+    DELETE holds the write lock for long. Returns the number of rows deleted.
+    """
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    rows = queryset.model._default_manager.using(queryset.db)
+    deleted = 0
+    while True:
+        batch = list(ids[:batch_size])
+        if not batch:
+            return deleted
+        deleted += rows.filter(pk__in=batch).delete()[0]
@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import math
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.http import JsonResponse
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+CACHE_ALIAS = "default"
+# Backends whose add() and incr() are atomic across worker processes
+SHARED_CACHES = ("RedisCache", "PyMemcacheCache", "PyLibMCCache")
+
+
+def parse_rate(rate):
+    """'5/m' -> (limit 5, period 60 seconds)."""
+    count, period = rate.split("/")
+    return int(count), PERIODS[period[0].lower()]
+
+
+def client_ip(request, *args, **kwargs):
+    """
+    The client's address: REMOTE_ADDR, or with settings.TRUSTED_PROXY_COUNT
+    proxies in front of the app, the X-Forwarded-For entry the outermost
+    of them appended. Entries further left come from the client and
+    cannot be trusted.
+    """
+    proxies = getattr(settings, "TRUSTED_PROXY_COUNT", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[-min(proxies, len(addresses))] or "unknown"
+    return request.META.get("REMOTE_ADDR") or "unknown"
+
+
+def body_email(request, data=None, *args, **kwargs):
+    email = getattr(data, "email", None)
+    return email.strip().lower() if email else None
+
+
+class SlidingWindow:
+    """
+    Sliding window counter in the Django cache. Requests are counted per
+    fixed window of one period with atomic add() and incr(), and the
+    previous window's count is weighted by how much of it still overlaps
+    the last period. No read-modify-write, so concurrent workers sharing
+    the cache never let more through than the rate.
+    """
+
+    def __init__(self, scope, rate, cache_alias=CACHE_ALIAS):
+        self.scope = scope
+        self.limit, self.period = parse_rate(rate)
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _keys(self, key, now):
+        window = int(now // self.period)
+        return f"ratelimit:{self.scope}:{key}:{window}", f"ratelimit:{self.scope}:{key}:{window - 1}"
+
+    def _verdict(self, count, previous, now):
+        """(allowed, retry_after_seconds) for a window count that includes this request."""
+        elapsed = now % self.period
+        if count + previous * (1 - elapsed / self.period) <= self.limit:
+            return True, 0
+        # Wait until the previous window's share has shrunk enough, or for the next window
+        spare = self.limit - count
+        if previous and spare >= 0:
+            wait = (1 - spare / previous) * self.period - elapsed
+        else:
+            wait = self.period - elapsed
+        return False, max(1, math.ceil(wait))
+
+    def consume(self, key, now=None):
+        """Count a request for `key`. Returns (allowed, retry_after_seconds)."""
+        now = time.time() if now is None else now
+        current, previous = self._keys(key, now)
+        self.cache.add(current, 0, 2 * self.period)
+        try:
+            count = self.cache.incr(current)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.add(current, 1, 2 * self.period)
+            count = 1
+        allowed, retry_after = self._verdict(count, self.cache.get(previous, 0), now)
+        if not allowed:
+            # Rejected requests do not use up the allowance
+            self.cache.decr(current)
+        return allowed, retry_after
+
+    async def aconsume(self, key, now=None):
+        now = time.time() if now is None else now
+        current, previous = self._keys(key, now)
+        await self.cache.aadd(current, 0, 2 * self.period)
+        try:
+            count = await self.cache.aincr(current)
+        except ValueError:
+            await self.cache.aadd(current, 1, 2 * self.period)
+            count = 1
+        allowed, retry_after = self._verdict(count, await self.cache.aget(previous, 0), now)
+        if not allowed:
+            await self.cache.adecr(current)
+        return allowed, retry_after
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    """Deploy check: per-process caches give every worker its own allowance."""
+    backend = settings.CACHES.get(CACHE_ALIAS, {}).get("BACKEND", "")
+    if backend.rsplit(".", 1)[-1] in SHARED_CACHES:
+        return []
+    return [checks.Warning(
+        f"Rate limits use the {backend or 'default'} cache, which is not shared between workers, "
+        "so each process enforces its own limit.",
+        hint="Set REDIS_URL so rate limits are counted in a shared cache.",
+        id="kuriftu.W001",
+    )]
+
+
+def _too_many_requests(retry_after):
+    response = JsonResponse({"detail": "Too many requests. Try again later."}, status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def rate_limit(scope, rate, key=client_ip):
+    """
+    Ninja route decorator. Place it under the @router decorator; the key
+    function receives the same arguments as the view. Rejected calls
+    return 429 before the view body runs.
+    """
+    bucket = SlidingWindow(scope, rate)
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                bucket_key = key(request, *args, **kwargs)
+                if bucket_key is not None:
+                    allowed, retry_after = await bucket.aconsume(bucket_key)
+                    if not allowed:
+                        return _too_many_requests(retry_after)
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            bucket_key = key(request, *args, **kwargs)
+            if bucket_key is not None:
+                allowed, retry_after = bucket.consume(bucket_key)
+                if not allowed:
+                    return _too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,37 @@
+from decimal import Decimal
+
+from ninja.renderers import BaseRenderer, JSONRenderer
+from ninja.responses import NinjaJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to ninja's stdlib encoder
+    orjson = None
+
+
+_encoder = NinjaJSONEncoder()
+
+
+def _default(value):
+    # Types orjson doesn't encode natively
+    if isinstance(value, Decimal):
+        return float(value)
+    # Schemas, lazy strings, URLs, ... as ninja encodes them; TypeError for anything else
+    return _encoder.default(value)
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Renders responses with orjson, which encodes dates, datetimes and UUIDs
+    natively in C. Falls back to ninja's JSONRenderer when orjson is not
+    installed.
+    """
+    media_type = "application/json"
+
+    def __init__(self):
+        self._fallback = None if orjson else JSONRenderer()
+
+    def render(self, request, data, *, response_status):
+        if self._fallback is not None:
+            return self._fallback.render(request, data, response_status=response_status)
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
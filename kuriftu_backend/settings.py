@@ -10,8 +10,14 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+# Loaded once here; app modules read the environment with os.getenv()
+load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,16 +48,63 @@ INSTALLED_APPS = [
     
 ]
 
+# API-only workers (API_ONLY=1) leave out the admin site: no admin.py
+# autodiscovery at startup and no /admin/ routes.
+API_ONLY = os.getenv("API_ONLY", "").lower() in ("1", "true", "yes")
+if API_ONLY:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookings.idempotency.IdempotencyMiddleware',
+    'kuriftu_backend.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# POST endpoints that replay their first response for a repeated Idempotency-Key
+IDEMPOTENT_PATHS = [
+    '/api/booking/bookings/',
+    '/api/booking/pay-initialize/',
+]
+
+# Stack profiles of API requests: staff send `X-Profile: 1` to profile one
+# request; PROFILE_SAMPLE_RATE profiles that fraction of all API traffic.
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = 200
+
+# Booking status streams (GET /api/booking/events/): an SSE comment every
+# EVENTS_HEARTBEAT_SECONDS keeps idle connections open through proxies.
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_QUEUE_SIZE = 100
+EVENTS_RETRY_MS = 3000
+
+# Rate limits (kuriftu_backend/ratelimit.py) count requests in the default
+# cache. Set REDIS_URL in production so every worker shares one count; the
+# local-memory fallback gives each process its own allowance.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Reverse proxies in front of the app that append the client address to
+# X-Forwarded-For; 0 means clients connect directly and REMOTE_ADDR is used.
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
 ROOT_URLCONF = 'kuriftu_backend.urls'
 
 TEMPLATES = [
@@ -82,6 +135,21 @@ DATABASES = {
     }
 }
 
+# Per-resort booking databases (RESORT_SHARDS=1): each resort's bookings,
+# payments and transaction logs go to their own SQLite file, see
+# bookings.sharding. Resorts left out stay in the default database.
+# Run `manage.py migrate_resorts` after `migrate` to set up the files.
+RESORT_DATABASES = {}
+if os.getenv("RESORT_SHARDS", "").lower() in ("1", "true", "yes"):
+    for resort in ("bishoftu", "entoto", "lake_tana", "awash"):
+        DATABASES[f'resort_{resort}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db_{resort}.sqlite3',
+        }
+        RESORT_DATABASES[resort] = f'resort_{resort}'
+
+DATABASE_ROUTERS = ['bookings.sharding.ResortRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -101,6 +169,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password reset codes: "token" mails a signed code that expires after
+# PASSWORD_RESET_TIMEOUT seconds and stores nothing; "code" keeps the
+# legacy PasswordResetCode rows (see user/resets.py).
+PASSWORD_RESET_MODE = os.getenv("PASSWORD_RESET_MODE", "token")
+PASSWORD_RESET_TIMEOUT = 30 * 60
+
+# Keys the permutation behind referral codes (user/referrals.py). Keep it
+# fixed once codes are issued, also when SECRET_KEY is rotated.
+REFERRAL_CODE_KEY = os.getenv("REFERRAL_CODE_KEY", SECRET_KEY)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -126,15 +204,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'user.User'
 
+# Same checks as ModelBackend; the async path hashes off the event loop
+AUTHENTICATION_BACKENDS = ['user.auth.EmailBackend']
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 
-from dotenv import load_dotenv
-import os
-load_dotenv()
-
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
\ No newline at end of file
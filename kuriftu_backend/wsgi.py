@@ -2,6 +2,10 @@
 WSGI config for kuriftu_backend project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+The API views are async, so under WSGI each request is run through
+async_to_sync on a thread of its own, and the booking event stream cannot
+be served at all. Deploy with kuriftu_backend.asgi; WSGI (and runserver)
+remains for development and the admin.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
@@ -1,5 +1,58 @@
 from django.contrib import admin
-from .models import User
 
-# Register your models here.
-admin.site.register(User)
\ No newline at end of file
+from kuriftu_backend.changelists import LargeTableAdmin
+from .models import User, Tier, AccountDeletion, LotteryCampaign, LotteryPrize
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ("id", "email", "first_name", "last_name", "tier", "points", "is_active", "is_staff", "date_joined")
+    list_filter = ("is_active", "is_staff")
+    list_select_related = ("tier",)
+    autocomplete_fields = ("tier",)
+    raw_id_fields = ("referred_by",)
+    date_hierarchy = "date_joined"
+    search_fields = ("id", "email", "referral_code")
+
+
+@admin.register(Tier)
+class TierAdmin(admin.ModelAdmin):
+    list_display = ("name", "updated_at")
+    search_fields = ("name",)
+
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(LargeTableAdmin):
+    list_display = ("id", "email", "user_id", "status", "rows_deleted", "requested_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("user_id", "email")
+    readonly_fields = ("rows_deleted", "error", "requested_at", "updated_at", "finished_at")
+
+
+class LotteryPrizeInline(admin.TabularInline):
+    model = LotteryPrize
+    extra = 0
+
+
+@admin.register(LotteryCampaign)
+class LotteryCampaignAdmin(admin.ModelAdmin):
+    list_display = ("name", "cost_points", "miss_weight", "is_active", "starts_at", "ends_at", "prize_version")
+    list_filter = ("is_active",)
+    search_fields = ("name",)
+    readonly_fields = ("prize_version",)
+    inlines = (LotteryPrizeInline,)
+
+
+@admin.register(LotteryPrize)
+class LotteryPrizeAdmin(admin.ModelAdmin):
+    list_display = ("name", "campaign", "weight", "remaining", "points_award")
+    list_filter = ("campaign",)
+    list_select_related = ("campaign",)
+    search_fields = ("name", "campaign__name")
+
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip LotteryPrize.delete, so rebuild the campaigns' alias tables here
+        campaigns = list(LotteryCampaign.objects.filter(prizes__in=queryset).distinct())
+        super().delete_queryset(request, queryset)
+        for campaign in campaigns:
+            campaign.bump_prize_version()
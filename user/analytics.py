@@ -0,0 +1,166 @@
+from array import array
+from collections import namedtuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import CharField
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from .models import EngagementLog, User
+
+# Signup cohorts are calendar months of User.date_joined; period k of a
+# cohort is the k-th month after signup. Every source is read as compact
+# (user id, code, day number) columns into NumPy arrays, and the matrices
+# come from bincounts over integer keys instead of per-row Python loops.
+BOOKINGS = "bookings"
+METRICS = (BOOKINGS, *(action for action, _ in EngagementLog.ACTION_CHOICES))
+CACHE_TTL = 24 * 3600
+CHUNK_SIZE = 5000
+
+CohortReport = namedtuple(
+    "CohortReport", ["generated_on", "cohorts", "sizes", "periods", "repeat_booking_rate", "metrics"],
+)
+CohortMetric = namedtuple("CohortMetric", ["active", "retention"])
+
+
+def _stamp(field):
+    """
+    A datetime column as 'YYYY-MM-DD HH:MM:SS' text in the database's time
+    zone (UTC). Reading text skips Django's per-row datetime conversion,
+    and TruncDate, which runs as a Python function per row on SQLite.
+    """
+    return Substr(Cast(field, CharField()), 1, 19)
+
+
+def _days(stamps):
+    """_stamp() texts -> local day numbers (days since 1970-01-01)."""
+    seconds = np.array(stamps, dtype="datetime64[s]").astype(np.int64)
+    # The current zone's present offset: exact for zones without DST, like Africa/Addis_Ababa
+    offset = int(timezone.localtime().utcoffset().total_seconds())
+    return (seconds + offset) // 86400
+
+
+def _months(days):
+    """Days since 1970-01-01 -> months since January 1970."""
+    return days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _columns(rows, codes=None):
+    """
+    (user id, stamp) rows, or (user id, value, stamp) rows with `codes`
+    mapping each value to a small int -> arrays of user ids, codes and day
+    numbers. Stamps are parsed by NumPy one chunk at a time.
+    """
+    users, kinds, days = array("q"), array("b"), array("q")
+    stamps = []
+    for row in rows:
+        users.append(row[0])
+        if codes is not None:
+            kinds.append(codes[row[1]])
+        stamps.append(row[-1])
+        if len(stamps) == CHUNK_SIZE:
+            days.frombytes(_days(stamps).tobytes())
+            stamps.clear()
+    if stamps:
+        days.frombytes(_days(stamps).tobytes())
+    return np.frombuffer(users, np.int64), np.frombuffer(kinds, np.int8), np.frombuffer(days, np.int64)
+
+
+def load_signups():
+    """User ids (ascending) and their signup month."""
+    rows = User.objects.order_by("id").values_list("id", _stamp("date_joined"))
+    users, _, days = _columns(rows.iterator(chunk_size=CHUNK_SIZE))
+    return users, _months(days)
+
+
+def load_engagement():
+    codes = {action: code for code, action in enumerate(METRICS)}
+    rows = EngagementLog.objects.filter(action__in=METRICS[1:]).values_list("user_id", "action", _stamp("timestamp"))
+    return _columns(rows.iterator(chunk_size=CHUNK_SIZE), codes)
+
+
+def load_bookings():
+    from bookings.models import Booking
+    from bookings.sharding import fan_out
+
+    parts = [
+        _columns(rows.iterator(chunk_size=CHUNK_SIZE))
+        for rows in fan_out(Booking.objects.exclude(status="CANCELLED").values_list("user_id", _stamp("created_at")))
+    ]
+    return tuple(np.concatenate(column) for column in zip(*parts))
+
+
+def _positions(user_ids, users):
+    """Index of each of `users` in the sorted `user_ids`, and which were found."""
+    position = np.searchsorted(user_ids, users)
+    position[position == len(user_ids)] = 0
+    known = user_ids[position] == users if len(user_ids) else np.zeros(len(users), bool)
+    return position[known], known
+
+
+def cohort_report(today, months=12, periods=12, signups=None, engagement=None, bookings=None):
+    """
+    Cohort sizes and per-metric retention for the `months` signup cohorts
+    up to `today`'s month. Cells of periods that have not happened yet are
+    None. The loaders can be passed in as arrays, e.g. for benchmarks.
+    """
+    user_ids, cohort_month = signups or load_signups()
+    event_users, event_codes, event_days = engagement or load_engagement()
+    booking_users, _, booking_days = bookings or load_bookings()
+
+    current = (today.year - 1970) * 12 + today.month - 1
+    first = current - months + 1
+    in_window = (cohort_month >= first) & (cohort_month <= current)
+    user_ids, cohort = user_ids[in_window], cohort_month[in_window] - first
+    sizes = np.bincount(cohort, minlength=months)
+
+    # Period k of cohort c is still ahead when c + k lies past this month
+    elapsed = (np.arange(months)[:, None] + np.arange(periods)[None, :]) < months
+
+    def active_matrix(users, days):
+        position, known = _positions(user_ids, users)
+        period = _months(days[known]) - (cohort[position] + first)
+        keep = (period >= 0) & (period < periods)
+        # Count each user once per period
+        keys = np.unique(position[keep] * periods + period[keep])
+        counts = np.bincount(cohort[keys // periods] * periods + keys % periods, minlength=months * periods)
+        return counts.reshape(months, periods)
+
+    def metric(active):
+        retention = active / np.maximum(sizes, 1)[:, None]
+        return CohortMetric(
+            [[int(n) if ok else None for n, ok in zip(row, flags)] for row, flags in zip(active, elapsed)],
+            [[round(float(r), 4) if ok else None for r, ok in zip(row, flags)] for row, flags in zip(retention, elapsed)],
+        )
+
+    metrics = {BOOKINGS: metric(active_matrix(booking_users, booking_days))}
+    for code, action in enumerate(METRICS[1:], 1):
+        chosen = event_codes == code
+        metrics[action] = metric(active_matrix(event_users[chosen], event_days[chosen]))
+
+    # Share of each cohort with at least two bookings so far
+    position, _ = _positions(user_ids, booking_users)
+    per_user = np.bincount(position, minlength=len(user_ids))
+    repeaters = np.bincount(cohort[per_user >= 2], minlength=months)
+    repeat_rate = repeaters / np.maximum(sizes, 1)
+
+    return CohortReport(
+        today,
+        [f"{(first + c) // 12 + 1970:04d}-{(first + c) % 12 + 1:02d}" for c in range(months)],
+        [int(n) for n in sizes],
+        periods,
+        [round(float(r), 4) for r in repeat_rate],
+        metrics,
+    )
+
+
+def cached_cohort_report(months=12, periods=12):
+    """cohort_report() computed at most once per day for each shape."""
+    today = timezone.localdate()
+    key = f"analytics:cohorts:{today.isoformat()}:{months}:{periods}"
+    report = cache.get(key)
+    if report is None:
+        report = cohort_report(today, months, periods)
+        cache.set(key, report, CACHE_TTL)
+    return report
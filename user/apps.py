@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        from django.core import checks
+        from django.db.models.signals import post_delete, post_save
+
+        from bookings.models import Booking
+        from kuriftu_backend.ratelimit import check_shared_cache
+        from . import search
+        from .models import User
+
+        checks.register(check_shared_cache, checks.Tags.caches, deploy=True)
+
+        post_save.connect(search.user_saved, sender=User, dispatch_uid="search_user_saved")
+        post_delete.connect(search.user_deleted, sender=User, dispatch_uid="search_user_deleted")
+        post_save.connect(search.booking_saved, sender=Booking, dispatch_uid="search_booking_saved")
+        post_delete.connect(search.booking_deleted, sender=Booking, dispatch_uid="search_booking_deleted")
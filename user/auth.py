@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from ninja.errors import HttpError
+
+from .hashing import acheck_user_password, amake_password
+
+
+class EmailBackend(ModelBackend):
+    """
+    ModelBackend whose async path hashes in the password pool, so
+    aauthenticate() keeps the event loop free and still runs through
+    AUTHENTICATION_BACKENDS and the user_login_failed signal.
+    """
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        User = get_user_model()
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = await User._default_manager.filter(
+            **{User.USERNAME_FIELD: User._default_manager.normalize_email(username)}
+        ).afirst()
+        if user is None:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            await amake_password(password)
+            return None
+        if await acheck_user_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+async def arequire_user(request):
+    """Async replacement for the `request.user.is_authenticated` guard."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise HttpError(401, "Authentication required")
+    return user
+
+
+async def arequire_staff(request):
+    user = await arequire_user(request)
+    if not user.is_staff:
+        raise HttpError(403, "Staff only")
+    return user
+
+
+async def arequire_superuser(request):
+    user = await arequire_user(request)
+    if not user.is_superuser:
+        raise HttpError(403, "Admins only")
+    return user
@@ -0,0 +1,154 @@
+import threading
+
+from django.db import connection, connections, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AccountDeletion, User
+from .search import unindex_user
+
+DELETE_BATCH_SIZE = 500
+
+
+def schedule_account_deletion(user):
+    """
+    Deactivate the account right away and queue the heavy cascade for a
+    background worker. The worker is started once the surrounding
+    transaction has committed.
+    """
+    User.objects.filter(pk=user.pk).update(is_active=False)
+    job = AccountDeletion.objects.create(user_id=user.pk, email=user.email)
+    transaction.on_commit(lambda: start_account_deletion(job.pk))
+    return job
+
+
+def start_account_deletion(job_id):
+    thread = threading.Thread(target=run_account_deletion, args=(job_id,), daemon=True)
+    thread.start()
+    return thread
+
+
+def run_account_deletion(job_id):
+    """
+    Delete everything hanging off the user with raw batched statements,
+    bypassing Django's deletion collector. Each statement touches at most
+    DELETE_BATCH_SIZE rows and commits on its own, so the SQLite write lock
+    is only ever held briefly and a crashed job can simply be re-run.
+    """
+    claimed = AccountDeletion.objects.filter(
+        pk=job_id,
+        status__in=[AccountDeletion.STATUS_PENDING, AccountDeletion.STATUS_FAILED],
+    ).update(status=AccountDeletion.STATUS_RUNNING, error="", updated_at=timezone.now())
+    if not claimed:
+        return
+
+    try:
+        from bookings.availability import release_user_slots
+        from bookings.models import Booking
+        from bookings.sharding import fan_out
+
+        job = AccountDeletion.objects.get(pk=job_id)
+        # The raw purge below skips Booking.delete() and delete signals, so
+        # free the user's calendar slots and search rows first
+        release_user_slots(job.user_id)
+        unindex_user(job.user_id, [
+            pk for bookings in fan_out(Booking.objects.filter(user_id=job.user_id))
+            for pk in bookings.values_list("id", flat=True)
+        ])
+        with connection.cursor() as cursor:
+            _purge_dependents(cursor, User, [job.user_id], job_id)
+            _delete_rows(cursor, User, [job.user_id], job_id)
+        AccountDeletion.objects.filter(pk=job_id).update(
+            status=AccountDeletion.STATUS_DONE,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+    except Exception as e:
+        AccountDeletion.objects.filter(pk=job_id).update(
+            status=AccountDeletion.STATUS_FAILED,
+            error=str(e),
+            updated_at=timezone.now(),
+        )
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def _dependents(model):
+    """Yield (on_delete, model, column) for every table pointing at `model`."""
+    for rel in model._meta.related_objects:
+        if rel.many_to_many:
+            if rel.through._meta.auto_created:
+                yield models.CASCADE, rel.through, rel.field.m2m_reverse_name()
+            continue
+        yield rel.on_delete, rel.related_model, rel.field.column
+
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        if through._meta.auto_created:
+            yield models.CASCADE, through, field.m2m_column_name()
+
+
+def _cursors(cursor, model, related_model):
+    """Cursors over the databases holding `related_model` rows that point at `model` rows."""
+    from bookings.sharding import is_sharded, shard_aliases
+
+    if is_sharded(model) or not is_sharded(related_model):
+        yield cursor
+        return
+    # A user's bookings, payments and logs may be in any resort database
+    for alias in shard_aliases():
+        with connections[alias].cursor() as shard_cursor:
+            yield shard_cursor
+
+
+def _purge_dependents(cursor, model, ids, job_id):
+    for on_delete, related_model, column in _dependents(model):
+        for related_cursor in _cursors(cursor, model, related_model):
+            if on_delete is models.CASCADE:
+                _purge(related_cursor, related_model, column, ids, job_id)
+            elif on_delete is models.SET_NULL:
+                _nullify(related_cursor, related_model, column, ids)
+
+
+def _purge(cursor, model, column, ids, job_id):
+    qn = cursor.db.ops.quote_name
+    table, pk = qn(model._meta.db_table), qn(model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    select_sql = f"SELECT {pk} FROM {table} WHERE {qn(column)} IN ({placeholders}) LIMIT %s"
+
+    while True:
+        cursor.execute(select_sql, [*ids, DELETE_BATCH_SIZE])
+        batch = [row[0] for row in cursor.fetchall()]
+        if not batch:
+            return
+        _purge_dependents(cursor, model, batch, job_id)
+        _delete_rows(cursor, model, batch, job_id)
+
+
+def _delete_rows(cursor, model, ids, job_id):
+    qn = cursor.db.ops.quote_name
+    placeholders = ", ".join(["%s"] * len(ids))
+    cursor.execute(
+        f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({placeholders})",
+        ids,
+    )
+    if cursor.rowcount:
+        AccountDeletion.objects.filter(pk=job_id).update(
+            rows_deleted=F("rows_deleted") + cursor.rowcount,
+            updated_at=timezone.now(),
+        )
+
+
+def _nullify(cursor, model, column, ids):
+    qn = cursor.db.ops.quote_name
+    table, pk, col = qn(model._meta.db_table), qn(model._meta.pk.column), qn(column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    update_sql = (
+        f"UPDATE {table} SET {col} = NULL WHERE {pk} IN "
+        f"(SELECT {pk} FROM {table} WHERE {col} IN ({placeholders}) LIMIT %s)"
+    )
+    while True:
+        cursor.execute(update_sql, [*ids, DELETE_BATCH_SIZE])
+        if not cursor.rowcount:
+            return
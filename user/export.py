@@ -0,0 +1,117 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import EngagementLog
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def _line(kind, data):
+    return json.dumps({"type": kind, "data": data}, cls=DjangoJSONEncoder) + "\n"
+
+
+def _profile(user):
+    return {
+        "id": user.id,
+        "email": user.email,
+        "first_name": user.first_name,
+        "middle_name": user.middle_name,
+        "last_name": user.last_name,
+        "birthdate": user.birthdate,
+        "points": user.points,
+        "total_spent": user.total_spent,
+        "referral_code": user.referral_code,
+        "preferred_location": user.preferred_location,
+        "date_joined": user.date_joined,
+    }
+
+
+def _booking(booking):
+    return {
+        "id": booking.id,
+        "service_type": booking.service_type,
+        "service_id": booking.service_id,
+        "date": booking.date,
+        "time": booking.time,
+        "guests": booking.guests,
+        "pickup_required": booking.pickup_required,
+        "pickup_location": booking.pickup_location,
+        "discount_applied": booking.discount_applied,
+        "discount_amount": booking.discount_amount,
+        "status": booking.status,
+        "created_at": booking.created_at,
+    }
+
+
+def _payment(payment):
+    return {
+        "id": payment.id,
+        "booking_id": payment.booking_id,
+        "service_type": payment.booking.service_type,
+        "amount": payment.amount,
+        "payment_method": payment.payment_method,
+        "status": payment.status,
+        "paid_at": payment.paid_at,
+        "tx_ref": payment.tx_ref,
+    }
+
+
+def _transaction(log):
+    return {
+        "id": log.id,
+        "event": log.event,
+        "amount": log.amount,
+        "timestamp": log.timestamp,
+        "metadata": log.metadata,
+    }
+
+
+def _engagement(log):
+    return {
+        "id": log.id,
+        "action": log.action,
+        "timestamp": log.timestamp,
+        "metadata": log.metadata,
+    }
+
+
+def _sections(user):
+    from bookings.models import Booking, Payment, TransactionLog
+    from bookings.sharding import fan_out
+
+    # Booking history may be spread over per-resort databases: one section per database
+    return [
+        *(("booking", bookings, _booking) for bookings in fan_out(Booking.objects.filter(user=user).order_by("id"))),
+        *(
+            ("payment", payments, _payment)
+            for payments in fan_out(
+                Payment.objects.filter(booking__user=user).select_related("booking").order_by("id")
+            )
+        ),
+        *(
+            ("transaction", logs, _transaction)
+            for logs in fan_out(TransactionLog.objects.filter(user=user).order_by("id"))
+        ),
+        ("engagement", EngagementLog.objects.filter(user=user).order_by("id"), _engagement),
+    ]
+
+
+def iter_user_export(user):
+    """
+    Yield the user's full history as NDJSON lines.
+    Every queryset is consumed with .iterator() so only one chunk of rows
+    is held in memory at a time, however long the history is.
+    """
+    yield _line("profile", _profile(user))
+    for kind, queryset, serialize in _sections(user):
+        for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield _line(kind, serialize(row))
+
+
+async def aiter_user_export(user):
+    """iter_user_export() for async views, streaming from .aiterator()."""
+    yield _line("profile", _profile(user))
+    for kind, queryset, serialize in _sections(user):
+        async for row in queryset.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield _line(kind, serialize(row))
@@ -0,0 +1,42 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+_executor = None
+
+
+def get_hash_executor():
+    """
+    Bounded pool for password hashing. hashlib's PBKDF2 releases the GIL,
+    so these threads hash in parallel while the event loop keeps serving
+    other requests.
+    """
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, "PASSWORD_HASH_WORKERS", None) or os.cpu_count() or 2
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+    return _executor
+
+
+async def run_hasher(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def amake_password(raw_password):
+    return await run_hasher(make_password, raw_password)
+
+
+async def acheck_user_password(user, raw_password):
+    """Async check_password() that keeps the hasher off the event loop."""
+    upgraded = []
+    is_correct = await run_hasher(check_password, raw_password, user.password, upgraded.append)
+    if upgraded:
+        # Hasher settings changed since this hash was stored: rehash and persist
+        user.password = await amake_password(raw_password)
+        await user.asave(update_fields=["password"])
+    return is_correct
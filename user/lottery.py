@@ -0,0 +1,156 @@
+import random
+import threading
+from collections import namedtuple
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from .models import EngagementLog, LotteryCampaign, LotteryPrize, User
+
+_rng = random.SystemRandom()
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+class LotteryError(Exception):
+    pass
+
+
+DrawnPrize = namedtuple("DrawnPrize", ["id", "name", "points_award", "limited"])
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table: O(n) to build, O(1) per draw.
+    Outcomes are DrawnPrize tuples, with None standing for "no prize".
+    """
+    __slots__ = ("outcomes", "prob", "alias", "size")
+
+    def __init__(self, outcomes, weights):
+        size = len(outcomes)
+        total = sum(weights)
+        self.outcomes = list(outcomes)
+        self.size = size
+        self.prob = [1.0] * size
+        self.alias = list(range(size))
+        if not size or not total:
+            return
+
+        scaled = [w * size / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+
+    def draw(self, rng=_rng):
+        if not self.size:
+            return None
+        column = int(rng.random() * self.size)
+        if rng.random() < self.prob[column]:
+            return self.outcomes[column]
+        return self.outcomes[self.alias[column]]
+
+
+def build_prize_table(campaign):
+    prizes = (
+        LotteryPrize.objects.filter(campaign=campaign, weight__gt=0)
+        .exclude(remaining=0)
+        .values_list("id", "name", "points_award", "remaining", "weight")
+    )
+    outcomes, weights = [], []
+    for prize_id, name, points_award, remaining, weight in prizes:
+        outcomes.append(DrawnPrize(prize_id, name, points_award, remaining is not None))
+        weights.append(weight)
+    if campaign.miss_weight:
+        outcomes.append(None)
+        weights.append(campaign.miss_weight)
+    return AliasTable(outcomes, weights)
+
+
+def get_prize_table(campaign):
+    """Return the cached alias table for the campaign, rebuilding it when its prizes changed."""
+    cached = _tables.get(campaign.pk)
+    if cached and cached[0] == campaign.prize_version:
+        return cached[1]
+    with _tables_lock:
+        cached = _tables.get(campaign.pk)
+        if cached and cached[0] == campaign.prize_version:
+            return cached[1]
+        table = build_prize_table(campaign)
+        _tables[campaign.pk] = (campaign.prize_version, table)
+        return table
+
+
+def active_campaigns():
+    now = timezone.now()
+    return (
+        LotteryCampaign.objects.filter(is_active=True)
+        .exclude(starts_at__gt=now)
+        .exclude(ends_at__lt=now)
+    )
+
+
+async def aget_active_campaign(campaign_id):
+    return await active_campaigns().filter(pk=campaign_id).afirst()
+
+
+def draw_prize(campaign):
+    """
+    Draw an outcome and claim one of a limited prize. A prize sold out since
+    the cached table was built is dropped from a rebuilt table and the draw
+    repeated, so sold-out prizes never turn into extra misses.
+    """
+    while True:
+        prize = get_prize_table(campaign).draw()
+        if prize is None or not prize.limited:
+            return prize
+        claimed = LotteryPrize.objects.filter(pk=prize.id, remaining__gt=0).update(
+            remaining=models.F("remaining") - 1
+        )
+        if claimed:
+            return prize
+        campaign.bump_prize_version()
+        campaign.refresh_from_db(fields=["prize_version"])
+
+
+def play(user, campaign):
+    """
+    Play one round. The points debit and the prize claim are single
+    conditional UPDATEs, so concurrent plays never oversell inventory or
+    drive a balance negative, and no row is read before being written.
+    """
+    with transaction.atomic():
+        if campaign.cost_points:
+            debited = User.objects.filter(pk=user.pk, points__gte=campaign.cost_points).update(
+                points=models.F("points") - campaign.cost_points, updated_at=timezone.now()
+            )
+            if not debited:
+                raise LotteryError("Not enough points to play.")
+
+        prize = draw_prize(campaign)
+
+        if prize and prize.points_award:
+            User.objects.filter(pk=user.pk).update(
+                points=models.F("points") + prize.points_award, updated_at=timezone.now()
+            )
+
+        EngagementLog.objects.create(
+            user_id=user.pk,
+            action=EngagementLog.ACTION_LOTTERY,
+            metadata={
+                "campaign_id": campaign.pk,
+                "prize_id": prize.id if prize else None,
+                "prize": prize.name if prize else None,
+                "cost_points": campaign.cost_points,
+            },
+        )
+
+    return {
+        "won": prize is not None,
+        "prize": prize.name if prize else None,
+        "points_awarded": prize.points_award if prize else 0,
+    }
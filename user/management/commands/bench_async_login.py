@@ -0,0 +1,78 @@
+import asyncio
+import statistics
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+
+from user.models import User
+
+BENCH_PASSWORD = "bench-password-123"
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Compare /api/health latency while logins run through the sync and async login paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=32)
+        parser.add_argument("--probes", type=int, default=200)
+
+    def handle(self, *args, **options):
+        # One account per login so the per-email rate limit doesn't skew the run
+        emails = [f"login-bench-{i}@example.com" for i in range(options["logins"])]
+        password = make_password(BENCH_PASSWORD)
+        User.objects.filter(email__in=emails).delete()
+        User.objects.bulk_create([User(email=email, password=password, referral_code=None) for email in emails])
+        try:
+            for label, login in (("idle", None), ("sync", self._sync_login), ("async", self._async_login)):
+                result = asyncio.run(self._scenario(emails, login, options["probes"]))
+                self.stdout.write(
+                    f"{label:>5}: health p50 {result['p50']:.2f} ms, p99 {result['p99']:.2f} ms"
+                    + (f", {len(emails)} logins in {result['login_time']:.2f} s" if login else "")
+                )
+        finally:
+            User.objects.filter(email__in=emails).delete()
+
+    async def _sync_login(self, client, email):
+        # What the old sync view does under ASGI: one thread-sensitive hop per request
+        await sync_to_async(authenticate)(None, email=email, password=BENCH_PASSWORD)
+
+    async def _async_login(self, client, email):
+        response = await client.post(
+            "/api/user/login", {"email": email, "password": BENCH_PASSWORD},
+            content_type="application/json", REMOTE_ADDR=f"10.0.{abs(hash(email)) % 250}.1",
+        )
+        assert response.status_code == 200, response.status_code
+
+    async def _scenario(self, emails, login, probes):
+        latencies = []
+
+        async def probe():
+            client = AsyncClient(SERVER_NAME="localhost")
+            for _ in range(probes):
+                start = time.perf_counter()
+                await client.get("/api/health")
+                latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0)
+
+        async def run_logins():
+            if login is None:
+                return 0.0
+            start = time.perf_counter()
+            await asyncio.gather(*(login(AsyncClient(SERVER_NAME="localhost"), email) for email in emails))
+            return time.perf_counter() - start
+
+        login_time, _ = await asyncio.gather(run_logins(), probe())
+        return {
+            "p50": statistics.median(latencies),
+            "p99": _percentile(latencies, 99),
+            "login_time": login_time,
+        }
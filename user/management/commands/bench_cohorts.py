@@ -0,0 +1,112 @@
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user import analytics
+from user.models import EngagementLog, User
+
+DOMAIN = "cohort-bench.example.com"
+
+
+class Command(BaseCommand):
+    help = "Time the NumPy cohort report against a row-by-row loop over engagement logs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20_000)
+        parser.add_argument("--logs", type=int, default=1_000_000)
+        parser.add_argument("--seed", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        today = timezone.localdate()
+        now = timezone.now()
+        actions = [action for action, _ in EngagementLog.ACTION_CHOICES]
+        self._cleanup()
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    (
+                        User(email=f"guest{i}@{DOMAIN}", password="!",
+                             date_joined=now - timedelta(days=rng.randrange(540)))
+                        for i in range(options["users"])
+                    ),
+                    batch_size=2000,
+                )
+                # Raw inserts: bulk_create would stamp every log with auto_now_add
+                joined = [(user.pk, user.date_joined) for user in users]
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"INSERT INTO {EngagementLog._meta.db_table} (user_id, action, timestamp) VALUES (%s, %s, %s)",
+                        (
+                            (user_id, rng.choice(actions), connection.ops.adapt_datetimefield_value(
+                                min(now, date_joined + timedelta(days=rng.expovariate(1 / 90)))
+                            ))
+                            for user_id, date_joined in (rng.choice(joined) for _ in range(options["logs"]))
+                        ),
+                    )
+            self.stdout.write(
+                f"created {len(users):,} guests and {options['logs']:,} logs in {time.perf_counter() - start:.1f}s"
+            )
+
+            start = time.perf_counter()
+            signups, engagement, bookings = (
+                analytics.load_signups(), analytics.load_engagement(), analytics.load_bookings(),
+            )
+            loaded = time.perf_counter()
+            report = analytics.cohort_report(today, signups=signups, engagement=engagement, bookings=bookings)
+            done = time.perf_counter()
+            self.stdout.write(
+                f"numpy: load {loaded - start:.2f}s, compute {(done - loaded) * 1000:.1f} ms, "
+                f"{sum(report.sizes):,} guests in {len(report.cohorts)} cohorts"
+            )
+
+            start = time.perf_counter()
+            baseline = self._row_by_row(today)
+            self.stdout.write(f"row by row: {time.perf_counter() - start:.2f}s")
+            for action in actions:
+                if baseline[action] != report.metrics[action].active:
+                    self.stderr.write(f"mismatch for {action}")
+        finally:
+            self._cleanup()
+
+    def _row_by_row(self, today, months=12, periods=12):
+        current = today.year * 12 + today.month - 1
+        cohorts = {
+            user.pk: user.date_joined.year * 12 + user.date_joined.month - 1 - (current - months + 1)
+            for user in User.objects.iterator(chunk_size=2000)
+        }
+        seen = defaultdict(set)
+        for log in EngagementLog.objects.iterator(chunk_size=2000):
+            cohort = cohorts.get(log.user_id)
+            if cohort is None or not 0 <= cohort < months:
+                continue
+            period = log.timestamp.year * 12 + log.timestamp.month - 1 - (current - months + 1) - cohort
+            if 0 <= period < periods:
+                seen[log.action].add((log.user_id, cohort, period))
+        result = {}
+        for action, _ in EngagementLog.ACTION_CHOICES:
+            active = [[0] * periods for _ in range(months)]
+            for _, cohort, period in seen[action]:
+                active[cohort][period] += 1
+            result[action] = [
+                [count if cohort + period < months else None for period, count in enumerate(row)]
+                for cohort, row in enumerate(active)
+            ]
+        return result
+
+    def _cleanup(self):
+        ids = list(User.objects.filter(email__endswith=f"@{DOMAIN}").values_list("id", flat=True))
+        if not ids:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            for offset in range(0, len(ids), 500):
+                chunk = ids[offset:offset + 500]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM {EngagementLog._meta.db_table} WHERE user_id IN ({placeholders})", chunk)
+                cursor.execute(f"DELETE FROM {User._meta.db_table} WHERE id IN ({placeholders})", chunk)
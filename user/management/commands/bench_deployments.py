@@ -0,0 +1,133 @@
+import http.client
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time as time_
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from bookings.models import Booking
+from user.models import User
+
+ASGI_CMD = "uvicorn kuriftu_backend.asgi:application --host 127.0.0.1 --port {port} --log-level warning"
+WSGI_CMD = "gunicorn kuriftu_backend.wsgi:application --bind 127.0.0.1:{port} --threads 8 --log-level warning"
+WSGI_FALLBACK_CMD = "{python} manage.py runserver 127.0.0.1:{port} --noreload"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = "Compare requests/s and p99 latency of the API under uvicorn (ASGI) and the WSGI deployment."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--paths", default="/api/booking/bookings/,/api/user/profile")
+        parser.add_argument("--asgi-cmd", default=ASGI_CMD)
+        parser.add_argument("--wsgi-cmd", default=WSGI_CMD)
+
+    def handle(self, *args, **options):
+        email = "deploy-bench@example.com"
+        User.objects.filter(email=email).delete()
+        user = User.objects.create_user(email=email, password=None)
+        Booking.objects.bulk_create([
+            Booking(user=user, service_type="SPA", date=date(2026, 1, 1 + i % 28), time=time_(10))
+            for i in range(20)
+        ])
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        paths = options["paths"].split(",")
+
+        wsgi_cmd = options["wsgi_cmd"]
+        if not shutil.which(shlex.split(wsgi_cmd)[0]):
+            wsgi_cmd = WSGI_FALLBACK_CMD
+
+        try:
+            for label, command in (("asgi", options["asgi_cmd"]), ("wsgi", wsgi_cmd)):
+                argv = shlex.split(command.replace("{python}", sys.executable))
+                if not shutil.which(argv[0]):
+                    self.stdout.write(f"{label}: {argv[0]} not installed, skipped")
+                    continue
+                self._run_server(label, argv, paths, cookie, options)
+        finally:
+            user.delete()
+
+    def _run_server(self, label, argv, paths, cookie, options):
+        port = _free_port()
+        argv = [arg.replace("{port}", str(port)) for arg in argv]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "kuriftu_backend.settings"))
+        server = subprocess.Popen(argv, cwd=settings.BASE_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_until_up(port):
+                self.stdout.write(f"{label}: server did not start")
+                return
+            for path in paths:
+                rps, p50, p99, errors = self._load(port, path, cookie, options["requests"], options["concurrency"])
+                self.stdout.write(
+                    f"{label} {path}: {rps:,.0f} req/s, p50 {p50:.1f} ms, p99 {p99:.1f} ms, {errors} errors"
+                )
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    def _load(self, port, path, cookie, total, concurrency):
+        per_worker = max(1, total // concurrency)
+
+        def worker(_):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            latencies, errors = [], 0
+            for _ in range(per_worker):
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", path, headers={"Cookie": cookie})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        errors += 1
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                latencies.append((time.perf_counter() - start) * 1000)
+            conn.close()
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(l for worker_latencies, _ in results for l in worker_latencies)
+        errors = sum(e for _, e in results)
+        return (
+            len(latencies) / elapsed,
+            latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            errors,
+        )
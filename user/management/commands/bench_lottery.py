@@ -0,0 +1,86 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from user import lottery
+from user.models import EngagementLog, LotteryCampaign, LotteryPrize, User
+
+LOCK_RETRIES = 8
+
+
+class Command(BaseCommand):
+    help = "Benchmark lottery draws and full plays under concurrency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--draws", type=int, default=1_000_000)
+        parser.add_argument("--plays", type=int, default=2_000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--prizes", type=int, default=50)
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        campaign = LotteryCampaign.objects.create(name="bench", cost_points=1, miss_weight=500)
+        LotteryPrize.objects.bulk_create([
+            LotteryPrize(campaign=campaign, name=f"prize-{i}", weight=i + 1, remaining=25 if i % 2 else None)
+            for i in range(options["prizes"])
+        ])
+        campaign.refresh_from_db()
+        player = User.objects.create_user(
+            email=f"lottery-bench-{campaign.pk}@kuriftu.invalid", password=None,
+            points=options["plays"],
+        )
+
+        try:
+            table = lottery.get_prize_table(campaign)
+            draws = options["draws"]
+            start = time.perf_counter()
+            for _ in range(draws):
+                table.draw()
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"draw (1 thread): {draws / elapsed:,.0f} draws/s")
+
+            per_thread = draws // threads
+            def draw_many(_):
+                for _ in range(per_thread):
+                    table.draw()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(draw_many, range(threads)))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"draw ({threads} threads): {per_thread * threads / elapsed:,.0f} draws/s")
+
+            locked = []
+            def play_once(_):
+                try:
+                    for attempt in range(LOCK_RETRIES):
+                        try:
+                            return lottery.play(player, campaign)["won"]
+                        except OperationalError as exc:
+                            # SQLite lets one writer in at a time; back off and retry
+                            if "locked" not in str(exc) or attempt == LOCK_RETRIES - 1:
+                                raise
+                            locked.append(1)
+                            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                except lottery.LotteryError:
+                    return None
+                finally:
+                    connection.close()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as pool:
+                results = list(pool.map(play_once, range(options["plays"])))
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"play ({threads} threads): {len(results) / elapsed:,.0f} plays/s, "
+                f"{results.count(True)} wins, {results.count(None)} rejected, {len(locked)} lock retries"
+            )
+
+            player.refresh_from_db()
+            oversold = LotteryPrize.objects.filter(campaign=campaign, remaining__lt=0).count()
+            self.stdout.write(f"points left: {player.points}, oversold prizes: {oversold}")
+        finally:
+            EngagementLog.objects.filter(user=player).delete()
+            player.delete()
+            campaign.delete()
@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+import uuid
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import alogin
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, override_settings
+
+from user.hashing import amake_password
+from user.models import Newsletter, User
+from user.schemas import UserRegisterSchema
+from user.views import register_user
+
+DOMAIN = "register-bench.example.com"
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Compare registrations per second of the single-transaction path and the previous step-by-step path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--registrations", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--real-hasher", action="store_true",
+            help="Hash with the configured hasher; by default MD5 keeps the run about database work",
+        )
+
+    def handle(self, *args, **options):
+        hashers = settings.PASSWORD_HASHERS
+        if not options["real_hasher"]:
+            hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+        self._cleanup()
+        referrer = User.objects.create_user(f"referrer@{DOMAIN}", "bench-password-123")
+        try:
+            with override_settings(PASSWORD_HASHERS=hashers):
+                for label, register in (("step by step", self._step_by_step), ("atomic", self._atomic)):
+                    result = asyncio.run(self._run(label, register, referrer.referral_code, options))
+                    self.stdout.write(
+                        f"{label:>12}: {result['rate']:.0f} registrations/s, "
+                        f"p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms"
+                    )
+        finally:
+            self._cleanup()
+
+    async def _run(self, label, register, referral_code, options):
+        slug = label.replace(" ", "-")
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        factory = AsyncRequestFactory()
+        engine = import_module(settings.SESSION_ENGINE)
+        latencies = []
+
+        async def one(number):
+            data = UserRegisterSchema(
+                email=f"{slug}-{number}@{DOMAIN}", password="bench-password-123",
+                first_name="Bench", last_name=slug,
+                referred_by_code=referral_code if number % 2 else None,
+            )
+            request = factory.post("/api/user/register")
+            request.session = engine.SessionStore()
+            request.user = AnonymousUser()
+            async with semaphore:
+                start = time.perf_counter()
+                await register(request, data)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(number) for number in range(options["registrations"])))
+        elapsed = time.perf_counter() - start
+        return {
+            "rate": options["registrations"] / elapsed,
+            "p50": statistics.median(latencies),
+            "p99": _percentile(latencies, 99),
+        }
+
+    async def _atomic(self, request, data):
+        await register_user(request, data)
+
+    async def _step_by_step(self, request, data):
+        # The registration view as it was: five round trips, no transaction
+        if await User.objects.filter(email=data.email).aexists():
+            raise ValueError(data.email)
+        referred_by = None
+        if data.referred_by_code:
+            referred_by = await User.objects.filter(referral_code=data.referred_by_code).afirst()
+        user = User(
+            email=User.objects.normalize_email(data.email), first_name=data.first_name,
+            middle_name=data.middle_name or "", last_name=data.last_name, referred_by=referred_by,
+        )
+        user.password = await amake_password(data.password)
+        user.referral_code = str(uuid.uuid4())[:8]
+        await user.asave()
+        await Newsletter.objects.acreate(user=user, is_subscribed=True)
+        await alogin(request, user)
+
+    def _cleanup(self):
+        User.objects.filter(email__endswith=f"@{DOMAIN}").delete()
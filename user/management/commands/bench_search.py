@@ -0,0 +1,96 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from user import search
+from user.models import User
+
+FIRST = ["Abebe", "Almaz", "Bekele", "Chaltu", "Dawit", "Eleni", "Fikru", "Genet", "Hana", "Kebede",
+         "Lulit", "Meron", "Nahom", "Rahel", "Selam", "Tsion", "Yonas", "Zewdu", "Mekdes", "Samuel"]
+LAST = ["Tesfaye", "Girma", "Haile", "Alemu", "Bekele", "Mengistu", "Tadesse", "Wolde", "Negash", "Assefa"]
+PLACES = ["Bole", "Piassa", "Kazanchis", "CMC", "Megenagna", "Sarbet", "Bishoftu", "Adama", "Hawassa", "Gondar"]
+DOMAIN = "search-bench.example.com"
+
+
+class Command(BaseCommand):
+    help = "Time ranked FTS5 staff search against an icontains scan over many guests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=11)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        self._cleanup()
+        start = time.perf_counter()
+        with transaction.atomic():
+            # bulk_create skips post_save, so the new guests are indexed in one batch below
+            users = User.objects.bulk_create(
+                (
+                    User(
+                        email=f"{rng.choice(FIRST).lower()}.{i}@{DOMAIN}",
+                        first_name=rng.choice(FIRST), last_name=rng.choice(LAST),
+                        middle_name=rng.choice(FIRST), preferred_location=rng.choice(PLACES),
+                        password="!",
+                    )
+                    for i in range(options["users"])
+                ),
+                batch_size=2000,
+            )
+            search._write([search._user_row(user) for user in users])
+            search.optimize()
+        self.stdout.write(f"created and indexed {len(users):,} guests in {time.perf_counter() - start:.1f}s")
+
+        queries = [
+            rng.choice([
+                lambda: rng.choice(FIRST)[:4],
+                lambda: f"{rng.choice(FIRST)} {rng.choice(LAST)[:4]}",
+                lambda: f"{rng.choice(FIRST).lower()}.{rng.randrange(options['users'])}",
+                lambda: f"{rng.choice(LAST)[1:5]} {rng.choice(PLACES)}",
+            ])()
+            for _ in range(options["queries"])
+        ]
+        try:
+            self._time("fts5 search", queries, lambda q: search.search(q, 20))
+            self._time("icontains", queries[:20], self._icontains)
+        finally:
+            self._cleanup()
+
+    def _icontains(self, query):
+        from django.db.models import Q
+
+        condition = Q()
+        for term in query.split():
+            condition &= (
+                Q(first_name__icontains=term) | Q(last_name__icontains=term)
+                | Q(email__icontains=term) | Q(preferred_location__icontains=term)
+            )
+        return list(User.objects.filter(condition).values("id", "email")[:20])
+
+    def _time(self, label, queries, run):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label}: p50 {statistics.median(timings):.2f} ms, "
+            f"p99 {timings[min(len(timings) - 1, int(len(timings) * 0.99))]:.2f} ms over {len(timings)} queries"
+        )
+
+    def _cleanup(self):
+        ids = list(User.objects.filter(email__endswith=f"@{DOMAIN}").values_list("id", flat=True))
+        if not ids:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            search._remove([search.user_rowid(pk) for pk in ids])
+            for offset in range(0, len(ids), 500):
+                chunk = ids[offset:offset + 500]
+                cursor.execute(
+                    f"DELETE FROM {User._meta.db_table} WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk,
+                )
@@ -0,0 +1,94 @@
+import json
+import time
+from datetime import date, time as time_
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from ninja.responses import NinjaJSONEncoder
+
+from bookings.models import Booking
+from bookings.schemas import BookingOut
+from kuriftu_backend.projection import schema_columns
+from kuriftu_backend.renderers import ORJSONRenderer
+from user.models import Tier, User
+from user.schemas import TierOutSchema, UserOutSchema
+
+
+class Command(BaseCommand):
+    help = "Per-endpoint serialization cost: model instances + stdlib JSON vs .values() + orjson."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=200)
+        parser.add_argument("--iterations", type=int, default=200)
+
+    def handle(self, *args, **options):
+        tier, _ = Tier.objects.get_or_create(name="Bench", defaults={"min_points": 0})
+        email = "serialization-bench@example.com"
+        User.objects.filter(email=email).delete()
+        user = User.objects.create_user(email=email, password=None, tier=tier)
+        Booking.objects.bulk_create([
+            Booking(user=user, service_type="SPA", date=date(2026, 1, 1 + i % 28), time=time_(10))
+            for i in range(options["bookings"])
+        ])
+        booking_id = Booking.objects.filter(user=user).values_list("id", flat=True).first()
+        renderer = ORJSONRenderer()
+        booking_columns = schema_columns(BookingOut)
+        profile_columns = schema_columns(UserOutSchema, exclude=("tier",))
+
+        def legacy_dump(data):
+            return json.dumps(data, cls=NinjaJSONEncoder)
+
+        def fast_dump(data):
+            return renderer.render(None, data, response_status=200)
+
+        def fast_profile():
+            row = User.objects.filter(pk=user.pk).values(*profile_columns, tier_name=F("tier__name")).get()
+            row["tier"] = row.pop("tier_name")
+            return UserOutSchema.model_validate(row).model_dump()
+
+        endpoints = [
+            (
+                "list_bookings",
+                lambda: legacy_dump([BookingOut.model_validate(b).model_dump() for b in Booking.objects.filter(user=user)]),
+                lambda: fast_dump([
+                    BookingOut.model_validate(row).model_dump()
+                    for row in Booking.objects.filter(user=user).values(*booking_columns)
+                ]),
+            ),
+            (
+                "get_booking",
+                lambda: legacy_dump(BookingOut.model_validate(Booking.objects.get(pk=booking_id)).model_dump()),
+                lambda: fast_dump(BookingOut.model_validate(
+                    Booking.objects.values(*booking_columns).get(pk=booking_id)
+                ).model_dump()),
+            ),
+            (
+                "get_profile",
+                lambda: legacy_dump(UserOutSchema.model_validate(User.objects.get(pk=user.pk)).model_dump()),
+                lambda: fast_dump(fast_profile()),
+            ),
+            (
+                "get_user_tier",
+                lambda: legacy_dump(TierOutSchema.model_validate(User.objects.get(pk=user.pk).tier).model_dump()),
+                lambda: fast_dump(TierOutSchema.model_validate(
+                    Tier.objects.filter(pk=user.tier_id).values(*schema_columns(TierOutSchema)).get()
+                ).model_dump()),
+            ),
+        ]
+
+        try:
+            for name, legacy, fast in endpoints:
+                legacy_ms = self._time(legacy, options["iterations"])
+                fast_ms = self._time(fast, options["iterations"])
+                self.stdout.write(
+                    f"{name:>14}: legacy {legacy_ms:.3f} ms, fast {fast_ms:.3f} ms ({legacy_ms / fast_ms:.1f}x)"
+                )
+        finally:
+            user.delete()
+
+    def _time(self, func, iterations):
+        func()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) * 1000 / iterations
@@ -0,0 +1,92 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# What a fresh worker does before it can answer its first request
+STARTUP_SNIPPET = (
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+# Modules that should only load on first use (or never, in API-only workers)
+DEFERRED_MODULES = (
+    "Crypto.Cipher", "requests", "smtplib", "django.core.mail.backends.smtp", "django.contrib.admin.sites",
+)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """-X importtime output -> {module: (self_us, cumulative_us, depth)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Measure worker cold start: wall time and per-module import time, full vs API-only mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5)
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--prefix", default="", help="Only list modules starting with this prefix.")
+
+    def handle(self, *args, **options):
+        for label, api_only in (("full", "0"), ("api-only", "1")):
+            walls, runs = [], []
+            for _ in range(options["runs"]):
+                wall, modules = self._start(api_only)
+                walls.append(wall)
+                runs.append(modules)
+            self._report(label, walls, runs, options)
+
+    def _start(self, api_only):
+        env = dict(
+            os.environ,
+            API_ONLY=api_only,
+            DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "kuriftu_backend.settings"),
+        )
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", STARTUP_SNIPPET],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall = (time.perf_counter() - start) * 1000
+        if result.returncode:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        return wall, parse_importtime(result.stderr)
+
+    def _report(self, label, walls, runs, options):
+        # Median per module across runs smooths out disk-cache noise
+        names = set.intersection(*(set(modules) for modules in runs))
+        medians = {
+            name: (
+                statistics.median(modules[name][0] for modules in runs),
+                statistics.median(modules[name][1] for modules in runs),
+            )
+            for name in names
+        }
+        total_ms = sum(self_us for self_us, _ in medians.values()) / 1000
+        self.stdout.write(
+            f"{label}: wall p50 {statistics.median(walls):.0f} ms, "
+            f"imports {total_ms:.0f} ms across {len(names)} modules"
+        )
+
+        listed = [name for name in medians if name.startswith(options["prefix"])]
+        listed.sort(key=lambda name: medians[name][1], reverse=True)
+        for name in listed[:options["top"]]:
+            self_us, cumulative_us = medians[name]
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms cumulative {self_us / 1000:7.1f} ms self  {name}")
+
+        loaded = [name for name in DEFERRED_MODULES if name in names]
+        self.stdout.write(f"  deferred modules loaded at startup: {', '.join(loaded) or 'none'}")
@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.deletion import run_account_deletion
+from user.models import AccountDeletion
+
+
+class Command(BaseCommand):
+    help = "Run queued, failed or stalled account deletion jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--stale-minutes", type=int, default=15,
+            help="Treat RUNNING jobs with no progress for this long as crashed.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options["stale_minutes"])
+        AccountDeletion.objects.filter(
+            status=AccountDeletion.STATUS_RUNNING, updated_at__lt=cutoff
+        ).update(status=AccountDeletion.STATUS_PENDING)
+
+        job_ids = AccountDeletion.objects.filter(
+            status__in=[AccountDeletion.STATUS_PENDING, AccountDeletion.STATUS_FAILED]
+        ).order_by("requested_at").values_list("id", flat=True)
+
+        for job_id in list(job_ids):
+            run_account_deletion(job_id)
+            job = AccountDeletion.objects.get(pk=job_id)
+            self.stdout.write(f"{job.email}: {job.status} ({job.rows_deleted} rows)")
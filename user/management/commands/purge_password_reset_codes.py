@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from user.resets import purge_legacy_codes
+
+
+class Command(BaseCommand):
+    help = "Delete expired legacy PasswordResetCode rows in batches (every row with --all)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Also delete unexpired codes, e.g. once PASSWORD_RESET_MODE is token",
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_legacy_codes(options["batch_size"], everything=options["all"])
+        self.stdout.write(f"Deleted {deleted} password reset codes.")
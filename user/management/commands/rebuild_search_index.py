@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from user.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the staff search index from users and bookings, e.g. after bulk imports."
+
+    def handle(self, *args, **options):
+        rows = rebuild_index()
+        self.stdout.write(f"Indexed {rows} rows.")
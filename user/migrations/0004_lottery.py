@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_accountdeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotteryCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('cost_points', models.PositiveIntegerField(default=0)),
+                ('miss_weight', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('prize_version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LotteryPrize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('remaining', models.PositiveIntegerField(blank=True, null=True)),
+                ('points_award', models.PositiveIntegerField(default=0)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prizes', to='user.lotterycampaign')),
+            ],
+        ),
+    ]
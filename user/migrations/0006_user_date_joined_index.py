@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_tier_updated_at_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
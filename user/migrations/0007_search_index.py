@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Frozen here rather than imported from user.search, so later changes to the
+# module cannot change what this migration does
+SEARCH_TABLE = 'search_index'
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(name, contact, location, extra, tokenize='trigram')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    User = apps.get_model('user', 'User')
+    Booking = apps.get_model('bookings', 'Booking')
+
+    def join(*parts):
+        return ' '.join(part for part in parts if part)
+
+    rows = [
+        (user.id * 2, join(user.first_name, user.middle_name, user.last_name), user.email,
+         user.preferred_location or '', user.referral_code or '')
+        for user in User.objects.iterator(chunk_size=2000)
+    ] + [
+        (booking.id * 2 + 1, '', '', booking.pickup_location or '', join(booking.service_type, booking.service_id))
+        for booking in Booking.objects.iterator(chunk_size=2000)
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, name, contact, location, extra) VALUES (%s, %s, %s, %s, %s)',
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0006_user_date_joined_index'),
+        ('bookings', '0010_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
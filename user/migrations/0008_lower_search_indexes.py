@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:01
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountdeletion',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='deletion_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='user_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Lower('referral_code'), name='user_referral_lower_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:20
+
+from django.db import migrations
+
+
+def rename_booking_action(apps, schema_editor):
+    # Payment.log_completion wrote 'BOOKING_COMPLETED', which is not one of
+    # the action choices, so reports keyed on the choices never saw it
+    EngagementLog = apps.get_model('user', 'EngagementLog')
+    EngagementLog.objects.filter(action='BOOKING_COMPLETED').update(action='completed_booking')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_lower_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_booking_action, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:35
+
+from django.db import migrations
+
+SEARCH_TABLE = 'search_index'
+
+
+def set_rank(apps, schema_editor):
+    # Store the weighted bm25 as the table's rank so searches can ORDER BY rank
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 5.0, 2.0, 1.0)')"
+        )
+
+
+def reset_rank(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', 'bm25()')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_engagement_booking_action'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_rank, reset_rank),
+    ]
@@ -1,19 +1,47 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
-import uuid
+from datetime import timedelta
+
+from .hashing import amake_password
+from .referrals import referral_code_for
 
 
 class UserManager(BaseUserManager):
+    def save_new_user(self, user):
+        """
+        Insert `user` with the referral code derived from its new id, in one
+        transaction. The code is filled in by a bare UPDATE and post_save is
+        sent once the row is complete, so receivers (the search index) see
+        one save instead of the insert and a second save for the code.
+        """
+        with transaction.atomic(using=self._db):
+            self.bulk_create([user])  # no signals; returns the new id on SQLite
+            user.referral_code = referral_code_for(user.pk)
+            self.filter(pk=user.pk).update(referral_code=user.referral_code)
+            models.signals.post_save.send(
+                sender=self.model, instance=user, created=True, update_fields=None, raw=False, using=user._state.db,
+            )
+        return user
+
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('Email must be provided')
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
         user.set_password(password)
-        user.referral_code = str(uuid.uuid4())[:8]  # Generate unique referral code
-        user.save(using=self._db)
-        return user
+        return self.save_new_user(user)
+
+    async def acreate_user(self, email, password=None, **extra_fields):
+        """create_user() for async views: hashes in the password pool, then saves off the event loop."""
+        if not email:
+            raise ValueError('Email must be provided')
+        email = self.normalize_email(email)
+        user = self.model(email=email, **extra_fields)
+        user.password = await amake_password(password)
+        return await sync_to_async(self.save_new_user)(user)
 
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", True)
@@ -25,6 +53,7 @@ class Tier(models.Model):
     name = models.CharField(max_length=50, unique=True)
     min_points = models.IntegerField()
     perks = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -50,13 +79,21 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
-    date_joined = models.DateTimeField(default=timezone.now)
+    date_joined = models.DateTimeField(default=timezone.now, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search in the admin, see kuriftu_backend.changelists
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('referral_code'), name='user_referral_lower_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -91,6 +128,89 @@ class Newsletter(models.Model):
     def __str__(self):
         return f"{self.user.email} - {'Subscribed' if self.is_subscribed else 'Unsubscribed'}"
 
+class AccountDeletion(models.Model):
+    STATUS_PENDING = "PENDING"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_DONE = "DONE"
+    STATUS_FAILED = "FAILED"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    # Plain ids rather than a FK: the job must outlive the user row it deletes.
+    user_id = models.BigIntegerField(db_index=True)
+    email = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    rows_deleted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(Lower('email'), name='deletion_email_lower_idx')]
+
+    def __str__(self):
+        return f"Deletion of {self.email} - {self.status}"
+
+
+class LotteryCampaign(models.Model):
+    name = models.CharField(max_length=100)
+    cost_points = models.PositiveIntegerField(default=0)
+    miss_weight = models.PositiveIntegerField(default=0)  # weight of drawing nothing
+    is_active = models.BooleanField(default=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    # Bumped whenever the prize set changes so cached alias tables get rebuilt
+    prize_version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        stored = LotteryCampaign.objects.filter(pk=self.pk).values_list("miss_weight", flat=True).first()
+        if kwargs.get("update_fields") is None:
+            # prize_version only moves through bump_prize_version, so an admin form never writes back a stale one
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "prize_version"
+            ]
+        super().save(*args, **kwargs)
+        if stored != self.miss_weight:
+            # The miss weight is part of every cached alias table
+            self.bump_prize_version()
+
+    def bump_prize_version(self):
+        LotteryCampaign.objects.filter(pk=self.pk).update(prize_version=models.F("prize_version") + 1)
+
+
+class LotteryPrize(models.Model):
+    campaign = models.ForeignKey(LotteryCampaign, on_delete=models.CASCADE, related_name="prizes")
+    name = models.CharField(max_length=100)
+    weight = models.PositiveIntegerField(default=1)
+    remaining = models.PositiveIntegerField(null=True, blank=True)  # null = unlimited
+    points_award = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.campaign.name} - {self.name}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.campaign.bump_prize_version()
+
+    def delete(self, *args, **kwargs):
+        campaign = self.campaign
+        result = super().delete(*args, **kwargs)
+        campaign.bump_prize_version()
+        return result
+
+
 class EngagementLog(models.Model):
     ACTION_REFERRAL = "referral_signup"
     ACTION_BOOKING = "completed_booking"
@@ -0,0 +1,41 @@
+import functools
+import hashlib
+import hmac
+
+from django.conf import settings
+
+# Referral codes are the user's id run through a keyed Feistel permutation
+# of 50-bit numbers, written as 10 Crockford base32 characters. Distinct
+# ids always give distinct codes, so allocation never has to retry on the
+# unique index, and codes do not reveal how many guests signed up. Older
+# random codes are 8 characters, so the two kinds cannot collide either.
+#
+# settings.REFERRAL_CODE_KEY picks the permutation; changing it after
+# codes are out could hand a new guest an existing code.
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+CODE_LENGTH = 10
+MAX_ID = (1 << CODE_LENGTH * 5) - 1
+HALF_BITS = CODE_LENGTH * 5 // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _key(secret):
+    return hashlib.sha256(b"kuriftu.referral-codes:" + secret.encode()).digest()
+
+
+def _round(key, number, half):
+    digest = hmac.new(key, number.to_bytes(1, "big") + half.to_bytes(4, "big"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], "big") & HALF_MASK
+
+
+def referral_code_for(user_id):
+    if not 0 < user_id <= MAX_ID:
+        raise ValueError(f"User id {user_id} is out of range for referral codes")
+    key = _key(getattr(settings, "REFERRAL_CODE_KEY", settings.SECRET_KEY))
+    left, right = user_id >> HALF_BITS, user_id & HALF_MASK
+    for number in range(ROUNDS):
+        left, right = right, left ^ _round(key, number, right)
+    value = left << HALF_BITS | right
+    return "".join(ALPHABET[value >> shift & 31] for shift in range(5 * (CODE_LENGTH - 1), -1, -5))
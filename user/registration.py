@@ -0,0 +1,23 @@
+from django.contrib.auth import login
+from django.db import transaction
+
+from .models import Newsletter, User
+
+
+def register(request, email, password_hash, referred_by_code=None, **fields):
+    """
+    Create an account, its newsletter subscription and the logged-in
+    session as one transaction, so a failure leaves none of them behind.
+    The password arrives hashed: hashing inside would hold the write lock
+    for the whole hash. A taken email surfaces as the IntegrityError of
+    the unique index rather than a separate exists() query.
+    """
+    with transaction.atomic():
+        if referred_by_code:
+            fields["referred_by"] = User.objects.filter(referral_code=referred_by_code).first()
+        user = User.objects.save_new_user(
+            User(email=User.objects.normalize_email(email), password=password_hash, **fields)
+        )
+        Newsletter.objects.create(user=user, is_subscribed=True)
+        login(request, user)
+    return user
@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from kuriftu_backend.purge import delete_in_batches
+from .models import PasswordResetCode, User
+
+# Reset codes come in two modes (settings.PASSWORD_RESET_MODE):
+#
+# "token": `<base64 user id>.<token>` from Django's PasswordResetTokenGenerator,
+# an HMAC over the user's id, password hash, last login and email plus the
+# time it was issued. Issuing and checking one writes nothing; it lapses
+# after settings.PASSWORD_RESET_TIMEOUT, and setting the new password
+# changes the hash, which voids the code, so it works once.
+#
+# "code": the legacy random code stored in PasswordResetCode. Stored codes
+# are still accepted in either mode until they expire, so a mode switch
+# never strands a mailed code; purge_password_reset_codes clears the table.
+LEGACY_CODE_TTL = timedelta(minutes=30)
+SEPARATOR = "."
+
+
+def reset_mode():
+    return getattr(settings, "PASSWORD_RESET_MODE", "token")
+
+
+def code_lifetime():
+    """How long a newly issued code stays valid."""
+    if reset_mode() == "code":
+        return LEGACY_CODE_TTL
+    return timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT)
+
+
+def is_token(code):
+    # Legacy codes are alphanumeric, and neither half of a token holds a dot
+    return SEPARATOR in code
+
+
+def issue_code(user):
+    if reset_mode() == "code":
+        reset, _ = PasswordResetCode.objects.get_or_create(user=user)
+        reset.code = get_random_string(length=8)
+        # A reissued code gets a fresh 30 minutes; auto_now_add only stamps the first one
+        reset.created_at = timezone.now()
+        reset.save()
+        return reset.code
+    return f"{urlsafe_base64_encode(force_bytes(user.pk))}{SEPARATOR}{default_token_generator.make_token(user)}"
+
+
+def _token_user_id(code):
+    uidb64, _, token = code.partition(SEPARATOR)
+    try:
+        return int(urlsafe_base64_decode(uidb64).decode()), token
+    except (ValueError, UnicodeDecodeError):
+        return None, token
+
+
+async def auser_for_token(code):
+    """The active user a reset token was issued to, or None if it is invalid, expired or used."""
+    user_id, token = _token_user_id(code)
+    if user_id is None:
+        return None
+    user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+    if user is None or not default_token_generator.check_token(user, token):
+        return None
+    return user
+
+
+def purge_legacy_codes(batch_size=1000, everything=False):
+    """Delete expired PasswordResetCode rows (all rows with `everything`), in batches."""
+    codes = PasswordResetCode.objects.all()
+    if not everything:
+        codes = codes.filter(created_at__lt=timezone.now() - LEGACY_CODE_TTL)
+    return delete_in_batches(codes, batch_size)
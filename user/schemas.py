@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, Field, constr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, constr, field_validator
+from typing import Dict, Optional, List
 from datetime import date, datetime
 
 
@@ -46,6 +46,12 @@ class UserOutSchema(BaseModel):
     class Config:
         from_attributes = True
 
+    @field_validator("tier", mode="before")
+    @classmethod
+    def tier_name(cls, value):
+        # Accept the related Tier instance and expose just its name
+        return getattr(value, "name", value)
+
 
 class BirthdayRewardOutSchema(BaseModel):
     message: str
@@ -71,6 +77,45 @@ class TierOutSchema(BaseModel):
         from_attributes = True
 
 
+class LotteryCampaignOutSchema(BaseModel):
+    id: int
+    name: str
+    cost_points: int
+    ends_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class LotteryPlayOutSchema(BaseModel):
+    won: bool
+    prize: Optional[str]
+    points_awarded: int
+
+
+class SearchHitOutSchema(BaseModel):
+    kind: str = Field(..., description="user or booking")
+    id: int
+    score: float = Field(..., description="Relevance, higher is better")
+    title: str
+    subtitle: str
+    user_id: int
+
+
+class CohortMetricOutSchema(BaseModel):
+    active: List[List[Optional[int]]] = Field(..., description="Users active per cohort (rows) and month since signup (columns)")
+    retention: List[List[Optional[float]]] = Field(..., description="active / cohort size; null for months still ahead")
+
+
+class CohortReportOutSchema(BaseModel):
+    generated_on: date
+    cohorts: List[str] = Field(..., description="Signup months, YYYY-MM")
+    sizes: List[int]
+    periods: int
+    repeat_booking_rate: List[float] = Field(..., description="Share of each cohort with two or more bookings")
+    metrics: Dict[str, CohortMetricOutSchema] = Field(..., description="bookings and each engagement action")
+
+
 class PasswordResetRequestSchema(BaseModel):
     email: EmailStr
 
@@ -0,0 +1,223 @@
+from collections import namedtuple
+
+from django.db import connection, transaction
+
+# Staff search runs on an SQLite FTS5 table with one row per guest or booking.
+# Even rowids are users (id * 2), odd ones bookings (id * 2 + 1), so a save or
+# delete rewrites its row directly. The trigram tokenizer matches any 3+
+# character fragment of a name, email or location from the index instead of
+# a LIKE '%...%' scan. UserConfig.ready() connects the sync receivers below.
+SEARCH_TABLE = "search_index"
+MIN_TERM_LENGTH = 3  # trigram index: shorter fragments cannot be looked up
+# bm25 column weights: name, contact, location, extra. They are stored as the
+# table's rank function, so "ORDER BY rank" sorts inside FTS5
+WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+USER_FIELDS = frozenset({"first_name", "middle_name", "last_name", "email", "referral_code", "preferred_location"})
+BOOKING_FIELDS = frozenset({"pickup_location", "service_id", "service_type"})
+
+SearchHit = namedtuple("SearchHit", ["kind", "id", "score", "title", "subtitle", "user_id"])
+
+RANK_SQL = (
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) "
+    f"VALUES ('rank', 'bm25({', '.join(str(weight) for weight in WEIGHTS)})')"
+)
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def user_rowid(user_id):
+    return user_id * 2
+
+
+def booking_rowid(booking_id):
+    return booking_id * 2 + 1
+
+
+def _join(*parts):
+    return " ".join(part for part in parts if part)
+
+
+def _user_row(user):
+    return (
+        user_rowid(user.pk),
+        _join(user.first_name, user.middle_name, user.last_name),
+        user.email,
+        user.preferred_location or "",
+        user.referral_code or "",
+    )
+
+
+def _booking_row(booking):
+    return (
+        booking_rowid(booking.pk),
+        "",
+        "",
+        booking.pickup_location or "",
+        _join(booking.service_type, booking.service_id),
+    )
+
+
+def _write(rows):
+    if not rows or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {SEARCH_TABLE}(rowid, name, contact, location, extra) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def _remove(rowids):
+    if not rowids or not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(rowid,) for rowid in rowids])
+
+
+def index_user(user):
+    _write([_user_row(user)])
+
+
+def index_booking(booking):
+    _write([_booking_row(booking)])
+
+
+def unindex_user(user_id, booking_ids=()):
+    _remove([user_rowid(user_id), *(booking_rowid(pk) for pk in booking_ids)])
+
+
+def unindex_booking(booking_id):
+    _remove([booking_rowid(booking_id)])
+
+
+def _touches(update_fields, indexed):
+    return update_fields is None or not indexed.isdisjoint(update_fields)
+
+
+def user_saved(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Logins and point updates save other columns; only reindex on indexed ones
+    if not raw and _touches(update_fields, USER_FIELDS):
+        index_user(instance)
+
+
+def user_deleted(sender, instance, **kwargs):
+    unindex_user(instance.pk)
+
+
+def booking_saved(sender, instance, using, update_fields=None, raw=False, **kwargs):
+    from bookings.sharding import derived_write
+
+    if not raw and _touches(update_fields, BOOKING_FIELDS):
+        derived_write(using, index_booking, instance)
+
+
+def booking_deleted(sender, instance, using, **kwargs):
+    from bookings.sharding import derived_write
+
+    derived_write(using, unindex_booking, instance.pk)
+
+
+def rebuild_index(batch_size=2000):
+    """Recreate the whole index from the user and booking tables."""
+    from bookings.models import Booking
+    from bookings.sharding import fan_out
+    from .models import User
+
+    if not is_available():
+        return 0
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            # Picks up changed WEIGHTS
+            cursor.execute(RANK_SQL)
+        for queryset, to_row in (
+            (User.objects.only("first_name", "middle_name", "last_name", "email",
+                               "referral_code", "preferred_location"), _user_row),
+            *((bookings, _booking_row) for bookings in fan_out(
+                Booking.objects.only("pickup_location", "service_id", "service_type")
+            )),
+        ):
+            batch = []
+            for obj in queryset.iterator(chunk_size=batch_size):
+                batch.append(to_row(obj))
+                if len(batch) >= batch_size:
+                    _write(batch)
+                    total += len(batch)
+                    batch = []
+            _write(batch)
+            total += len(batch)
+        optimize()
+    return total
+
+
+def optimize():
+    """Merge the index segments left behind by bulk writes."""
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+def match_expression(query):
+    """Free text -> FTS5 query: every fragment of 3+ characters must match."""
+    terms = [term.replace('"', '""') for term in query.split() if len(term) >= MIN_TERM_LENGTH]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def search(query, limit=20):
+    """Ranked hits for `query`, best first."""
+    from bookings.models import Booking
+    from bookings.sharding import db_for_pk
+    from .models import User
+
+    expression = match_expression(query)
+    if not expression or not is_available():
+        return []
+
+    with connection.cursor() as cursor:
+        # rank is the weighted bm25, negative and lower for better matches
+        cursor.execute(
+            f"SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [expression, limit],
+        )
+        ranked = cursor.fetchall()
+
+    booking_ids = {}
+    for rowid, _ in ranked:
+        if rowid % 2 == 1:
+            booking_ids.setdefault(db_for_pk(rowid // 2), []).append(rowid // 2)
+    # Bookings may sit in per-resort databases, so their guests' emails are
+    # fetched with the users rather than joined
+    bookings = {
+        row["id"]: row
+        for alias, ids in booking_ids.items()
+        for row in Booking.objects.using(alias).filter(pk__in=ids).values(
+            "id", "service_type", "date", "pickup_location", "user_id",
+        )
+    }
+    user_ids = {rowid // 2 for rowid, _ in ranked if rowid % 2 == 0}
+    users = {
+        row["id"]: row for row in User.objects.filter(
+            pk__in=user_ids | {booking["user_id"] for booking in bookings.values()}
+        ).values("id", "first_name", "last_name", "email")
+    }
+
+    hits = []
+    for rowid, score in ranked:
+        # Rows whose source vanished behind the index's back are skipped
+        if rowid % 2 == 0 and rowid // 2 in users:
+            user = users[rowid // 2]
+            hits.append(SearchHit(
+                "user", user["id"], -score, _join(user["first_name"], user["last_name"]) or user["email"],
+                user["email"], user["id"],
+            ))
+        elif rowid % 2 == 1 and rowid // 2 in bookings:
+            booking = bookings[rowid // 2]
+            hits.append(SearchHit(
+                "booking", booking["id"], -score, f"{booking['service_type']} on {booking['date']}",
+                _join(users.get(booking["user_id"], {}).get("email"), booking["pickup_location"]), booking["user_id"],
+            ))
+    return hits
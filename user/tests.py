@@ -1,3 +1,482 @@
-from django.test import TestCase
+import json
+import sys
+from datetime import date, datetime, timedelta, time as clock
+from decimal import Decimal
+from ipaddress import IPv4Address
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from django.conf import settings
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from bookings import sharding, state
+from bookings.models import Booking, ComboWindow, Payment, TransactionLog
+from kuriftu_backend.profiling import StackSampler, _label
+from kuriftu_backend.renderers import ORJSONRenderer
+from kuriftu_backend.ratelimit import SlidingWindow, client_ip
+from . import analytics, deletion, lottery, resets, search
+from .models import (
+    AccountDeletion, EngagementLog, LotteryCampaign, LotteryPrize, Newsletter, PasswordResetCode, User,
+)
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_limit_holds_within_a_window(self):
+        window = SlidingWindow("test", "3/m")
+        results = [window.consume("guest", now=600 + second) for second in range(5)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False, False])
+        self.assertEqual(results[3][1], 57)
+
+    def test_previous_window_counts_while_it_overlaps(self):
+        window = SlidingWindow("test", "4/m")
+        for _ in range(4):
+            window.consume("guest", now=659)
+        # A quarter into the next minute, 3 of the 4 earlier requests still count
+        self.assertEqual(window.consume("guest", now=675), (True, 0))
+        self.assertEqual(window.consume("guest", now=675), (False, 15))
+        self.assertTrue(window.consume("other", now=675)[0])
+
+    def test_rejected_requests_do_not_use_the_allowance(self):
+        window = SlidingWindow("test", "2/m")
+        for _ in range(10):
+            window.consume("guest", now=1200)
+        self.assertEqual(window.consume("guest", now=1260 + 59)[0], True)
+
+    def test_client_ip(self):
+        request = RequestFactory().get("/", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(client_ip(request), "10.0.0.1")
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(client_ip(request), "1.2.3.4")
+        with override_settings(TRUSTED_PROXY_COUNT=3):
+            self.assertEqual(client_ip(request), "6.6.6.6")
+
+
+def _spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def _async_view():
+    _spin(0.2)
+
+
+class ProfilerTests(SimpleTestCase):
+    def profile(self, call):
+        sampler = StackSampler(sys._getframe(), threading.get_ident(), interval=0.001).start()
+        try:
+            call()
+        finally:
+            stacks = sampler.stop()
+        return stacks
+
+    def test_sync_requests_are_sampled_on_their_thread(self):
+        stacks = self.profile(lambda: _spin(0.1))
+        self.assertTrue(any(_label(_spin.__code__) in stack for stack in stacks))
+
+    def test_async_views_under_wsgi_are_followed_onto_the_loop_thread(self):
+        stacks = self.profile(async_to_sync(_async_view))
+        view = [stack for stack in stacks if _label(_async_view.__code__) in stack]
+        self.assertTrue(view)
+        # The loop thread's frames hang off the serving thread's async_to_sync call
+        self.assertTrue(all(stack.index("AsyncToSync.__call__") < stack.index("_async_view") for stack in view))
+
+
+class RendererTests(SimpleTestCase):
+    def render(self, data):
+        return json.loads(ORJSONRenderer().render(None, data, response_status=200))
+
+    def test_encodes_what_ninja_encodes(self):
+        data = {"price": Decimal("12.50"), "when": date(2030, 1, 2), "label": gettext_lazy("Spa"), "ip": IPv4Address("10.0.0.1")}
+        self.assertEqual(self.render(data), {"price": 12.5, "when": "2030-01-02", "label": "Spa", "ip": "10.0.0.1"})
+
+    def test_unsupported_types_are_an_error(self):
+        with self.assertRaises(TypeError):
+            self.render({"user": object()})
+
+
+class LoginTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("guest@example.com", "password-123")
+
+    def login(self, email, password):
+        return self.client.post(
+            "/api/user/login", {"email": email, "password": password}, content_type="application/json"
+        )
+
+    def test_login_goes_through_the_auth_backends(self):
+        response = self.login("guest@EXAMPLE.com", "password-123")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(self.client.session["_auth_user_id"]), self.user.pk)
+        self.assertEqual(self.client.session["_auth_user_backend"], "user.auth.EmailBackend")
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_failed_logins_send_user_login_failed(self):
+        failures = []
+        handler = lambda sender, credentials, **kwargs: failures.append(credentials["email"])
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+        self.assertEqual(self.login("guest@example.com", "wrong-password").status_code, 401)
+        self.assertEqual(self.login("nobody@example.com", "password-123").status_code, 401)
+        self.assertEqual(failures, ["guest@example.com", "nobody@example.com"])
+
+    def test_inactive_users_cannot_log_in(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login("guest@example.com", "password-123").status_code, 401)
+
+
+class RegistrationTests(TestCase):
+    databases = "__all__"
+
+    def register(self, email="new@example.com"):
+        data = {"email": email, "password": "password-123", "first_name": "Selam", "last_name": "Tesfaye"}
+        return self.client.post("/api/user/register", data, content_type="application/json")
+
+    def test_new_users_are_saved_and_indexed_once(self):
+        saves = []
+        handler = lambda sender, instance, created, update_fields, **kwargs: saves.append((created, update_fields))
+        post_save.connect(handler, sender=User)
+        self.addCleanup(post_save.disconnect, handler, sender=User)
+
+        self.assertEqual(self.register().status_code, 200)
+        user = User.objects.get(email="new@example.com")
+        # One full save; logging in then stamps last_login, which search ignores
+        self.assertEqual(saves, [(True, None), (False, {"last_login"})])
+        self.assertTrue(Newsletter.objects.get(user=user).is_subscribed)
+        self.assertEqual([hit.id for hit in search.search(user.referral_code)], [user.pk])
+
+    def test_taken_email_is_rejected(self):
+        User.objects.create_user("new@example.com", "password-123")
+        response = self.register("new@EXAMPLE.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "User with this email already exists.")
+
+    def test_other_integrity_errors_are_not_blamed_on_the_email(self):
+        error = IntegrityError("NOT NULL constraint failed: user_newsletter.user_id")
+        with mock.patch("user.registration.Newsletter.objects.create", side_effect=error):
+            with self.assertRaises(IntegrityError):
+                self.register()
+        self.assertFalse(User.objects.filter(email="new@example.com").exists())
+
+
+class ExportTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("export@example.com", "password-123", first_name="Abebe")
+
+    def lines(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_wsgi_requests_stream_from_a_sync_iterator(self):
+        self.client.force_login(self.user)
+        response = self.client.get("/api/user/export")
+        self.assertFalse(response.is_async)
+        self.assertEqual(self.lines(response)[0]["data"]["first_name"], "Abebe")
+
+    async def test_asgi_requests_stream_from_an_async_iterator(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get("/api/user/export")
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual(lines[0]["type"], "profile")
+
+
+class AdminSearchTests(TestCase):
+    databases = "__all__"
+
+    def search(self, term):
+        queryset, _ = admin.site._registry[User].get_search_results(RequestFactory().get("/"), User.objects.all(), term)
+        return sorted(queryset.values_list("email", flat=True))
+
+    def test_prefix_search_ignores_case(self):
+        smith = User.objects.create_user("Smith@Example.com", "password-123")
+        User.objects.create_user("jones@example.com", "password-123")
+        self.assertEqual(self.search("smith"), ["Smith@example.com"])
+        self.assertEqual(self.search("SMITH@EX"), ["Smith@example.com"])
+        self.assertEqual(self.search(smith.referral_code.lower()[:4]), ["Smith@example.com"])
+        self.assertEqual(self.search(str(smith.pk)), ["Smith@example.com"])
+        self.assertEqual(self.search("x"), [])
+
+
+class SearchTests(TestCase):
+    databases = "__all__"
+
+    def test_best_matches_win_however_many_rows_match(self):
+        # Hundreds of weak matches (location) inserted before the strong one (name)
+        User.objects.bulk_create(
+            User(email=f"guest{number}@example.com", preferred_location="Abebe street") for number in range(600)
+        )
+        User.objects.create_user("kebede@example.com", None, first_name="Abebe", last_name="Kebede")
+        search.rebuild_index()
+
+        hits = search.search("abebe", limit=3)
+        self.assertEqual(len(hits), 3)
+        self.assertEqual(hits[0].title, "Abebe Kebede")
+        self.assertGreater(hits[0].score, hits[1].score)
+
+    def test_index_follows_saves_and_deletes(self):
+        user = User.objects.create_user("almaz@example.com", None, first_name="Almaz")
+        self.assertEqual([hit.id for hit in search.search("alma")], [user.pk])
+        user.first_name = "Tigist"
+        user.save()
+        self.assertEqual(search.search("alma")[0].subtitle, "almaz@example.com")  # still found by email
+        self.assertEqual(search.search("tigi")[0].id, user.pk)
+        user.delete()
+        self.assertEqual(search.search("tigi"), [])
+
+
+class LotteryTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        # Campaign ids are reused once each test rolls back
+        lottery._tables.clear()
+        self.user = User.objects.create_user("player@example.com", "password-123")
+        User.objects.filter(pk=self.user.pk).update(points=100)
+        self.campaign = LotteryCampaign.objects.create(name="Summer", cost_points=10)
+
+    def points(self):
+        return User.objects.values_list("points", flat=True).get(pk=self.user.pk)
+
+    def play(self):
+        self.campaign.refresh_from_db()
+        return lottery.play(self.user, self.campaign)
+
+    def test_a_win_debits_the_cost_and_claims_the_prize(self):
+        prize = LotteryPrize.objects.create(campaign=self.campaign, name="Spa day", remaining=2, points_award=5)
+        self.assertEqual(self.play(), {"won": True, "prize": "Spa day", "points_awarded": 5})
+        self.assertEqual(self.points(), 95)
+        prize.refresh_from_db()
+        self.assertEqual(prize.remaining, 1)
+        log = EngagementLog.objects.get(user=self.user, action=EngagementLog.ACTION_LOTTERY)
+        self.assertEqual(log.metadata["prize_id"], prize.pk)
+
+    def test_sold_out_prizes_are_redrawn_not_missed(self):
+        LotteryPrize.objects.create(campaign=self.campaign, name="Suite", remaining=1)
+        LotteryPrize.objects.create(campaign=self.campaign, name="Coffee")
+        self.campaign.refresh_from_db()
+        lottery.get_prize_table(self.campaign)  # cached while the suite was still there
+        LotteryPrize.objects.filter(name="Suite").update(remaining=0)
+
+        results = [self.play() for _ in range(8)]
+        self.assertEqual({result["prize"] for result in results}, {"Coffee"})
+        self.assertEqual(LotteryPrize.objects.get(name="Suite").remaining, 0)
+
+    def test_not_enough_points(self):
+        User.objects.filter(pk=self.user.pk).update(points=5)
+        with self.assertRaises(lottery.LotteryError):
+            self.play()
+        self.assertEqual(self.points(), 5)
+        self.assertFalse(EngagementLog.objects.filter(user=self.user).exists())
+
+    def test_changing_the_miss_weight_rebuilds_the_table(self):
+        LotteryPrize.objects.create(campaign=self.campaign, name="Coffee")
+        self.campaign.refresh_from_db()
+        self.assertEqual(lottery.get_prize_table(self.campaign).size, 1)
+
+        stale = LotteryCampaign.objects.get(pk=self.campaign.pk)
+        self.campaign.miss_weight = 3
+        self.campaign.save()
+        self.campaign.refresh_from_db()
+        self.assertEqual(lottery.get_prize_table(self.campaign).size, 2)
+        version = self.campaign.prize_version
+
+        # Saving a copy read earlier neither rolls the version back nor bumps it for nothing
+        stale.name = "Winter"
+        stale.miss_weight = 3
+        stale.save()
+        stale.refresh_from_db()
+        self.assertEqual(stale.prize_version, version)
+
+
+class AccountDeletionTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = User.objects.create_user("leaving@example.com", "password-123")
+        self.friend = User.objects.create_user("friend@example.com", "password-123", referred_by=self.user)
+        Newsletter.objects.create(user=self.user)
+        booking = state.create_booking(
+            user=self.user, service_type="SPA", date=date(2030, 5, 1), time=clock(10), location="entoto",
+        )
+        Payment.objects.create(booking=booking, amount=Decimal("100"), payment_method="CHAPA", tx_ref="tx-leaving")
+        TransactionLog.objects.create(user=self.user, location="entoto", event="Payment Successful", amount=Decimal("100"))
+        ComboWindow.objects.get_or_create(user=self.user)  # written after the commit when entoto is sharded
+        self.job = deletion.schedule_account_deletion(self.user)
+
+    def remaining(self, model, **filters):
+        return sum(shard.count() for shard in sharding.fan_out(model.objects.filter(**filters)))
+
+    def assert_deleted(self):
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Newsletter.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(ComboWindow.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(self.remaining(Booking, user_id=self.user.pk), 0)
+        self.assertEqual(self.remaining(Payment, tx_ref="tx-leaving"), 0)
+        self.assertEqual(self.remaining(TransactionLog, user_id=self.user.pk), 0)
+        self.friend.refresh_from_db()
+        self.assertIsNone(self.friend.referred_by_id)
+
+    def test_cascade_removes_everything_hanging_off_the_user(self):
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        deletion.run_account_deletion(self.job.pk)
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, AccountDeletion.STATUS_DONE)
+        # user, newsletter, combo window, booking, payment and transaction log
+        self.assertEqual(self.job.rows_deleted, 6)
+        self.assert_deleted()
+        self.assertTrue(User.objects.filter(pk=self.friend.pk).exists())
+
+    def test_failed_jobs_can_run_again(self):
+        delete_rows = deletion._delete_rows
+
+        def crash_on_user(cursor, model, ids, job_id):
+            if model is User:
+                raise RuntimeError("disk I/O error")
+            return delete_rows(cursor, model, ids, job_id)
+
+        with mock.patch.object(deletion, "_delete_rows", crash_on_user):
+            deletion.run_account_deletion(self.job.pk)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.error), (AccountDeletion.STATUS_FAILED, "disk I/O error"))
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+
+        deletion.run_account_deletion(self.job.pk)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, AccountDeletion.STATUS_DONE)
+        self.assert_deleted()
+
+    def test_finished_jobs_are_not_claimed_again(self):
+        deletion.run_account_deletion(self.job.pk)
+        with mock.patch.object(deletion, "_purge_dependents") as purge:
+            deletion.run_account_deletion(self.job.pk)
+        purge.assert_not_called()
+
+    def test_sharded_tables_are_purged_in_every_resort_database(self):
+        with connection.cursor() as cursor:
+            aliases = [shard_cursor.db.alias for shard_cursor in deletion._cursors(cursor, User, Booking)]
+            self.assertEqual(aliases, sharding.shard_aliases())
+            self.assertEqual(list(deletion._cursors(cursor, User, Newsletter)), [cursor])
+            self.assertEqual(list(deletion._cursors(cursor, Booking, Payment)), [cursor])
+        if settings.RESORT_DATABASES:
+            self.assertNotEqual(sharding.db_for_location("entoto"), connection.alias)
+
+
+class PasswordResetTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("forgetful@example.com", "password-123", first_name="Dawit")
+
+    def confirm(self, code, password="brand-new-password"):
+        return self.client.post(
+            "/api/user/password-reset/confirm", {"code": code, "password": password}, content_type="application/json",
+        )
+
+    def test_signed_token_resets_once(self):
+        response = self.client.post(
+            "/api/user/password-reset/request", {"email": "forgetful@example.com"}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        code = resets.issue_code(self.user)
+        self.assertIn(code, mail.outbox[0].body)
+        self.assertFalse(PasswordResetCode.objects.exists())
+
+        self.assertEqual(self.confirm(code).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("brand-new-password"))
+        # The new password hash voids the token
+        self.assertEqual(self.confirm(code, "another-password").status_code, 400)
+
+    def test_tokens_expire(self):
+        code = resets.issue_code(self.user)
+        later = datetime.now() + resets.code_lifetime() + timedelta(minutes=1)
+        with mock.patch.object(default_token_generator, "_now", return_value=later):
+            self.assertEqual(self.confirm(code).status_code, 400)
+        self.assertEqual(self.confirm(code).status_code, 200)
+
+    def test_tampered_tokens_are_rejected(self):
+        _, _, token = resets.issue_code(self.user).partition(resets.SEPARATOR)
+        other_uid, _, _ = resets.issue_code(User.objects.create_user("other@example.com", None)).partition(resets.SEPARATOR)
+        self.assertEqual(self.confirm(f"{other_uid}{resets.SEPARATOR}{token}").status_code, 400)
+        self.assertEqual(self.confirm("not-base64.token").status_code, 400)
+
+    def test_legacy_codes_still_work_in_token_mode(self):
+        with override_settings(PASSWORD_RESET_MODE="code"):
+            code = resets.issue_code(self.user)
+        self.assertNotIn(resets.SEPARATOR, code)
+        self.assertEqual(self.confirm(code).status_code, 200)
+        self.assertFalse(PasswordResetCode.objects.exists())
+
+        with override_settings(PASSWORD_RESET_MODE="code"):
+            code = resets.issue_code(self.user)
+        PasswordResetCode.objects.update(created_at=timezone.now() - resets.LEGACY_CODE_TTL - timedelta(minutes=1))
+        response = self.confirm(code)
+        self.assertEqual((response.status_code, response.json()["detail"]), (400, "Reset code expired."))
+        self.assertFalse(PasswordResetCode.objects.exists())
+
+    def test_purge_removes_expired_codes(self):
+        PasswordResetCode.objects.create(user=self.user, code="EXPIRED1")
+        PasswordResetCode.objects.update(created_at=timezone.now() - resets.LEGACY_CODE_TTL - timedelta(minutes=1))
+        PasswordResetCode.objects.create(user=User.objects.create_user("fresh@example.com", None), code="FRESH123")
+
+        self.assertEqual(resets.purge_legacy_codes(batch_size=1), 1)
+        self.assertEqual(list(PasswordResetCode.objects.values_list("code", flat=True)), ["FRESH123"])
+        self.assertEqual(resets.purge_legacy_codes(everything=True), 1)
+
+
+class CohortReportTests(SimpleTestCase):
+    def days(self, *isodates):
+        return np.array(isodates, dtype="datetime64[D]").astype(np.int64)
+
+    def report(self):
+        # Users 1 and 2 joined in January 2030, user 3 in February; user 4 predates the window
+        signups = (np.array([1, 2, 3, 4]), analytics._months(self.days("2030-01-03", "2030-01-28", "2030-02-11", "2028-05-01")))
+        booking_users = np.array([1, 1, 1, 2, 3, 4, 99])
+        bookings = (
+            booking_users,
+            np.zeros(len(booking_users), np.int8),
+            self.days("2030-01-10", "2030-01-20", "2030-02-05", "2030-02-02", "2030-03-01", "2030-01-15", "2030-01-15"),
+        )
+        code = analytics.METRICS.index(EngagementLog.ACTION_LOTTERY)
+        engagement = (np.array([2]), np.array([code], np.int8), self.days("2030-03-09"))
+        return analytics.cohort_report(
+            date(2030, 3, 15), months=3, periods=3, signups=signups, engagement=engagement, bookings=bookings,
+        )
+
+    def test_retention_counts_each_user_once_per_period(self):
+        report = self.report()
+        self.assertEqual(report.cohorts, ["2030-01", "2030-02", "2030-03"])
+        self.assertEqual(report.sizes, [2, 1, 0])
+        booked = report.metrics[analytics.BOOKINGS]
+        self.assertEqual(booked.active, [[1, 2, 0], [0, 1, None], [0, None, None]])
+        self.assertEqual(booked.retention, [[0.5, 1.0, 0.0], [0.0, 1.0, None], [0.0, None, None]])
+        self.assertEqual(report.metrics[EngagementLog.ACTION_LOTTERY].active, [[0, 0, 1], [0, 0, None], [0, None, None]])
+        self.assertEqual(report.metrics[EngagementLog.ACTION_REFERRAL].active, [[0, 0, 0], [0, 0, None], [0, None, None]])
+
+    def test_repeat_booking_rate_ignores_users_outside_the_window(self):
+        self.assertEqual(self.report().repeat_booking_rate, [0.5, 0.0, 0.0])
@@ -1,166 +1,266 @@
 from ninja import Router
 from ninja.errors import HttpError
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import aauthenticate, alogin, alogout
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from django.http import HttpRequest
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 from datetime import datetime
 
 from .models import User, Newsletter, Tier, PasswordResetCode
 from .schemas import (
     UserRegisterSchema, UserLoginSchema, UserOutSchema,
     UserUpdateSchema, NewsletterToggleSchema,
-    NewsletterStatusSchema, TierOutSchema, PasswordResetConfirmSchema, PasswordResetRequestSchema
+    NewsletterStatusSchema, TierOutSchema, PasswordResetConfirmSchema, PasswordResetRequestSchema,
+    LotteryCampaignOutSchema, LotteryPlayOutSchema, SearchHitOutSchema, CohortReportOutSchema
 )
 
 from .utils import send_password_reset_email
-from django.utils import timezone
+from .export import aiter_user_export, iter_user_export
+from .auth import arequire_user, arequire_staff
+from .deletion import schedule_account_deletion
+from .hashing import amake_password
+from . import lottery, registration, resets, search
+from kuriftu_backend.ratelimit import rate_limit, body_email
+from kuriftu_backend.projection import schema_columns
+from kuriftu_backend.conditional import compute_etag, conditional
+from django.db import IntegrityError
+from django.db.models import F
+from ninja import Query
 
 User = get_user_model()
 
 router = Router(tags=["User account"])
 
+# Read endpoints fetch just these columns with .values() instead of full rows
+PROFILE_COLUMNS = schema_columns(UserOutSchema, exclude=("tier",))
+TIER_COLUMNS = schema_columns(TierOutSchema)
+CAMPAIGN_COLUMNS = schema_columns(LotteryCampaignOutSchema)
+
 
 
 @router.post("/register", response=UserOutSchema)
-def register_user(request: HttpRequest, data: UserRegisterSchema):
-    if User.objects.filter(email=data.email).exists():
-        raise HttpError(400, "User with this email already exists.")
-
-    referred_by = None
-    if data.referred_by_code:
-        referred_by = User.objects.filter(referral_code=data.referred_by_code).first()
-
-    user = User.objects.create_user(
-        email=data.email,
-        password=data.password,
-        first_name=data.first_name,
-        middle_name=data.middle_name,
-        last_name=data.last_name,
-        birthdate=data.birthdate,
-        referred_by=referred_by
-    )
-
-    # Create newsletter subscription
-    Newsletter.objects.create(
-        user=user,
-        is_subscribed=True,
-        subscribed_at=timezone.now()
-    )
-
-    login(request, user)
-    return {"message": "Registration successful."} 
+async def register_user(request: HttpRequest, data: UserRegisterSchema):
+    # Hashing runs in the password pool so the event loop stays free
+    password = await amake_password(data.password)
+    try:
+        # One hop off the event loop and one transaction for the rest
+        return await sync_to_async(registration.register)(
+            request,
+            data.email,
+            password,
+            data.referred_by_code,
+            first_name=data.first_name,
+            middle_name=data.middle_name or "",
+            last_name=data.last_name,
+            birthdate=data.birthdate,
+        )
+    except IntegrityError:
+        # Only the unique email is the guest's fault; anything else is ours
+        if await User.objects.filter(email=User.objects.normalize_email(data.email)).aexists():
+            raise HttpError(400, "User with this email already exists.")
+        raise
 
 
 @router.post("/login") #, response=UserOutSchema | add this if user info is wanted 
-def login_user(request: HttpRequest, data: UserLoginSchema):
-    user = authenticate(request, email=data.email, password=data.password)
-    if not user:
+@rate_limit("login-ip", "20/m")
+@rate_limit("login-email", "5/m", key=body_email)
+async def login_user(request: HttpRequest, data: UserLoginSchema):
+    user = await aauthenticate(request, email=data.email, password=data.password)
+    if user is None:
         raise HttpError(401, "Invalid credentials")
-    login(request, user)
+    await alogin(request, user)
     return {"message": "Login successful"}
 
 @router.post("/logout")
 async def logout_user(request: HttpRequest):
-    if not request.user.is_authenticated:
+    user = await request.auser()
+    if not user.is_authenticated:
         raise HttpError(401, "Not logged in.")
-    logout(request)
+    await alogout(request)
     return {"message": "Logged out successfully"}
 
 
 @router.post("/password-reset/request")
-def request_password_reset(request, data: PasswordResetRequestSchema):
-    user = User.objects.filter(email=data.email).first()
+@rate_limit("password-reset-ip", "10/h")
+@rate_limit("password-reset-email", "3/h", key=body_email)
+async def request_password_reset(request, data: PasswordResetRequestSchema):
+    user = await User.objects.filter(email=data.email).afirst()
     if not user:
         raise HttpError(404, "No user found with this email.")
 
-    send_password_reset_email(user, request)
+    await sync_to_async(send_password_reset_email, thread_sensitive=False)(user, request)
     return {"success": True, "message": "Reset instructions sent to your email."}
 
 
 @router.post("/password-reset/confirm")
-def confirm_password_reset(request, data: PasswordResetConfirmSchema):
-    reset = PasswordResetCode.objects.filter(code=data.code).first()
+@rate_limit("password-reset-confirm-ip", "10/m")
+async def confirm_password_reset(request, data: PasswordResetConfirmSchema):
+    if resets.is_token(data.code):
+        # Signed token: nothing stored to look up or delete; the new hash voids it
+        user = await resets.auser_for_token(data.code)
+        if user is None:
+            raise HttpError(400, "Invalid or expired reset code.")
+        user.password = await amake_password(data.password)
+        await user.asave(update_fields=["password"])
+        return {"success": True, "message": "Password has been reset successfully."}
+
+    reset = await PasswordResetCode.objects.select_related("user").filter(code=data.code).afirst()
 
     if not reset:
         raise HttpError(400, "Invalid reset code.")
 
     if reset.is_expired():
-        reset.delete()
+        await reset.adelete()
         raise HttpError(400, "Reset code expired.")
 
     user = reset.user
-    user.set_password(data.password)
-    user.save()
-    reset.delete()
+    user.password = await amake_password(data.password)
+    await user.asave(update_fields=["password"])
+    await reset.adelete()
 
     return {"success": True, "message": "Password has been reset successfully."}
 
 
+async def _profile(user):
+    # One narrow query with the tier name joined in, no model instances
+    row = await User.objects.filter(pk=user.pk).values(*PROFILE_COLUMNS, tier_name=F("tier__name")).aget()
+    row["tier"] = row.pop("tier_name")
+    return row
+
+
 @router.get("/profile", response=UserOutSchema)
-def get_profile(request: HttpRequest):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
-    return request.user
+async def get_profile(request: HttpRequest, response: HttpResponse):
+    user = await arequire_user(request)
+
+    # The session already loaded the user row; only the tier stamp is extra
+    tier_updated = None
+    if user.tier_id:
+        tier_updated = await Tier.objects.filter(pk=user.tier_id).values_list("updated_at", flat=True).afirst()
+    etag = compute_etag("profile", user.pk, user.updated_at, user.tier_id, tier_updated)
+    not_modified = conditional(request, response, etag, max(filter(None, [user.updated_at, tier_updated])))
+    if not_modified:
+        return not_modified
+
+    return await _profile(user)
 
 
 @router.put("/profile", response=UserOutSchema)
-def update_profile(request: HttpRequest, data: UserUpdateSchema):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
-    for field, value in data.dict(exclude_unset=True).items():
-        setattr(request.user, field, value)
-    request.user.save()
-    return request.user
-
-@router.delete("/profile/", response={200: dict, 401: dict})
-def delete_profile(request):
-    if not request.user.is_authenticated:
+async def update_profile(request: HttpRequest, data: UserUpdateSchema):
+    user = await arequire_user(request)
+    changes = data.dict(exclude_unset=True)
+    for field, value in changes.items():
+        setattr(user, field, value)
+    await user.asave(update_fields=[*changes, "updated_at"])
+    return await _profile(user)
+
+@router.get("/export")
+async def export_user_data(request: HttpRequest):
+    user = await arequire_user(request)
+    # An ASGI server consumes the async iterator chunk by chunk; under WSGI
+    # Django would first buffer it whole, so WSGI gets the sync iterator
+    lines = aiter_user_export(user) if isinstance(request, ASGIRequest) else iter_user_export(user)
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="kuriftu-export.ndjson"'
+    return response
+
+@router.delete("/profile/", response={202: dict, 401: dict})
+async def delete_profile(request):
+    user = await request.auser()
+    if not user.is_authenticated:
         return 401, {"error": "Authentication required"}
-    
-    request.user.delete()
-    return 200, {"message": "Your account has been deleted successfully."}
+
+    # Deactivate now, cascade in the background (see user/deletion.py)
+    job = await sync_to_async(schedule_account_deletion)(user)
+    await alogout(request)
+    return 202, {"message": "Your account has been scheduled for deletion.", "deletion_id": job.id}
 
 @router.get("/newsletter/status", response=NewsletterStatusSchema)
-def get_newsletter_status(request: HttpRequest):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
-    newsletter = Newsletter.objects.filter(user=request.user).first()
+async def get_newsletter_status(request: HttpRequest):
+    user = await arequire_user(request)
+    newsletter = await Newsletter.objects.filter(user=user).afirst()
     return {
-        "email": request.user.email,
+        "email": user.email,
         "is_subscribed": newsletter.is_subscribed if newsletter else False,
         "subscribed_at": newsletter.subscribed_at if newsletter else None,
     }
 
 @router.post("/newsletter/unsubscribe", response=NewsletterStatusSchema)
-def unsubscribe_newsletter(request: HttpRequest):
-    if not request.user.is_authenticated:
-        raise HttpError(401, "Authentication required")
+async def unsubscribe_newsletter(request: HttpRequest):
+    user = await arequire_user(request)
 
-    newsletter = Newsletter.objects.filter(user=request.user).first()
+    newsletter = await Newsletter.objects.filter(user=user).afirst()
     if not newsletter:
         return {
-            "email": request.user.email,
+            "email": user.email,
             "is_subscribed": False,
             "subscribed_at": None,
         }
 
     newsletter.is_subscribed = False
-    newsletter.save()
+    await newsletter.asave(update_fields=["is_subscribed"])
 
     return {
-        "email": request.user.email,
+        "email": user.email,
         "is_subscribed": False,
         "subscribed_at": newsletter.subscribed_at,
     }
 
 
 @router.get("/tier", response={200: TierOutSchema, 401: dict})
-def get_user_tier(request):
-    if not request.user.is_authenticated:
+async def get_user_tier(request, response: HttpResponse):
+    user = await request.auser()
+    if not user.is_authenticated:
         return 401, {"error": "Authentication required"}
     
-    if not request.user.tier:
+    if not user.tier_id:
         raise HttpError(404, "No tier assigned to this user.")
 
-    return request.user.tier
\ No newline at end of file
+    tier = Tier.objects.filter(pk=user.tier_id)
+    tier_updated = await tier.values_list("updated_at", flat=True).aget()
+    not_modified = conditional(request, response, compute_etag("tier", user.tier_id, tier_updated), tier_updated)
+    if not_modified:
+        return not_modified
+
+    return await tier.values(*TIER_COLUMNS).aget()
+
+
+@router.get("/lottery/campaigns", response=list[LotteryCampaignOutSchema])
+async def list_lottery_campaigns(request: HttpRequest):
+    return [row async for row in lottery.active_campaigns().values(*CAMPAIGN_COLUMNS)]
+
+
+@router.post("/lottery/{campaign_id}/play", response=LotteryPlayOutSchema)
+async def play_lottery(request: HttpRequest, campaign_id: int):
+    user = await arequire_user(request)
+
+    campaign = await lottery.aget_active_campaign(campaign_id)
+    if not campaign:
+        raise HttpError(404, "No active lottery campaign found.")
+
+    try:
+        # Debit, claim and log run in one transaction, which needs a sync context
+        return await sync_to_async(lottery.play)(user, campaign)
+    except lottery.LotteryError as e:
+        raise HttpError(400, str(e))
+
+
+@router.get("/staff/search", response=list[SearchHitOutSchema])
+async def staff_search(request: HttpRequest, q: str = Query(..., max_length=200), limit: int = Query(20, ge=1, le=100)):
+    await arequire_staff(request)
+    hits = await sync_to_async(search.search)(q, limit)
+    return [hit._asdict() for hit in hits]
+
+
+@router.get("/staff/cohorts", response=CohortReportOutSchema)
+async def staff_cohorts(
+    request: HttpRequest,
+    months: int = Query(12, ge=1, le=60, description="Signup cohorts, counting back from this month"),
+    periods: int = Query(12, ge=1, le=60, description="Months after signup to follow"),
+):
+    await arequire_staff(request)
+    # Deferred like the other heavy imports: only analytics workers load NumPy
+    from .analytics import cached_cohort_report
+
+    report = await sync_to_async(cached_cohort_report)(months, periods)
+    return {**report._asdict(), "metrics": {name: metric._asdict() for name, metric in report.metrics.items()}}